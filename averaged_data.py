@@ -1,134 +1,190 @@
+import numpy as np
 import pandas as pd
 from utils import Utils
+from binning import TimeBinner
+from instrumentation import metrics
+from output_writers import OutputWriter
+from schema import Schema
+from sensor_store import SensorStore
+from ingestion import SheetValidator
+
+# Source columns of the averaged BlueVis (D to K) and Solaris (N to AJ) columns
+BLUEVIS_SOURCES = dict(zip(['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K'], ['C', 'D', 'E', 'F', 'G', 'H', 'L', 'M']))
+SOLARIS_SOURCES = dict(zip(['N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD',
+                            'AE', 'AF', 'AG', 'AH', 'AI', 'AJ'],
+                           ['E', 'G', 'I', 'K', 'M', 'P', 'Q', 'T', 'U', 'R', 'S', 'V', 'W', 'X', 'Y', 'Z', 'AA',
+                            'AB', 'AC', 'AD', 'AE', 'AF', 'AG']))
 
 
 class AveragedData:
+    # Column A holds 1 or "" and is kept as objects. AM to AT are the sheet's lookups of columns F, I, J, L, M, N,
+    # P and F, which never match because the lookup columns are still empty when they are evaluated: they are 0
+    # on every row.
+    SCHEMA = Schema({
+        'A': 'object',
+        'B': 'datetime64[ns]',
+        'C': 'datetime64[ns]',
+        **{letter: 'float64' for letter in BLUEVIS_SOURCES},
+        'L': 'int64',
+        'M': 'int64',
+        **{letter: 'float64' for letter in SOLARIS_SOURCES},
+        'AK': 'int64',
+        'AL': 'int64',
+    }, constants={letter: 0 for letter in ['AM', 'AN', 'AO', 'AP', 'AQ', 'AR', 'AS', 'AT']})
+    # (timestamp columns, numeric columns) read from the BlueVis and Solaris data: the sample timestamps (and the
+    # BlueVis column B the minute axis is taken from) and the channels that are averaged
+    BLUEVIS_COLUMNS = (['A', 'B'], list(BLUEVIS_SOURCES.values()))
+    SOLARIS_COLUMNS = (['A'], list(SOLARIS_SOURCES.values()))
+    # Minutes averaged per block when the samples are read from sensor stores and no chunk size is given
+    STORE_CHUNK_MINUTES = 1440
+
     def __init__(self, df, bluevis_df, solaris_df):
-        # Initialize the AveragedData class with raw data, BlueVis processed data, and Solaris processed data
+        # Initialize the AveragedData class with raw data, BlueVis processed data, and Solaris processed data. The
+        # BlueVis and Solaris data are processed sheets or SensorStores of them.
         self.raw_df = df
         self.bluevis_df = bluevis_df
         self.solaris_df = solaris_df
         self.processed_df = None
+        # Sample timestamps (column A) of the BlueVis and Solaris data, set by process()
+        self.bluevis_times = None
+        self.solaris_times = None
 
-    def process(self):
+    def process(self, output_path=None, chunk_minutes=None):
+        timer = metrics.blocks('AveragedData')
         # Extract header rows and set columns for the dataframe
-        header_rows = self.raw_df.iloc[:2].fillna('')
-        avg_df_columns = pd.MultiIndex.from_arrays(header_rows.values)
-        self.raw_df.columns = Utils.excel_column_names(len(avg_df_columns))
-        avg_df = self.raw_df.iloc[2:].reset_index(drop=True)
-
-        # Create and process 'avg_df_processed' DataFrame
-        self.processed_df = pd.DataFrame(columns=Utils.excel_column_names(len(avg_df_columns)))
-
+        avg_df = self.template()
+
+        # Convert column 'A' in Solaris data to handle NaT values (into a new Series: the sheet is not modified)
+        self.bluevis_times, self.solaris_times = self.sample_times(self.bluevis_df), self.sample_times(self.solaris_df)
+        if not isinstance(self.solaris_df, SensorStore):
+            self.solaris_times = self.sanitize_solaris_times(self.solaris_times)
+        timer.split('prepare', len(self.solaris_df))
+
+        # Compute every minute of the run, at once or in blocks of chunk_minutes. Sensor stores are always read
+        # in blocks, so that only the samples of one block are paged in and copied at a time.
+        datetime_series = self.minute_axis()
+        if chunk_minutes is None and isinstance(self.bluevis_df, SensorStore):
+            chunk_minutes = self.STORE_CHUNK_MINUTES
+        if chunk_minutes:
+            self.processed_df = Utils.assemble(
+                (self.compute_rows(avg_df, datetime_series, start_row,
+                                   min(start_row + chunk_minutes, len(datetime_series)))
+                 for start_row in range(0, len(datetime_series), chunk_minutes)), len(datetime_series))
+        else:
+            self.processed_df = self.compute_rows(avg_df, datetime_series, 0)
+
+        # Save the averaged data (an intermediate output, only written when output_path is given)
+        if output_path:
+            self.export(self.processed_df, output_path)
+
+        return self.processed_df
+
+    def template(self):
+        # Return the 'AveragedData' sheet without its two header rows, with Excel-style column names
+        self.raw_df.columns = Utils.excel_column_names(len(self.raw_df.columns))
+        return self.raw_df.iloc[2:].reset_index(drop=True)
+
+    @staticmethod
+    def sanitize_solaris_times(times):
+        # Solaris timestamps: blanks, stray numbers and text become NaT (a no-op on validated data)
+        return SheetValidator.to_times(times)[0]
+
+    @staticmethod
+    def sample_times(samples, column='A'):
+        # A timestamp column of a processed sheet (Series) or of a SensorStore (datetime64 array)
+        return samples.times(column) if isinstance(samples, SensorStore) else samples[column]
+
+    @staticmethod
+    def positions(times, values, side='left'):
+        # Positions of the timestamps `values` among the sample timestamps, by one binary search per value like
+        # the row-wise sheet formulas, so that NaT or unsorted sample timestamps give the same rows
+        return TimeBinner.search(times, values, side=side)
+
+    @staticmethod
+    def sample_window(samples, columns, first, last):
+        # Rows first..last (inclusive) of sample columns: a frame, or views of the SensorStore files
+        if isinstance(samples, SensorStore):
+            return samples.columns(columns, first, last)
+        return samples.iloc[first:last + 1][columns]
+
+    def minute_axis(self):
         # Determine the start and end datetime from BlueVis data
-        start_datetime = self.bluevis_df.iloc[0, 1]
-        end_datetime = self.bluevis_df.iloc[-1, 1]
+        if isinstance(self.bluevis_df, SensorStore):
+            start_datetime, end_datetime = self.bluevis_df.time(0, 'B'), self.bluevis_df.time(-1, 'B')
+        else:
+            start_datetime = self.bluevis_df.iloc[0, 1]
+            end_datetime = self.bluevis_df.iloc[-1, 1]
 
         # Create a datetime series with 1-minute intervals
-        datetime_series = pd.date_range(start=start_datetime,
-                                        periods=int((end_datetime - start_datetime).total_seconds() / 60) + 1,
-                                        freq='60S')
+        return pd.date_range(start=start_datetime,
+                             periods=int((end_datetime - start_datetime).total_seconds() / 60) + 1,
+                             freq='60S')
+
+    def compute_rows(self, avg_df, datetime_series, start_row, end_row=None):
+        # Compute the averaged rows for minutes start_row up to end_row (default: the end) of `datetime_series`.
+        # Other rows are not needed: only the raw samples that fall inside the L..M (BlueVis) and AK..AL (Solaris)
+        # row windows of these minutes are read, so recomputing the trailing minutes of a run costs only those
+        # minutes. Uses the sample timestamps set by process().
+        end_row = len(datetime_series) if end_row is None else end_row
+        timer = metrics.blocks('AveragedData')
+        processed_df = self.SCHEMA.empty(Utils.excel_column_names(len(self.raw_df.columns)), end_row - start_row)
 
         # Set datetime columns in the processed DataFrame
-        self.processed_df['C'] = datetime_series
-        self.processed_df['B'] = self.processed_df['C'] + pd.to_timedelta(4, unit='h')
+        processed_df['C'] = datetime_series[start_row:end_row]
+        processed_df['B'] = processed_df['C'] + pd.to_timedelta(4, unit='h')
 
         # Calculate columns 'L' and 'M' based on BlueVis data
-        self.processed_df['L'] = self.processed_df.apply(lambda row: self.bluevis_df['A'].searchsorted(row['B']) + 8,
-                                                         axis=1)
-        self.processed_df['M'] = self.processed_df['L'] + 1000
+        processed_df['L'] = self.positions(self.bluevis_times, processed_df['B']) + 8
+        processed_df['M'] = processed_df['L'] + 1000
 
         # Set column 'A' based on conditions from BlueVis data
-        self.processed_df['A'] = self.processed_df['C'].apply(
-            lambda x: 1 if (self.bluevis_df['A'].searchsorted(x, side='right') - 1) else "" if pd.notna(x) else "")
-
-        # Calculate columns 'D' to 'K' based on a range in BlueVis data and averaging
-        for col, col_name in zip(['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K'], ['C', 'D', 'E', 'F', 'G', 'H', 'L', 'M']):
-            self.processed_df[col] = self.processed_df.apply(
-                lambda row: self.bluevis_df.loc[
-                            round(row['L']):round(row['M']),
-                            col_name
-                            ][(self.bluevis_df.loc[round(row['L']):round(row['M']), 'A'] >= avg_df.iloc[row.name, 1]) &
-                              (self.bluevis_df.loc[round(row['L']):round(row['M']), 'A'] < avg_df.iloc[
-                                  min(row.name + 1, len(avg_df) - 1), 1])]
-                .mean() if not self.bluevis_df.loc[round(row['L']):round(row['M']), col_name].empty else float('nan'),
-                axis=1
-            )
-
-        # Convert column 'A' in Solaris data to handle NaT values
-        self.solaris_df['A'] = self.solaris_df['A'].apply(
-            lambda x: pd.NaT if pd.isnull(x) or isinstance(x, (float, int)) else x)
+        flag = np.full(len(processed_df), "", dtype=object)
+        flag[self.positions(self.bluevis_times, processed_df['C'], side='right') - 1 != 0] = 1
+        processed_df['A'] = flag
+        timer.split('bluevis_positions', len(processed_df))
+
+        # Calculate columns 'D' to 'K' by averaging BlueVis samples between consecutive 'AveragedData' timestamps
+        # (column B), restricted to the BlueVis rows L..M. All eight columns share a single bin assignment.
+        rows = np.arange(start_row, end_row)
+        first, last = processed_df['L'].min(), processed_df['M'].max()
+        bluevis_binner = TimeBinner(self.bluevis_times[first:last + 1],
+                                    avg_df.iloc[rows, 1],
+                                    avg_df.iloc[np.minimum(rows + 1, len(avg_df) - 1), 1],
+                                    window_starts=processed_df['L'] - first,
+                                    window_ends=processed_df['M'] - first)
+        processed_df[list(BLUEVIS_SOURCES)] = bluevis_binner.means(
+            self.sample_window(self.bluevis_df, list(BLUEVIS_SOURCES.values()), first, last))
+        timer.split('bluevis_means', int(last + 1 - first))
 
         # Calculate columns 'AK' and 'AL' based on Solaris data
-        self.processed_df['AK'] = self.processed_df.apply(
-            lambda row: self.solaris_df['A'].searchsorted(row['C'], side='right'), axis=1)
-        self.processed_df['AL'] = self.processed_df['AK'] + 1000
-
-        # Calculate columns 'N' to 'AJ' based on Solaris data and averaging
-        for col, col_name in zip(
-                ['N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE', 'AF',
-                 'AG', 'AH', 'AI', 'AJ'],
-                ['E', 'G', 'I', 'K', 'M', 'P', 'Q', 'T', 'U', 'R', 'S', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD',
-                 'AE', 'AF', 'AG']):
-            self.processed_df[col] = self.processed_df.apply(
-                lambda row: self.solaris_df.loc[
-                            round(row['AK']):round(row['AL']),
-                            col_name
-                            ][(self.solaris_df.loc[round(row['AK']):round(row['AL']), 'A'] >= self.processed_df.iloc[
-                    row.name, 2]) &
-                              (self.solaris_df.loc[round(row['AK']):round(row['AL']), 'A'] < self.processed_df.iloc[
-                                  min(row.name + 1, len(self.processed_df) - 1), 2])]
-                .mean() if pd.notna(row['AK']) and pd.notna(row['AL']) else float('nan'),
-                axis=1
-            )
-
-        # Adding additional columns to the processed DataFrame
-        self.processed_df['AM'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 5]
-            if x in self.processed_df['AM'].values else 0 if pd.notna(x) else ""
-        )
-
-        self.processed_df['AN'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 8]
-            if x in self.processed_df['AN'].values else 0 if pd.notna(x) else ""
-        )
-
-        self.processed_df['AO'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 9]
-            if x in self.processed_df['AO'].values else 0 if pd.notna(x) else ""
-        )
-
-        self.processed_df['AP'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 11]
-            if x in self.processed_df['AP'].values else 0 if pd.notna(x) else ""
-        )
-
-        self.processed_df['AQ'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 12]
-            if x in self.processed_df['AQ'].values else 0 if pd.notna(x) else ""
-        )
-
-        self.processed_df['AR'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 13]
-            if x in self.processed_df['AR'].values else 0 if pd.notna(x) else ""
-        )
-
-        self.processed_df['AS'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 15]
-            if x in self.processed_df['AS'].values else 0 if pd.notna(x) else ""
-        )
-
-        self.processed_df['AT'] = self.processed_df['A'].apply(
-            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 5]
-            if x in self.processed_df['AT'].values else 0 if pd.notna(x) else ""
-        )
-
-        # Copy the processed DataFrame and set appropriate column names
-        avg_df_processed = self.processed_df.copy()
-        avg_df = self.processed_df.copy()
-        avg_df.columns = avg_df_columns
-
-        # Save the averaged data to a CSV file
-        avg_df.to_csv('averaged_data.csv', index=False)
-
-        return avg_df_processed
+        processed_df['AK'] = self.positions(self.solaris_times, processed_df['C'], side='right')
+        processed_df['AL'] = processed_df['AK'] + 1000
+        timer.split('solaris_positions', len(processed_df))
+
+        # Calculate columns 'N' to 'AJ' by averaging Solaris samples between consecutive minutes of column 'C',
+        # restricted to the Solaris rows AK..AL. The bin edges are computed once and shared by all 23 columns.
+        first, last = processed_df['AK'].min(), processed_df['AL'].max()
+        solaris_binner = TimeBinner(self.solaris_times[first:last + 1],
+                                    datetime_series[rows],
+                                    datetime_series[np.minimum(rows + 1, len(datetime_series) - 1)],
+                                    window_starts=processed_df['AK'] - first,
+                                    window_ends=processed_df['AL'] - first)
+        processed_df[list(SOLARIS_SOURCES)] = solaris_binner.means(
+            self.sample_window(self.solaris_df, list(SOLARIS_SOURCES.values()), first, last))
+        timer.split('solaris_means', int(last + 1 - first))
+
+        # Give the columns their declared dtypes and write the constant columns AM to AT
+        self.SCHEMA.conform(processed_df)
+        timer.split('derived_columns', len(processed_df))
+
+        # Label the rows with their position in the full minute axis
+        processed_df.index = pd.RangeIndex(start_row, end_row)
+        return processed_df
+
+    def headers(self):
+        # The original two header rows of the 'AveragedData' sheet
+        return self.raw_df.iloc[:2].fillna('').values
+
+    def export(self, avg_df_processed, output_path='averaged_data.csv'):
+        # Write processed averaged data under the original headers, in the format given by the file extension
+        OutputWriter.write_file(avg_df_processed, self.headers(), output_path)
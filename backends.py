@@ -0,0 +1,118 @@
+import importlib.util
+import logging
+import numpy as np
+import pandas as pd
+from kernels import Kernels
+
+
+class PandasBackend:
+    # Reference implementation on plain pandas objects, written like the spreadsheet formulas: one Series.mean
+    # per bin, shifted Series for the lag differences. Slow, but the easiest to check against the workbook. The
+    # means are taken over object Series, like the sheet columns, which are summed in sample order.
+    @staticmethod
+    def bin_means(sample_bins, values, n_bins):
+        result = np.full((n_bins, values.shape[1]), np.nan)
+        if len(sample_bins) == 0:
+            return result
+        order = np.argsort(sample_bins, kind='stable')
+        bins, starts = np.unique(sample_bins[order], return_index=True)
+        for i in range(values.shape[1]):
+            slices = np.split(values[order, i], starts[1:])
+            result[bins, i] = [pd.Series(samples, dtype=object).mean() for samples in slices]
+        return result
+
+    @staticmethod
+    def lead_difference(current, ahead, lag):
+        current = pd.Series(current, dtype=float)
+        difference = current - pd.Series(ahead, dtype=float).shift(-lag)
+        return difference.where(current.index < len(current) - lag, current).to_numpy()
+
+    @staticmethod
+    def log_threshold(bg, bh):
+        bound = -1.69 * np.log(pd.Series(bg, dtype=float)) + 8.17
+        bh = pd.Series(bh, dtype=float)
+        return bh.where(bound < bh, bound).to_numpy()
+
+
+class NumpyBackend:
+    # Vectorized NumPy kernels (the default)
+    @staticmethod
+    def bin_means(sample_bins, values, n_bins):
+        # np.bincount accumulates sequentially in sample order, matching the per-slice pandas mean
+        result = np.full((n_bins, values.shape[1]), np.nan)
+        for i in range(values.shape[1]):
+            column = values[:, i]
+            valid = ~np.isnan(column)
+            sums = np.bincount(sample_bins[valid], weights=column[valid], minlength=n_bins)
+            counts = np.bincount(sample_bins[valid], minlength=n_bins)
+            np.divide(sums, counts, out=result[:, i], where=counts > 0)
+        return result
+
+    @staticmethod
+    def lead_difference(current, ahead, lag):
+        return Kernels.lead_difference(current, ahead, lag)
+
+    @staticmethod
+    def log_threshold(bg, bh):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bound = -1.69 * np.log(np.asarray(bg, dtype=float)) + 8.17
+        bh = np.asarray(bh, dtype=float)
+        return np.where(bound < bh, bh, bound)
+
+
+class NumbaBackend:
+    # The loops compiled with Numba (on first use, then cached on disk), imported from numba_kernels when first run
+    @staticmethod
+    def bin_means(sample_bins, values, n_bins):
+        from numba_kernels import bin_means
+        return bin_means(np.ascontiguousarray(sample_bins, dtype=np.int64),
+                                np.ascontiguousarray(values, dtype=float), n_bins)
+
+    @staticmethod
+    def lead_difference(current, ahead, lag):
+        if lag < 0:
+            raise ValueError(f"lag must be non-negative, got {lag}")
+        from numba_kernels import lead_difference
+        return lead_difference(np.asarray(current, dtype=float), np.asarray(ahead, dtype=float), lag)
+
+    @staticmethod
+    def log_threshold(bg, bh):
+        from numba_kernels import log_threshold
+        return log_threshold(np.asarray(bg, dtype=float), np.asarray(bh, dtype=float))
+
+
+class ComputeBackend:
+    # Kernels used by the pipeline stages: window means per bin (AveragedData), lag differences (AE to AG) and
+    # the log threshold of column BI (RunData)
+    BACKENDS = {'pandas': PandasBackend, 'numpy': NumpyBackend, 'numba': NumbaBackend}
+
+    def __init__(self):
+        self.use('numpy')
+
+    def use(self, name):
+        # Select the kernels by name. 'numba' falls back to 'numpy' when Numba is not installed.
+        if name not in self.BACKENDS:
+            raise ValueError(f"Unknown compute backend {name!r}; choose from {', '.join(self.BACKENDS)}")
+        if name == 'numba' and importlib.util.find_spec('numba') is None:
+            logging.warning("Numba is not installed; using the numpy backend instead.")
+            name = 'numpy'
+        self.name = name
+        self.kernels = self.BACKENDS[name]
+        return name
+
+    def bin_means(self, sample_bins, values, n_bins):
+        # Mean of every column of `values` (2-D, one row per sample) over the samples of each bin, skipping NaN;
+        # bins without a valid sample are NaN
+        return self.kernels.bin_means(sample_bins, values, n_bins)
+
+    def lead_difference(self, current, ahead, lag):
+        # current[i] - ahead[i + lag]; the last `lag` rows keep current[i]
+        return self.kernels.lead_difference(current, ahead, lag)
+
+    def log_threshold(self, bg, bh):
+        # The larger of bh and -1.69 ln(bg) + 8.17 (the latter when bh is missing)
+        return self.kernels.log_threshold(bg, bh)
+
+
+# Backend shared by the pipeline modules
+backend = ComputeBackend()
@@ -0,0 +1,162 @@
+import time
+# Start of the imports, whose duration is reported in the batch log
+IMPORT_START = time.perf_counter()
+import argparse
+import logging
+import os
+import sys
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from main import run_pipeline
+from output_writers import OutputWriter
+from backends import ComputeBackend
+from parity import ParityChecker
+from summary_calculator import SummaryCalculator
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+warnings.filterwarnings("ignore")
+
+
+def parse_args(argv=None):
+    # Command-line interface: a manifest of runs, plus the options shared by every run
+    parser = argparse.ArgumentParser(description="Process many fermentation gas analysis workbooks in parallel.")
+    parser.add_argument('manifest',
+                        help="CSV file with columns input_file, start_time and optionally name and end_time")
+    parser.add_argument('--output-root', default='batch_output',
+                        help="Directory holding one output directory per run (default: batch_output)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Number of worker processes (default: number of CPU cores)")
+    parser.add_argument('--cache-dir', default='.circe_cache',
+                        help="Directory for cached parsed sheets and stage outputs, shared by all runs")
+    parser.add_argument('--no-cache', action='store_true', help="Run every stage without using the cache")
+    parser.add_argument('--cache-size-mb', type=float, default=1024,
+                        help="Size cap of the stage cache (default: 1024)")
+    parser.add_argument('--output-format', choices=list(OutputWriter.FORMATS), default='csv',
+                        help="Format of the processed data files of every run (default: csv)")
+    parser.add_argument('--summary-only', action='store_true',
+                        help="Only write the summary of every run, computing just the columns it needs")
+    parser.add_argument('--intermediate', action='store_true',
+                        help="Also write the intermediate averaged data of every run")
+    parser.add_argument('--backend', choices=list(ComputeBackend.BACKENDS), default='numpy',
+                        help="Compute kernels used by every run: pandas, numpy or numba (default: numpy)")
+    parser.add_argument('--engine', choices=ParityChecker.ENGINES, default='fast',
+                        help="Stages used by every run: fast, or the original row-wise legacy ones (default: fast)")
+    parser.add_argument('--memory-map', action='store_true',
+                        help="Average memory-mapped sensor stores of the raw sheets, built once under the cache dir")
+    parser.add_argument('--chunk-minutes', type=int, default=None,
+                        help="Compute the averaged and run data of every run in blocks of this many minutes")
+    parser.add_argument('--phases', default=None, help="JSON file with the phase windows to summarize for every run")
+    parser.add_argument('--peak-windows', type=float, nargs='+', default=None, metavar='HOURS',
+                        help="Also report the best sustained windows of these lengths (in hours) for every run")
+    parser.add_argument('--top-k', type=int, default=3, help="Number of peak windows reported per length (default: 3)")
+    parser.add_argument('--peak-statistic', choices=['mean', 'min'], default='mean',
+                        help="Rank peak windows by their mean rate or by the minimum rate sustained (default: mean)")
+    parser.add_argument('--no-plot', action='store_true',
+                        help="Write no plot for any run, so the plotting libraries are never imported")
+    parser.add_argument('--plot-html', action='store_true', help="Also write each plot as a self-contained HTML page")
+    parser.add_argument('--max-plot-points', type=int, default=5000,
+                        help="Downsample each plotted series to at most this many points; 0 plots every point")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Write per-stage timing and memory metrics to metrics.json in every run directory")
+    return parser.parse_args(argv)
+
+
+def read_manifest(manifest_path, output_root):
+    # One job per manifest row. Each run writes into output_root/<name>, where the name defaults to the
+    # workbook file name; repeated names get a numeric suffix so that no two runs share a directory. A blank or
+    # missing end_time lets the run data follow the averaged data to its end.
+    manifest = pd.read_csv(manifest_path, dtype=str, skipinitialspace=True)
+    missing = {'input_file', 'start_time'} - set(manifest.columns)
+    if missing:
+        raise ValueError(f"Manifest {manifest_path} is missing column(s): {sorted(missing)}")
+
+    jobs = []
+    seen = {}
+    for row in manifest.itertuples(index=False):
+        name = getattr(row, 'name', None)
+        if pd.isna(name) or not name:
+            name = os.path.splitext(os.path.basename(row.input_file))[0]
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}_{seen[name]}"
+        end_time = getattr(row, 'end_time', None)
+        jobs.append({'name': name, 'input_file': row.input_file, 'start_time': row.start_time,
+                     'end_time': None if pd.isna(end_time) else end_time,
+                     'output_dir': os.path.join(output_root, name)})
+    return jobs
+
+
+def run_job(job, cache_dir, use_cache, cache_size_mb, pipeline_options):
+    # Run one workbook in a worker process. Any error is caught and reported, so it never reaches the pool
+    # and the other runs carry on.
+    os.makedirs(job['output_dir'], exist_ok=True)
+    # Workers are reused across runs, so the log handler is replaced for every run
+    logging.basicConfig(filename=os.path.join(job['output_dir'], 'data_processing.log'), level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s', filemode='w', force=True)
+    result = dict(job, status='ok', error='')
+    start = time.perf_counter()
+    try:
+        # The runs already occupy the worker processes, so each run parses its sheets in its own process
+        run_pipeline(job['input_file'], job['start_time'], output_dir=job['output_dir'], cache_dir=cache_dir,
+                     use_cache=use_cache, cache_size_mb=cache_size_mb, show_plot=False, end_time=job['end_time'],
+                     workers=1, **pipeline_options)
+    except Exception as e:
+        logging.error(f"An error occurred: {e}\n{traceback.format_exc()}")
+        result.update(status='failed', error=f"{type(e).__name__}: {e}")
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(jobs, workers, cache_dir='.circe_cache', use_cache=True, cache_size_mb=1024, pipeline_options=None):
+    # Run all jobs in a process pool and return one result per job, in manifest order. pipeline_options are
+    # keyword arguments of run_pipeline shared by every run (phases, peak windows, plot and metrics options).
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job, cache_dir, use_cache, cache_size_mb, pipeline_options or {}): i
+                   for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. out of memory); only this run is marked as failed
+                results[i] = dict(jobs[i], status='failed', error=f"{type(e).__name__}: {e}", seconds=float('nan'))
+            logging.info(f"{results[i]['name']}: {results[i]['status']} in {results[i]['seconds']} s.")
+    return [results[i] for i in range(len(jobs))]
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.makedirs(args.output_root, exist_ok=True)
+    # The batch log only records the progress of each run; every run also has its own log in its directory
+    logging.basicConfig(filename=os.path.join(args.output_root, 'batch.log'), level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s', filemode='w')
+    logging.info(f"Imported the pipeline modules in {IMPORT_SECONDS:.3f} s.")
+    jobs = read_manifest(args.manifest, args.output_root)
+    pipeline_options = {'phases': SummaryCalculator.load_phases(args.phases) if args.phases else None,
+                        'peak_lengths': args.peak_windows, 'top_k': args.top_k, 'peak_statistic': args.peak_statistic,
+                        'plot_html': args.plot_html, 'max_plot_points': args.max_plot_points,
+                        'collect_metrics': args.metrics, 'output_format': args.output_format,
+                        'write_intermediate': args.intermediate, 'chunk_minutes': args.chunk_minutes,
+                        'compute_backend': args.backend, 'summary_only': args.summary_only,
+                        'engine': args.engine, 'memory_map': args.memory_map, 'plot': not args.no_plot}
+    logging.info(f"Starting {len(jobs)} run(s) on {args.workers} worker(s).")
+
+    batch_start = time.perf_counter()
+    report = pd.DataFrame(run_batch(jobs, args.workers, args.cache_dir, not args.no_cache, args.cache_size_mb,
+                                    pipeline_options),
+                          columns=['name', 'input_file', 'start_time', 'end_time', 'output_dir', 'status', 'seconds',
+                                   'error'])
+    elapsed = time.perf_counter() - batch_start
+
+    # Aggregated status and timing report
+    report.to_csv(os.path.join(args.output_root, 'batch_report.csv'), index=False)
+    failed = (report['status'] != 'ok').sum()
+    summary = (f"{len(report) - failed} of {len(report)} run(s) succeeded in {elapsed:.1f} s "
+               f"(sum of run times {report['seconds'].sum():.1f} s).")
+    logging.info(summary)
+    print(report[['name', 'status', 'seconds', 'error']].to_string(index=False))
+    print(summary)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,87 @@
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+import warnings
+import pandas as pd
+from bluevis_data import BlueVisData
+from solaris_data import SolarisData
+from averaged_data import AveragedData
+from run_data import RunData
+from summary_calculator import SummaryCalculator
+from visualizer import DataVisualizer
+from synthetic_workbook import SyntheticWorkbook
+
+warnings.filterwarnings("ignore")
+
+
+def parse_args(argv=None):
+    # Command-line interface for the stage benchmarks
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic workbooks of several sizes.")
+    parser.add_argument('--minutes', type=int, nargs='+', default=[120, 360, 1440],
+                        help="Run lengths to benchmark, in minutes (default: 120 360 1440)")
+    parser.add_argument('--bluevis-seconds', type=float, default=1, help="BlueVis sample interval (default: 1)")
+    parser.add_argument('--solaris-seconds', type=float, default=10, help="Solaris sample interval (default: 10)")
+    parser.add_argument('--repeats', type=int, default=3, help="Timed repetitions per scale (default: 3)")
+    parser.add_argument('--results', default='benchmark_results.csv',
+                        help="CSV file the timings are appended to (default: benchmark_results.csv)")
+    return parser.parse_args(argv)
+
+
+def code_revision():
+    # Git commit of the code being benchmarked, so that results from different revisions can be compared
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def timed(timings, stage, function):
+    # Run one stage and record its wall time
+    start = time.perf_counter()
+    result = function()
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def run_stages(sheets, start_time, plot_path):
+    # Time every stage once on fresh copies of the sheets (the stages rename the columns of their input)
+    sheets = {name: df.copy() for name, df in sheets.items()}
+    timings = {}
+    bluevis = timed(timings, 'BlueVisData', lambda: BlueVisData(sheets['BlueVis Raw Data']).process())
+    solaris = timed(timings, 'SolarisData', lambda: SolarisData(sheets['Solaris Data']).process())
+    averaged = timed(timings, 'AveragedData',
+                     lambda: AveragedData(sheets['AveragedData'], bluevis, solaris).process(output_path=None))
+    run = timed(timings, 'RunData', lambda: RunData(sheets['Run Data'], averaged, sheets['Calibration Data'],
+                                                    start_time).process(output_path=None))
+    timed(timings, 'SummaryCalculator', lambda: SummaryCalculator.calculate_summary(run, output_path=None))
+    timed(timings, 'DataVisualizer', lambda: DataVisualizer(run).plot_interactive_scatter(plot_path, show=False))
+    return timings, {'bluevis_rows': len(bluevis), 'solaris_rows': len(solaris), 'run_rows': len(run)}
+
+
+def benchmark(minutes_list, bluevis_seconds=1, solaris_seconds=10, repeats=3):
+    # One result row per scale, stage and repetition. The run data spans the whole generated run.
+    rows = []
+    revision = code_revision()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for minutes in minutes_list:
+            workbook = SyntheticWorkbook(minutes, bluevis_seconds, solaris_seconds)
+            sheets = workbook.sheets()
+            for repeat in range(repeats):
+                timings, sizes = run_stages(sheets, workbook.run_start_time(), os.path.join(temp_dir, 'plot.png'))
+                for stage, seconds in timings.items():
+                    rows.append({'timestamp': pd.Timestamp.now().isoformat(timespec='seconds'), 'revision': revision,
+                                 'minutes': minutes, **sizes, 'stage': stage, 'repeat': repeat, 'seconds': seconds})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = benchmark(args.minutes, args.bluevis_seconds, args.solaris_seconds, args.repeats)
+    # Append to the results file so that timings of successive revisions can be compared
+    results.to_csv(args.results, mode='a', header=not os.path.exists(args.results), index=False)
+    print(results.pivot_table(index='stage', columns='minutes', values='seconds', aggfunc='median', sort=False)
+          .to_string(float_format='{:.3f}'.format))
+    print(f"Median seconds per stage; all timings appended to {args.results}")
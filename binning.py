@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from backends import backend
+
+# Integer representation of NaT once timestamps are viewed as int64 nanoseconds
+NAT = np.iinfo(np.int64).min
+
+
+class TimeBinner:
+    def __init__(self, sample_times, bin_starts, bin_ends, window_starts=None, window_ends=None):
+        # Assign every raw sample to the output row (bin) it is averaged into, in one vectorized pass.
+        # A sample belongs to bin r when bin_starts[r] <= time < bin_ends[r] and, if positional windows
+        # are given, window_starts[r] <= sample position <= window_ends[r] (the inclusive .loc[L:M] slice
+        # used by the spreadsheet formulas). Bins are expected to be consecutive and non-overlapping.
+        times = self.to_ns(sample_times)
+        starts = self.to_ns(bin_starts)
+        ends = self.to_ns(bin_ends)
+        self.n_bins = len(starts)
+
+        # Only bins with both edges defined can hold samples; comparisons against NaT are always False
+        candidates = np.flatnonzero((starts != NAT) & (ends != NAT))
+        position = np.searchsorted(starts[candidates], times, side='right') - 1
+        in_range = (position >= 0) & (times != NAT)
+
+        bins = np.full(len(times), -1, dtype=np.int64)
+        bins[in_range] = candidates[position[in_range]]
+        in_range &= times < ends[np.maximum(bins, 0)]
+
+        if window_starts is not None:
+            sample_positions = np.arange(len(times))
+            lower = np.asarray(window_starts, dtype=np.int64)[np.maximum(bins, 0)]
+            upper = np.asarray(window_ends, dtype=np.int64)[np.maximum(bins, 0)]
+            in_range &= (sample_positions >= lower) & (sample_positions <= upper)
+
+        # Keep only the samples that contribute to a bin, in their original order
+        self.sample_index = np.flatnonzero(in_range)
+        self.sample_bins = bins[self.sample_index]
+
+    @staticmethod
+    def to_ns(values):
+        # Convert timestamps (Series, Index, list or array) to int64 nanoseconds with NaT as NAT. datetime64[ns]
+        # arrays and Series (e.g. SensorStore columns, validated sheets) are viewed as they are, without a copy.
+        if isinstance(values, pd.Series) and values.dtype == np.dtype('datetime64[ns]'):
+            values = values.to_numpy()
+        if isinstance(values, np.ndarray) and values.dtype == np.dtype('datetime64[ns]'):
+            return values.view(np.int64)
+        return pd.to_datetime(pd.Series(values), errors='coerce').to_numpy('datetime64[ns]').view(np.int64)
+
+    @classmethod
+    def search(cls, sample_times, keys, side='left'):
+        # Position of every key among the sample timestamps, each found by a binary search of its own that probes
+        # the same rows as a search for that key alone (NaT compares greater than every timestamp, as in numpy).
+        # On sorted timestamps this equals np.searchsorted; when a column has NaT or out-of-order timestamps in
+        # the middle, a batched np.searchsorted narrows each search with the previous key's result, so a key's
+        # position would depend on the other keys. Takes about log2(len(sample_times)) passes over the keys.
+        times = cls.to_ns(sample_times)
+        keys = cls.to_ns(keys)
+        low = np.zeros(len(keys), dtype=np.int64)
+        high = np.full(len(keys), len(times), dtype=np.int64)
+        active = low < high
+        while active.any():
+            middle = low + ((high - low) >> 1)
+            probe = times[np.minimum(middle, len(times) - 1)]
+            probe = np.where(probe == NAT, np.iinfo(np.int64).max, probe)
+            after = probe < keys if side == 'left' else probe <= keys
+            low = np.where(active & after, middle + 1, low)
+            high = np.where(active & ~after, middle, high)
+            active = low < high
+        return low
+
+    def means(self, values):
+        # Average each column of `values` (DataFrame, 2-D array or list of column arrays, one row per raw sample)
+        # per bin. NaN samples are skipped and bins without any valid sample yield NaN, like Series.mean. The sums
+        # are computed by the selected compute backend.
+        if isinstance(values, list):
+            # Only the samples that fall into a bin are read from each column (e.g. memory-mapped arrays)
+            return backend.bin_means(self.sample_bins, np.column_stack(
+                [np.asarray(column, dtype=float)[self.sample_index] for column in values]), self.n_bins)
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, None]
+        return backend.bin_means(self.sample_bins, values[self.sample_index], self.n_bins)
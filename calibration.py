@@ -0,0 +1,90 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from utils import Utils
+
+
+class CalibrationTable:
+    # Compiled tables shared by every run that uses the same 'Calibration Data' sheet, keyed by content hash
+    _cache = {}
+
+    def __init__(self, calibration_df):
+        # Parse the 'Calibration Data' sheet once into plain float arrays. The sheet itself is not modified.
+        sheet = calibration_df.copy()
+        sheet.columns = Utils.excel_column_names(len(sheet.columns))
+        # Rows 1 to 4 hold the offsets block (indexed by column B); the data part starts after 9 header rows
+        sep_df = sheet.iloc[1:5, 1:13].set_index('B')
+        main_df = sheet.iloc[9:].reset_index(drop=True)
+
+        # Column M: ordered (lower, upper, offset) branches of the nested spreadsheet IF.
+        # Cells that do not exist in the sheet are stored as None and raise when a row needs them.
+        self.m_branches = [
+            (-np.inf, self._cell(main_df['I'], 5), self._cell(sep_df['L'], 2)),
+            (self._cell(sep_df['I'], 5), self._cell(main_df['I'], 4), self._cell(sep_df['L'], 5)),
+            (self._cell(sep_df['I'], 4), self._cell(main_df['I'], 3), self._cell(sep_df['L'], 4)),
+            (-np.inf, np.inf, self._cell(sep_df['L'], 3)),
+        ]
+
+        # Columns N and L use the first offsets row whose threshold exceeds the value. The running maximum of
+        # the thresholds is sorted, so that first match becomes a single searchsorted over the breakpoints.
+        self.n_breakpoints, self.n_offsets = self._first_match_table(sep_df['J'], sep_df['M'])
+        self.l_breakpoints, self.l_offsets = self._first_match_table(sep_df['H'], sep_df['K'])
+
+    @classmethod
+    def from_sheet(cls, calibration_df):
+        # Return the compiled table for this sheet, reusing it if an identical sheet was compiled before
+        key = cls.sheet_hash(calibration_df)
+        if key not in cls._cache:
+            cls._cache[key] = cls(calibration_df)
+        return cls._cache[key]
+
+    @staticmethod
+    def sheet_hash(calibration_df):
+        # Hash the cell contents (not the column labels, which are overwritten when the sheet is parsed)
+        cell_hashes = pd.util.hash_pandas_object(calibration_df, index=False).values
+        return hashlib.sha256(cell_hashes.tobytes()).hexdigest()
+
+    @staticmethod
+    def _cell(series, position):
+        # Value of the cell at `position` as a float, or None when the sheet has no such row
+        return float(series.iloc[position]) if position < len(series) else None
+
+    @staticmethod
+    def _first_match_table(thresholds, offsets):
+        thresholds = pd.to_numeric(thresholds, errors='coerce').to_numpy(dtype=float)
+        # NaN thresholds never match, so they must not raise the running maximum either
+        breakpoints = np.maximum.accumulate(np.where(np.isnan(thresholds), -np.inf, thresholds))
+        return breakpoints, pd.to_numeric(offsets, errors='coerce').to_numpy(dtype=float)
+
+    @staticmethod
+    def _first_match(breakpoints, offsets, values):
+        # Offset of the first row whose threshold is greater than each value
+        positions = np.searchsorted(breakpoints, values, side='right')
+        if (positions >= len(breakpoints)).any():
+            raise IndexError("No calibration threshold is greater than the value being calibrated")
+        return offsets[positions]
+
+    def m_offset(self, values):
+        # Offset subtracted from J / 100 for column M, evaluated branch by branch like the nested IF
+        values = np.asarray(values, dtype=float)
+        result = np.full(len(values), np.nan)
+        pending = ~np.isnan(values)
+        for lower, upper, offset in self.m_branches:
+            if not pending.any():
+                break
+            if lower is None or upper is None:
+                raise IndexError("Calibration Data sheet is missing a threshold needed for column M")
+            hit = pending & (lower <= values) & (values < upper)
+            if hit.any() and offset is None:
+                raise IndexError("Calibration Data sheet is missing an offset needed for column M")
+            result[hit] = offset
+            pending &= ~hit
+        return result
+
+    def n_offset(self, values):
+        # Offset subtracted for column N, from the first row whose J threshold exceeds H / 100
+        return self._first_match(self.n_breakpoints, self.n_offsets, values)
+
+    def l_offset(self, values):
+        # Offset subtracted for column L, from the first row whose H threshold exceeds K / 100
+        return self._first_match(self.l_breakpoints, self.l_offsets, values)
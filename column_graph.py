@@ -0,0 +1,50 @@
+from collections import namedtuple
+
+# A step of the graph: the function computing `outputs` (frame columns or shared intermediates) from `inputs`,
+# and the named block it is timed under
+ColumnNode = namedtuple('ColumnNode', ['outputs', 'inputs', 'block', 'function'])
+
+
+class ColumnGraph:
+    def __init__(self, base):
+        # Derived columns of a frame as a dependency graph. `base` are the columns filled in before evaluation.
+        # Nodes must be declared after the nodes of their inputs, so the declaration order is an evaluation order.
+        self.base = set(base)
+        self.nodes = []
+
+    def outputs(self):
+        return {output for node in self.nodes for output in node.outputs}
+
+    def node(self, outputs, inputs, block):
+        # Decorator declaring function(owner, df, shared) as the node computing `outputs`. The function writes
+        # frame columns into df and intermediates shared by several nodes into the `shared` dict.
+        def register(function):
+            unknown = set(inputs) - self.base - self.outputs()
+            if unknown:
+                raise ValueError(f"{function.__name__} uses {sorted(unknown)} before they are declared")
+            self.nodes.append(ColumnNode(list(outputs), list(inputs), block, function))
+            return function
+        return register
+
+    def plan(self, requested=None):
+        # The nodes needed for the requested outputs (every node when None), in evaluation order. Names that are
+        # not computed by the graph (base or constant columns) are ignored.
+        if requested is None:
+            return list(self.nodes)
+        needed = set(requested)
+        plan = []
+        for node in reversed(self.nodes):
+            if needed.intersection(node.outputs):
+                plan.append(node)
+                needed.update(node.inputs)
+        return plan[::-1]
+
+    def evaluate(self, owner, df, requested=None, timer=None):
+        # Run the nodes needed for `requested` once each, timing every block of consecutive nodes
+        shared = {}
+        plan = self.plan(requested)
+        for position, node in enumerate(plan):
+            node.function(owner, df, shared)
+            if timer is not None and (position + 1 == len(plan) or plan[position + 1].block != node.block):
+                timer.split(node.block, len(df))
+        return plan
@@ -0,0 +1,121 @@
+import argparse
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from dash import Dash, Input, Output, State, dcc, html, no_update
+from output_writers import OutputWriter
+from run_data import RunData
+from visualizer import DataVisualizer
+
+
+class RunDashboard:
+    # Elapsed hours stored by a client that has not received any point yet (elapsed hours are never negative)
+    NO_POINTS = -1.0
+
+    def __init__(self, output_dir='.', poll_seconds=5, max_points=5000):
+        # Serve the processed run data (in any output format) and summary found in output_dir, as written by
+        # main.py or incremental.py. The files are re-read only when they change, once for all connected clients.
+        self.output_dir = output_dir
+        self.summary_path = os.path.join(output_dir, 'summary.json')
+        self.poll_seconds = poll_seconds
+        self.max_points = max_points
+        self.run_df = None
+        self.points = {}
+        self.summary = {}
+        self.versions = {'run': None, 'summary': None}
+
+    @staticmethod
+    def modified(path):
+        return os.path.getmtime(path) if os.path.exists(path) else None
+
+    def refresh(self):
+        # Reload the run data and the summary if they were rewritten since the last poll
+        run_path = OutputWriter.find(self.output_dir, 'run_data')
+        run_version = (run_path, self.modified(run_path)) if run_path else None
+        if run_version is not None and run_version != self.versions['run']:
+            self.run_df = RunData.read_export(run_path)
+            self.points = DataVisualizer(self.run_df).rate_points()
+            self.versions['run'] = run_version
+            logging.info(f"Dashboard: loaded {len(self.run_df)} run rows.")
+        summary_version = self.modified(self.summary_path)
+        if summary_version is not None and summary_version != self.versions['summary']:
+            with open(self.summary_path) as f:
+                self.summary = json.load(f)
+            self.versions['summary'] = summary_version
+
+    def last_hours(self):
+        # Latest elapsed time plotted for any gas
+        return max((float(x[-1]) for x, _ in self.points.values() if len(x)), default=self.NO_POINTS)
+
+    def new_points(self, after):
+        # extendData payload with the points of every trace later than `after` hours (every point when `after` is
+        # None), or None if there are none. Points already sent are never re-sent.
+        after = self.NO_POINTS if after is None else after
+        xs, ys = [], []
+        for x, y in self.points.values():
+            start = np.searchsorted(x, after, side='right')
+            xs.append(x[start:].tolist())
+            ys.append(y[start:].tolist())
+        if not any(xs):
+            return None
+        return {'x': xs, 'y': ys}, list(range(len(xs)))
+
+    def layout(self):
+        # Called on every page load, so a new client starts from the current data and only receives updates after it
+        self.refresh()
+        # Before any run data exists the figure still holds the three (empty) rate traces that updates extend
+        run_df = self.run_df if self.run_df is not None else pd.DataFrame(columns=DataVisualizer.REQUIRED_COLUMNS)
+        figure = DataVisualizer(run_df).figure(self.max_points)
+        return html.Div([
+            html.H3("CIRCE run dashboard"),
+            dcc.Graph(id='rates', figure=figure),
+            dcc.Store(id='last-hours', data=self.last_hours()),
+            dcc.Store(id='summary-version', data=self.versions['summary']),
+            dcc.Interval(id='poll', interval=int(self.poll_seconds * 1000)),
+            html.Pre(id='summary', children=json.dumps(self.summary, indent=2)),
+        ])
+
+    def app(self):
+        # Dash app serving its scripts locally, so the dashboard works without internet access
+        app = Dash(__name__, serve_locally=True, title="CIRCE run dashboard")
+        app.layout = self.layout
+
+        @app.callback(Output('rates', 'extendData'), Output('last-hours', 'data'),
+                      Input('poll', 'n_intervals'), State('last-hours', 'data'))
+        def extend_rates(_, last_hours):
+            self.refresh()
+            update = self.new_points(last_hours)
+            if update is None:
+                return no_update, no_update
+            return update, self.last_hours()
+
+        @app.callback(Output('summary', 'children'), Output('summary-version', 'data'),
+                      Input('poll', 'n_intervals'), State('summary-version', 'data'))
+        def update_summary(_, version):
+            if version == self.versions['summary']:
+                return no_update, no_update
+            return json.dumps(self.summary, indent=2), self.versions['summary']
+
+        return app
+
+
+def parse_args(argv=None):
+    # Command-line interface for the local dashboard
+    parser = argparse.ArgumentParser(description="Serve a live dashboard of processed run data on localhost.")
+    parser.add_argument('--output-dir', default='.', help="Directory with the run data and summary.json")
+    parser.add_argument('--port', type=int, default=8050, help="Port on 127.0.0.1 (default: 8050)")
+    parser.add_argument('--interval', type=float, default=5, help="Seconds between polls for new data (default: 5)")
+    parser.add_argument('--max-points', type=int, default=5000,
+                        help="Points per series in the initial figure; 0 sends every point (default: 5000)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # Set up logging to log to a file
+    logging.basicConfig(filename='dashboard.log', level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    RunDashboard(args.output_dir, args.interval, args.max_points).app().run(host='127.0.0.1', port=args.port,
+                                                                            debug=False)
@@ -0,0 +1,239 @@
+import argparse
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from averaged_data import AveragedData
+from bluevis_data import BlueVisData
+from backends import backend, ComputeBackend
+from calibration import CalibrationTable
+from ingestion import SheetValidator
+from output_writers import OutputWriter
+from run_data import RunData
+from solaris_data import SolarisData
+from summary_calculator import SummaryCalculator
+from utils import Utils
+from workbook_loader import WorkbookLoader
+
+
+class AppendBuffer:
+    def __init__(self):
+        # Growable DataFrame for raw sensor rows and processed frames: rows live in a preallocated frame whose
+        # capacity doubles when full, so appending k rows costs O(k) amortized instead of copying the whole history
+        self.frame = None
+        self.length = 0
+
+    @property
+    def view(self):
+        # The rows appended so far
+        return self.frame.iloc[:self.length]
+
+    def fits(self, rows):
+        # Whether rows can be written into the free capacity as they are (same columns and dtypes)
+        return (self.length + len(rows) <= len(self.frame) and list(rows.columns) == list(self.frame.columns)
+                and (rows.dtypes == self.frame.dtypes).all())
+
+    def truncate(self, length):
+        # Drop the rows from `length` on; their capacity is reused by the next append
+        self.length = min(self.length, length)
+
+    def append(self, rows):
+        if self.frame is None or not self.fits(rows):
+            combined = rows.reset_index(drop=True) if self.frame is None else pd.concat([self.view, rows],
+                                                                                         ignore_index=True)
+            # The free capacity is filled with a copy of the rows, so that every column keeps its dtype
+            self.frame = pd.concat([combined, combined], ignore_index=True)
+        else:
+            for position, col in enumerate(rows.columns):
+                self.frame.iloc[self.length:self.length + len(rows), position] = rows[col].values
+        self.length += len(rows)
+
+
+class IncrementalRun:
+    def __init__(self, averaged_sheet, run_sheet, calibration_sheet, start_time, lag_minutes=10, end_time=None):
+        # Keep the processed frames of a live run together with the state needed to extend them:
+        # the raw samples, the averaging bin edges, and the running integrals of BD to BF
+        self.averaged_data = AveragedData(averaged_sheet, None, None)
+        self.avg_template = self.averaged_data.template()
+        # Bin end edges of the BlueVis averaging ('AveragedData' column B); blank cells sort last
+        edges = pd.to_datetime(self.avg_template.iloc[:, 1], errors='coerce')
+        self.avg_edges = edges.to_numpy('datetime64[ns]').view(np.int64)
+        self.avg_edges = np.where(edges.isna(), np.iinfo(np.int64).max, self.avg_edges)
+
+        self.run_data = RunData(run_sheet, None, CalibrationTable.from_sheet(calibration_sheet), start_time,
+                                lag_minutes, end_time)
+        self.run_data.raw_df.columns = Utils.excel_column_names(len(self.run_data.raw_df.columns))
+        # The run time axis follows the averaged data, so it grows with every update
+        self.time_range = None
+
+        self.bluevis = AppendBuffer()
+        self.solaris = AppendBuffer()
+        # Whether the sample timestamps are still sorted (see SheetValidator.is_sorted), kept up to date on append
+        self.sorted = {'bluevis': True, 'solaris': True}
+        self.averaged = AppendBuffer()
+        self.run = AppendBuffer()
+        self.avg_df_processed = None
+        self.run_df_processed = None
+        # Running integrals of BD to BF over the whole run (sums of their trapezoid steps)
+        self.integrals = pd.Series(0.0, index=['BD', 'BE', 'BF'])
+
+    @staticmethod
+    def stays_sorted(times, new_times):
+        # Whether sorted timestamps stay sorted once new_times are appended: only the new timestamps and the last
+        # previous one are read
+        if not SheetValidator.is_sorted(new_times):
+            return False
+        if new_times.isna().all() or not len(times):
+            return True
+        last = pd.to_datetime(times.iloc[-1:], errors='coerce').iloc[0]
+        return pd.notna(last) and last <= new_times.iloc[0]
+
+    def first_affected_minute(self, bluevis_times, solaris_times):
+        # First averaged row whose inputs can change now that samples with these timestamps have been appended.
+        # Bins only hold samples from their own time range, so earlier minutes keep their values. The last minute
+        # is always recomputed because its bin end edge moves once the minute axis grows.
+        avg = self.avg_df_processed
+        candidates = [len(avg) - 1]
+        bluevis_times, solaris_times = bluevis_times.dropna(), solaris_times.dropna()
+        if len(bluevis_times):
+            first_time = bluevis_times.min()
+            candidates += [np.searchsorted(self.avg_edges, first_time.value, side='right') - 1,
+                           avg['B'].searchsorted(first_time, side='right'),
+                           avg['C'].searchsorted(first_time, side='left')]
+        if len(solaris_times):
+            first_time = solaris_times.min()
+            candidates += [avg['C'].searchsorted(first_time, side='right') - 1,
+                           avg['C'].searchsorted(first_time, side='left')]
+
+        # On sorted sample timestamps the row positions (A, L, AK) of the minutes before these candidates cannot
+        # change. Once a column holds NaT or out-of-order timestamps in the middle, the binary search of every
+        # minute probes rows that depend on the column length, so all positions over that column are searched again.
+        moved = np.zeros(len(avg), dtype=bool)
+        if not self.sorted['bluevis']:
+            flags = AveragedData.positions(self.averaged_data.bluevis_times, avg['C'], side='right') - 1 != 0
+            moved |= flags != (avg['A'] == 1).to_numpy()
+            moved |= AveragedData.positions(self.averaged_data.bluevis_times, avg['B']) + 8 != avg['L'].to_numpy()
+        if not self.sorted['solaris']:
+            moved |= (AveragedData.positions(self.averaged_data.solaris_times, avg['C'], side='right')
+                      != avg['AK'].to_numpy())
+        if moved.any():
+            candidates.append(np.argmax(moved))
+        return max(0, min(candidates))
+
+    def append(self, bluevis_rows, solaris_rows):
+        # Append new BlueVis and Solaris rows (as returned by BlueVisData/SolarisData.process) and recompute
+        # only the trailing minutes they affect. Returns the updated averaged and run frames; the run frame is None
+        # while the averaged data has not reached the run start time yet.
+        solaris_rows = solaris_rows.copy()
+        solaris_rows['A'] = AveragedData.sanitize_solaris_times(solaris_rows['A'])
+        bluevis_times = pd.to_datetime(bluevis_rows['A'], errors='coerce')
+        self.sorted['bluevis'] = self.sorted['bluevis'] and self.stays_sorted(self.bluevis_times(), bluevis_times)
+        self.sorted['solaris'] = self.sorted['solaris'] and self.stays_sorted(self.solaris_times(), solaris_rows['A'])
+        self.bluevis.append(bluevis_rows)
+        self.solaris.append(solaris_rows)
+        self.averaged_data.bluevis_df = self.bluevis.view
+        self.averaged_data.solaris_df = self.solaris.view
+        self.averaged_data.bluevis_times = self.bluevis.view['A']
+        self.averaged_data.solaris_times = self.solaris.view['A']
+        avg_start = 0 if self.avg_df_processed is None else self.first_affected_minute(bluevis_times,
+                                                                                       solaris_rows['A'])
+
+        # Recompute the affected minutes of AveragedData
+        avg_rows = self.averaged_data.compute_rows(self.avg_template, self.averaged_data.minute_axis(), avg_start)
+        self.averaged.truncate(avg_start)
+        self.averaged.append(avg_rows)
+        self.avg_df_processed = self.averaged.view
+        logging.info(f"Incremental update: {len(avg_rows)} averaged minute(s) recomputed.")
+
+        # Recompute the run rows that read those minutes, plus the lag_minutes rows before them whose
+        # AE to AG look ahead into them
+        self.run_data.avg_df_processed = self.avg_df_processed
+        if self.avg_df_processed['C'].iloc[-1] < pd.Timestamp(self.run_data.start_time):
+            return self.avg_df_processed, None
+        self.time_range = self.run_data.time_axis()
+        if self.run_df_processed is None:
+            run_start = 0
+        else:
+            first_changed = self.time_range.searchsorted(avg_rows['C'].iloc[0])
+            run_start = max(0, min(first_changed, len(self.time_range)) - self.run_data.lag_minutes)
+            self.integrals -= self.run_df_processed[['BD', 'BE', 'BF']].iloc[run_start:].sum()
+        run_rows = self.run_data.compute_rows(self.time_range, run_start)
+        self.run.truncate(run_start)
+        self.run.append(run_rows)
+        self.run_df_processed = self.run.view
+        self.integrals += run_rows[['BD', 'BE', 'BF']].sum()
+        logging.info(f"Incremental update: {len(run_rows)} run row(s) recomputed.")
+
+        return self.avg_df_processed, self.run_df_processed
+
+    def bluevis_times(self):
+        # Timestamps of the BlueVis samples appended so far
+        return self.bluevis.view['A'] if self.bluevis.frame is not None else pd.Series(dtype='datetime64[ns]')
+
+    def solaris_times(self):
+        # Timestamps of the Solaris samples appended so far
+        return self.solaris.view['A'] if self.solaris.frame is not None else pd.Series(dtype='datetime64[ns]')
+
+
+def parse_args(argv=None):
+    # Command-line interface for monitoring a workbook that is being appended to during a run
+    parser = argparse.ArgumentParser(description="Incrementally process a live fermentation workbook.")
+    parser.add_argument('input_file', help="Excel workbook that is updated while the run is in progress")
+    parser.add_argument('start_time', help="Start time of the run, e.g. '2023-10-25 13:47:38'")
+    parser.add_argument('--end-time', default=None,
+                        help="Last minute of the run data (default: the end of the averaged data so far)")
+    parser.add_argument('--backend', choices=list(ComputeBackend.BACKENDS), default='numpy',
+                        help="Compute kernels: pandas, numpy or numba (default: numpy)")
+    parser.add_argument('--interval', type=float, default=60, help="Seconds between checks (default: 60)")
+    parser.add_argument('--updates', type=int, default=None, help="Stop after this many updates")
+    parser.add_argument('--phases', default=None, help="JSON file with the phase windows to summarize")
+    parser.add_argument('--output-dir', default='.',
+                        help="Directory for the processed data files and summary.json (default: current directory)")
+    parser.add_argument('--output-format', choices=list(OutputWriter.FORMATS), default='csv',
+                        help="Format of the processed data files (default: csv)")
+    parser.add_argument('--intermediate', action='store_true',
+                        help="Also write the intermediate averaged data")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    # Set up logging to log to a file
+    logging.basicConfig(filename='data_processing.log', level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s', filemode='w')
+    args = parse_args()
+    phases = SummaryCalculator.load_phases(args.phases) if args.phases else None
+    backend.use(args.backend)
+    os.makedirs(args.output_dir, exist_ok=True)
+    live_run = None
+    updates = 0
+    last_modified = None
+    while args.updates is None or updates < args.updates:
+        # Reprocess only when the workbook has been saved since the previous update
+        modified = os.path.getmtime(args.input_file)
+        if modified != last_modified:
+            last_modified = modified
+            df = WorkbookLoader(args.input_file).load()
+            bluevis_processed = SheetValidator.validate(BlueVisData(df['BlueVis Raw Data']).process(),
+                                                        'BlueVis Raw Data', *AveragedData.BLUEVIS_COLUMNS)
+            solaris_processed = SheetValidator.validate(SolarisData(df['Solaris Data']).process(),
+                                                        'Solaris Data', *AveragedData.SOLARIS_COLUMNS)
+            if live_run is None:
+                live_run = IncrementalRun(df['AveragedData'], df['Run Data'], df['Calibration Data'],
+                                          args.start_time, end_time=args.end_time)
+            # Only the rows added since the previous update are appended
+            avg_df_processed, run_df_processed = live_run.append(bluevis_processed.iloc[live_run.bluevis.length:],
+                                                                 solaris_processed.iloc[live_run.solaris.length:])
+            # The files are written in the background while the summary is calculated
+            writer = OutputWriter(args.output_format)
+            if args.intermediate:
+                writer.write(avg_df_processed, live_run.averaged_data.headers(), args.output_dir, 'averaged_data')
+            if run_df_processed is not None:
+                writer.write(run_df_processed, live_run.run_data.headers(), args.output_dir, 'run_data')
+                SummaryCalculator.calculate_summary(run_df_processed, os.path.join(args.output_dir, 'summary.json'),
+                                                    phases=phases)
+            writer.wait()
+            updates += 1
+            logging.info(f"Update {updates} written.")
+        if args.updates is None or updates < args.updates:
+            time.sleep(args.interval)
@@ -0,0 +1,72 @@
+import datetime
+import logging
+import numpy as np
+import pandas as pd
+
+
+class SheetValidator:
+    # Raw sheets are parsed into object columns mixing timestamps, numbers, blanks and header text. validate()
+    # coerces the columns the pipeline reads to datetime64[ns] or float64 once, right after the sheet is loaded,
+    # so the stages downstream work on typed columns and need no per-cell type checks.
+    @staticmethod
+    def blanks(column):
+        # Missing cells and empty strings
+        blank = column.isna()
+        if column.dtype == object:
+            blank |= column.eq("")
+        return blank
+
+    @classmethod
+    def to_times(cls, column):
+        # Timestamps as datetime64[ns], and the number of non-blank cells rejected. Only cells holding a
+        # timestamp are kept: numbers and text become NaT, like the blanks.
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return column.astype('datetime64[ns]'), 0
+        values = column.to_numpy(dtype=object)
+        is_time = np.fromiter((isinstance(value, (datetime.datetime, np.datetime64)) for value in values),
+                              dtype=bool, count=len(values))
+        times = pd.to_datetime(column.where(is_time), errors='coerce').astype('datetime64[ns]')
+        return times, int((times.isna() & ~cls.blanks(column)).sum())
+
+    @classmethod
+    def to_numbers(cls, column):
+        # Values as float64, and the number of non-blank cells rejected (text that is not a number)
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            return column.astype('float64'), 0
+        numbers = pd.to_numeric(column, errors='coerce').astype('float64')
+        return numbers, int((numbers.isna() & ~cls.blanks(column)).sum())
+
+    @staticmethod
+    def is_sorted(times):
+        # Whether binary searches over the column find the expected rows: the timestamps never decrease and any
+        # NaT (which numpy sorts last) comes after every timestamp
+        valid = times.notna().to_numpy()
+        values = times.to_numpy()[valid]
+        return bool(valid[:valid.sum()].all() and (values[1:] >= values[:-1]).all())
+
+    @classmethod
+    def validate(cls, df, sheet_name, time_columns, numeric_columns):
+        # Return df with the time columns as datetime64[ns] and the numeric columns as float64; other columns are
+        # kept as they are and df itself is not modified. The counts of rejected cells and whether the time
+        # columns are sorted are logged and kept in the `validation` entry of the result's attrs.
+        typed = df.copy(deep=False)
+        report = {'sheet': sheet_name, 'rows': len(df), 'rejected': {}, 'unsorted': []}
+        for col in time_columns:
+            typed[col], report['rejected'][col] = cls.to_times(df[col])
+            if not cls.is_sorted(typed[col]):
+                report['unsorted'].append(col)
+        for col in numeric_columns:
+            typed[col], report['rejected'][col] = cls.to_numbers(df[col])
+        typed.attrs['validation'] = report
+
+        rejected = {col: count for col, count in report['rejected'].items() if count}
+        logging.info(f"{sheet_name}: {len(df)} rows validated, {sum(rejected.values())} cell(s) rejected.")
+        if rejected:
+            logging.warning(f"{sheet_name}: cells that are not valid values were treated as blank: {rejected}.")
+        if report['unsorted']:
+            # AveragedData finds the rows of every minute with a binary search of its own (TimeBinner.search), like
+            # the original row-wise stages, so the rows do not depend on how the minutes are batched. On unsorted
+            # timestamps a binary search can still stop away from the nearest sample.
+            logging.warning(f"{sheet_name}: timestamp column(s) {report['unsorted']} are not sorted; rows are "
+                            f"found with a separate binary search per minute and may not be the nearest samples.")
+        return typed
@@ -0,0 +1,131 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+
+class BlockTimer:
+    def __init__(self, metrics, stage):
+        # Times consecutive named blocks of a stage: each split records everything since the previous one
+        self.metrics = metrics
+        self.stage = stage
+        self.last = metrics.snapshot()
+
+    def split(self, block, rows=None):
+        now = self.metrics.snapshot()
+        self.metrics.record(f"{self.stage}.{block}", self.last, now, rows, parent=self.stage)
+        self.last = now
+
+
+class NullBlockTimer:
+    # Stand-in used while metrics are disabled, so instrumented code costs nothing
+    def split(self, block, rows=None):
+        pass
+
+
+class Metrics:
+    def __init__(self):
+        # Collector of wall time, CPU time, peak RSS and row counts per stage and per named block. Disabled
+        # until start() is called.
+        self.enabled = False
+        self.records = []
+        # Stages being measured, per thread: stages running concurrently on other threads are not their parents
+        self.local = threading.local()
+        self.profile_stage = None
+        self.profile_path = None
+
+    def start(self, profile_stage=None, profile_path=None):
+        # Clear earlier records and start collecting; profile_stage is run under cProfile
+        self.enabled = True
+        self.records = []
+        self.local = threading.local()
+        self.profile_stage = profile_stage
+        self.profile_path = profile_path
+
+    @staticmethod
+    def peak_rss_mb():
+        # High-water mark of the resident set size of this process so far (KiB on Linux, bytes on macOS)
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def snapshot(self):
+        # CPU time is that of the calling thread, so stages running concurrently are not charged for each other
+        return time.perf_counter(), time.thread_time(), self.peak_rss_mb()
+
+    def record(self, name, before, after, rows=None, parent=None):
+        peak_before, peak_after = before[2], after[2]
+        self.records.append({
+            'name': name,
+            'parent': parent,
+            'wall_s': round(after[0] - before[0], 6),
+            'cpu_s': round(after[1] - before[1], 6),
+            'peak_rss_mb': None if peak_after is None else round(peak_after, 1),
+            # Growth of the process high-water mark during the block: memory the block needed beyond any earlier peak
+            'peak_rss_growth_mb': None if peak_after is None else round(peak_after - peak_before, 1),
+            # Row counts often come from numpy arithmetic; they are stored as plain ints so metrics.json keeps numbers
+            'rows': None if rows is None else int(rows),
+        })
+
+    @contextmanager
+    def measure(self, name):
+        # Measure a stage. The yielded dict takes the output row count: `with metrics.measure(...) as m: m['rows'] = n`
+        result = {'rows': None}
+        if not self.enabled:
+            yield result
+            return
+        parent = self.stack[-1] if self.stack else None
+        self.stack.append(name)
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        before = self.snapshot()
+        if profiler:
+            profiler.enable()
+        try:
+            yield result
+        finally:
+            if profiler:
+                profiler.disable()
+                self.write_profile(profiler)
+            self.record(name, before, self.snapshot(), result['rows'], parent)
+            self.stack.pop()
+
+    def blocks(self, stage):
+        # Timer for the named blocks inside a stage
+        return BlockTimer(self, stage) if self.enabled else NullBlockTimer()
+
+    def write_profile(self, profiler):
+        # Binary profile for pstats/snakeviz, plus the 30 most expensive functions as text
+        profiler.dump_stats(self.profile_path)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(30)
+        with open(f"{os.path.splitext(self.profile_path)[0]}.txt", 'w') as f:
+            f.write(text.getvalue())
+        logging.info(f"Profile of {self.profile_stage} written to {self.profile_path}.")
+
+    def write_json(self, output_path, **run_info):
+        # Write the collected records with a description of the run
+        with open(output_path, 'w') as f:
+            json.dump({'run': run_info, 'stages': self.records}, f, indent=2)
+
+
+# Collector shared by the pipeline modules
+metrics = Metrics()
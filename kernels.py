@@ -0,0 +1,85 @@
+from collections import deque
+import numpy as np
+
+
+class Kernels:
+    @staticmethod
+    def shift(values, periods, fill_value=np.nan):
+        # Shift an array by `periods` rows (positive moves values down, negative moves them up),
+        # filling the rows that have no source value with `fill_value`
+        values = np.asarray(values, dtype=float)
+        result = np.full(len(values), fill_value, dtype=float)
+        if abs(periods) >= len(values):
+            return result
+        if periods >= 0:
+            result[periods:] = values[:len(values) - periods]
+        else:
+            result[:periods] = values[-periods:]
+        return result
+
+    @staticmethod
+    def lead_difference(current, ahead, lag):
+        # current[i] - ahead[i + lag] for every row that has a row `lag` steps ahead;
+        # the last `lag` rows have nothing ahead of them and keep current[i]
+        if lag < 0:
+            raise ValueError(f"lag must be non-negative, got {lag}")
+        current = np.asarray(current, dtype=float)
+        result = current.copy()
+        if lag < len(current):
+            result[:len(current) - lag] = current[:len(current) - lag] - np.asarray(ahead, dtype=float)[lag:]
+        return result
+
+    @staticmethod
+    def trapezoid_steps(start_values, end_values, x):
+        # Area of each trapezoid step between consecutive rows: mean(start, end) * (x[i] - x[i - 1]).
+        # Row 0 has no previous row and, like any step that evaluates to NaN, contributes 0.
+        start_values = np.asarray(start_values, dtype=float)
+        end_values = np.asarray(end_values, dtype=float)
+        x = np.asarray(x, dtype=float)
+        steps = (start_values + end_values) / 2 * (x - Kernels.shift(x, 1))
+        steps[:1] = 0
+        return np.where(np.isnan(steps), 0, steps)
+
+    @staticmethod
+    def sliding_minimum(values, starts, ends):
+        # Minimum of values[starts[i]:ends[i]] for every window, ignoring NaN (NaN for windows without values).
+        # Both bounds must be non-decreasing; a monotonic deque then visits every value once.
+        values = np.asarray(values, dtype=float)
+        result = np.full(len(starts), np.nan)
+        window = deque()
+        right = 0
+        for i, (lo, hi) in enumerate(zip(starts, ends)):
+            while right < hi:
+                if not np.isnan(values[right]):
+                    while window and values[window[-1]] >= values[right]:
+                        window.pop()
+                    window.append(right)
+                right += 1
+            while window and window[0] < lo:
+                window.popleft()
+            if window:
+                result[i] = values[window[0]]
+        return result
+
+    @staticmethod
+    def lttb(x, y, n_out):
+        # Largest-Triangle-Three-Buckets downsampling: indices of n_out points that keep the visual shape of the
+        # series. The first and last points are kept; every bucket in between keeps the point forming the
+        # largest triangle with the previously kept point and the average of the next bucket.
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if n_out >= len(x) or n_out < 3:
+            return np.arange(len(x))
+        edges = np.linspace(1, len(x) - 1, n_out - 1).astype(int)
+        kept = np.empty(n_out, dtype=int)
+        kept[0], kept[-1] = 0, len(x) - 1
+        previous = 0
+        for bucket in range(n_out - 2):
+            lo, hi = edges[bucket], edges[bucket + 1]
+            next_lo, next_hi = (hi, edges[bucket + 2]) if bucket + 2 < len(edges) else (len(x) - 1, len(x))
+            next_x, next_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+            areas = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous])
+                           - (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+            previous = lo + int(np.argmax(areas))
+            kept[bucket + 1] = previous
+        return kept
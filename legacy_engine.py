@@ -0,0 +1,531 @@
+import pandas as pd
+import numpy as np
+from utils import Utils
+
+# The original row-wise implementation of the AveragedData, RunData and SummaryCalculator stages, one Excel
+# formula per lambda, kept unchanged as the reference the fast stages are checked against (--engine legacy and
+# --verify in main.py). The only differences are that the inputs are copied instead of modified and that nothing
+# is written to the current directory. Do not optimize this module.
+
+
+class LegacyAveragedData:
+    def __init__(self, df, bluevis_df, solaris_df):
+        # Initialize the AveragedData class with raw data, BlueVis processed data, and Solaris processed data.
+        # process() renames the sheet columns and rewrites the Solaris timestamps, so it works on copies.
+        self.raw_df = df.copy()
+        self.bluevis_df = bluevis_df
+        self.solaris_df = solaris_df.copy()
+        self.processed_df = None
+
+    def process(self):
+        # Extract header rows and set columns for the dataframe
+        header_rows = self.raw_df.iloc[:2].fillna('')
+        avg_df_columns = pd.MultiIndex.from_arrays(header_rows.values)
+        self.raw_df.columns = Utils.excel_column_names(len(avg_df_columns))
+        avg_df = self.raw_df.iloc[2:].reset_index(drop=True)
+
+        # Create and process 'avg_df_processed' DataFrame
+        self.processed_df = pd.DataFrame(columns=Utils.excel_column_names(len(avg_df_columns)))
+
+        # Determine the start and end datetime from BlueVis data
+        start_datetime = self.bluevis_df.iloc[0, 1]
+        end_datetime = self.bluevis_df.iloc[-1, 1]
+
+        # Create a datetime series with 1-minute intervals
+        datetime_series = pd.date_range(start=start_datetime,
+                                        periods=int((end_datetime - start_datetime).total_seconds() / 60) + 1,
+                                        freq='60S')
+
+        # Set datetime columns in the processed DataFrame
+        self.processed_df['C'] = datetime_series
+        self.processed_df['B'] = self.processed_df['C'] + pd.to_timedelta(4, unit='h')
+
+        # Calculate columns 'L' and 'M' based on BlueVis data
+        self.processed_df['L'] = self.processed_df.apply(lambda row: self.bluevis_df['A'].searchsorted(row['B']) + 8,
+                                                         axis=1)
+        self.processed_df['M'] = self.processed_df['L'] + 1000
+
+        # Set column 'A' based on conditions from BlueVis data
+        self.processed_df['A'] = self.processed_df['C'].apply(
+            lambda x: 1 if (self.bluevis_df['A'].searchsorted(x, side='right') - 1) else "" if pd.notna(x) else "")
+
+        # Calculate columns 'D' to 'K' based on a range in BlueVis data and averaging
+        for col, col_name in zip(['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K'], ['C', 'D', 'E', 'F', 'G', 'H', 'L', 'M']):
+            self.processed_df[col] = self.processed_df.apply(
+                lambda row: self.bluevis_df.loc[
+                            round(row['L']):round(row['M']),
+                            col_name
+                            ][(self.bluevis_df.loc[round(row['L']):round(row['M']), 'A'] >= avg_df.iloc[row.name, 1]) &
+                              (self.bluevis_df.loc[round(row['L']):round(row['M']), 'A'] < avg_df.iloc[
+                                  min(row.name + 1, len(avg_df) - 1), 1])]
+                .mean() if not self.bluevis_df.loc[round(row['L']):round(row['M']), col_name].empty else float('nan'),
+                axis=1
+            )
+
+        # Convert column 'A' in Solaris data to handle NaT values
+        self.solaris_df['A'] = self.solaris_df['A'].apply(
+            lambda x: pd.NaT if pd.isnull(x) or isinstance(x, (float, int)) else x)
+
+        # Calculate columns 'AK' and 'AL' based on Solaris data
+        self.processed_df['AK'] = self.processed_df.apply(
+            lambda row: self.solaris_df['A'].searchsorted(row['C'], side='right'), axis=1)
+        self.processed_df['AL'] = self.processed_df['AK'] + 1000
+
+        # Calculate columns 'N' to 'AJ' based on Solaris data and averaging
+        for col, col_name in zip(
+                ['N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE', 'AF',
+                 'AG', 'AH', 'AI', 'AJ'],
+                ['E', 'G', 'I', 'K', 'M', 'P', 'Q', 'T', 'U', 'R', 'S', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD',
+                 'AE', 'AF', 'AG']):
+            self.processed_df[col] = self.processed_df.apply(
+                lambda row: self.solaris_df.loc[
+                            round(row['AK']):round(row['AL']),
+                            col_name
+                            ][(self.solaris_df.loc[round(row['AK']):round(row['AL']), 'A'] >= self.processed_df.iloc[
+                    row.name, 2]) &
+                              (self.solaris_df.loc[round(row['AK']):round(row['AL']), 'A'] < self.processed_df.iloc[
+                                  min(row.name + 1, len(self.processed_df) - 1), 2])]
+                .mean() if pd.notna(row['AK']) and pd.notna(row['AL']) else float('nan'),
+                axis=1
+            )
+
+        # Adding additional columns to the processed DataFrame
+        self.processed_df['AM'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 5]
+            if x in self.processed_df['AM'].values else 0 if pd.notna(x) else ""
+        )
+
+        self.processed_df['AN'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 8]
+            if x in self.processed_df['AN'].values else 0 if pd.notna(x) else ""
+        )
+
+        self.processed_df['AO'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 9]
+            if x in self.processed_df['AO'].values else 0 if pd.notna(x) else ""
+        )
+
+        self.processed_df['AP'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 11]
+            if x in self.processed_df['AP'].values else 0 if pd.notna(x) else ""
+        )
+
+        self.processed_df['AQ'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 12]
+            if x in self.processed_df['AQ'].values else 0 if pd.notna(x) else ""
+        )
+
+        self.processed_df['AR'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 13]
+            if x in self.processed_df['AR'].values else 0 if pd.notna(x) else ""
+        )
+
+        self.processed_df['AS'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 15]
+            if x in self.processed_df['AS'].values else 0 if pd.notna(x) else ""
+        )
+
+        self.processed_df['AT'] = self.processed_df['A'].apply(
+            lambda x: self.processed_df.iloc[self.processed_df.index[self.processed_df['A'] == x].tolist()[0], 5]
+            if x in self.processed_df['AT'].values else 0 if pd.notna(x) else ""
+        )
+
+        # Copy the processed DataFrame (the original also saved it to averaged_data.csv here)
+        avg_df_processed = self.processed_df.copy()
+
+        return avg_df_processed
+
+
+class LegacyRunData:
+    def __init__(self, df, avg_df_processed, calibration_df,st):
+        # Initialize with raw data, processed average data, and calibration data. process() renames the sheet
+        # columns of the raw and calibration data, so it works on copies.
+        self.raw_df = df.copy()
+        self.avg_df_processed = avg_df_processed
+        self.calibration_df = calibration_df.copy()
+        self.processed_df = None
+        self.start_time=st
+
+    def process(self):
+        # Extract header rows from raw data
+        header_rows = self.raw_df.iloc[:3].fillna('')
+        # Create MultiIndex columns from header rows
+        run_df_columns = pd.MultiIndex.from_arrays(header_rows.values)
+        # Set columns of raw DataFrame using utils function
+        self.raw_df.columns = Utils.excel_column_names(len(run_df_columns))
+        # Extract run data from raw DataFrame, excluding header rows
+        run_df = self.raw_df.iloc[3:].reset_index(drop=True)
+
+        # Create a DataFrame for processed run data with appropriate column names
+        self.processed_df = pd.DataFrame(columns=Utils.excel_column_names(len(run_df_columns)))
+        # Define start time and create time range for processed data (1-minute intervals)
+        start_time = pd.Timestamp(self.start_time)
+        time_range = pd.date_range(start=start_time, end=start_time.replace(hour=23, minute=59, second=0), freq='1T')
+        # Reindex processed DataFrame to match the time range
+        self.processed_df = self.processed_df.reindex(range(len(time_range)))
+        # Initialize some values in processed DataFrame
+        self.processed_df.loc[0, 'A'] = 1
+        self.processed_df['B'] = time_range
+        # Calculate time difference in hours from the starting time
+        self.processed_df['C'] = (self.processed_df['B'] - self.processed_df.iloc[0, 1]).dt.total_seconds() / 3600
+
+        # Process columns D to K using data from averaged DataFrame
+        # Iterate through columns D to K and corresponding columns in avg_df_processed (3 to 10)
+        for col, avg_col in zip(['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K'], range(3, 11)):
+            # Assign values from avg_df_processed based on time match, handle missing data with 0 or ""
+            self.processed_df[col] = self.processed_df['B'].apply(
+                lambda x: self.avg_df_processed.iloc[
+                    self.avg_df_processed.index[self.avg_df_processed['C'] == x].tolist()[0], avg_col]
+                if (self.avg_df_processed['C'] == x).any() else 0 if pd.notna(x) else ""
+            )
+
+        # Process calibration data
+        # Extract header rows from calibration DataFrame
+        header_rows = self.calibration_df.iloc[:9].fillna('')
+        # Create MultiIndex columns from calibration header rows
+        calibration_df_columns = pd.MultiIndex.from_arrays(header_rows.values)
+        # Set columns of calibration DataFrame using utils function
+        self.calibration_df.columns = Utils.excel_column_names(len(calibration_df_columns))
+        # Extract a subset of calibration data for later use
+        calibration_sep_df = self.calibration_df.iloc[1:5, 1:13].set_index('B')
+        # Extract the main part of calibration data
+        self.calibration_df = self.calibration_df.iloc[9:].reset_index(drop=True)
+
+
+        #Process column M based on calibration data and column J
+        self.processed_df['M'] = self.processed_df.apply(
+            lambda row: (
+                    row['J'] / 100
+                    - (
+                        calibration_sep_df['L'].iloc[2]
+                        if row['J'] / 100 < self.calibration_df['I'].iloc[5] else
+                        calibration_sep_df['L'].iloc[5]  # 'Calibration Data'!L$6
+                        if calibration_sep_df['I'].iloc[5] <= row['J'] / 100 < self.calibration_df['I'].iloc[4] else
+                        calibration_sep_df['L'].iloc[4]  # 'Calibration Data'!L$5
+                        if calibration_sep_df['I'].iloc[4] <= row['J'] / 100 < self.calibration_df['I'].iloc[3] else
+                        calibration_sep_df['L'].iloc[3]  # 'Calibration Data'!L$4
+                    )
+            ) if pd.notna(row['J']) else 0,
+            axis=1
+        )
+        #Ensure values in column M are non-negative.
+        self.processed_df['M'] = self.processed_df['M'].apply(lambda x: x if x >= 0 else 0)
+
+        #Process column N based on calibration data and columns H and D
+        self.processed_df['N'] = self.processed_df.apply(
+            lambda row: (
+                    (row['H'] / 100) / (1 - row['D'] / 100)
+                    - (
+                        calibration_sep_df.loc[
+                            calibration_sep_df['J'] > row['H'] / 100, 'M'
+                        ].iloc[0]  # Use the first match from calibration_df based on the condition
+                    )
+            ) if pd.notna(row['H']) and pd.notna(row['D']) else 0,
+            axis=1
+        )
+        #Ensure values in column N are non-negative.
+        self.processed_df['N'] = self.processed_df['N'].apply(lambda x: x if x >= 0 else 0)
+
+        #Process column L based on calibration data and columns K, M, and N
+        self.processed_df['L'] = self.processed_df.apply(
+            lambda row: (
+                    (row['K'] + (9.404 * row['M'] - 0.818 * row['N'])) / 100
+                    - (
+                        calibration_sep_df.loc[
+                            calibration_sep_df['H'] > row['K'] / 100, 'K'
+                        ].iloc[0]  # Use the first match from calibration_df for corresponding conditions
+                    )
+            ) if pd.notna(row['K']) and pd.notna(row['M']) and pd.notna(row['N']) else 0,
+            axis=1
+        )
+        #Ensure values in column L are non-negative.
+        self.processed_df['L'] = self.processed_df['L'].apply(lambda x: x if x >= 0 else 0)
+
+        # Calculate columns O to U based on previously processed columns
+        self.processed_df['O'] = (1 - (self.processed_df['L'] + self.processed_df['M'] + self.processed_df['N']))
+        self.processed_df['P'] = self.processed_df['P'].apply(lambda x: 1.5)
+        self.processed_df['Q'] = self.processed_df['P'] / self.processed_df['O']
+        self.processed_df['R'] = self.processed_df['Q'] * self.processed_df['L']
+        self.processed_df['S'] = self.processed_df['Q'] * self.processed_df['M']
+        self.processed_df['T'] = self.processed_df['Q'] * self.processed_df['N']
+        self.processed_df['U'] = self.processed_df['Q'] * self.processed_df['O']
+
+        # Process columns V, W, X from averaged data
+        self.processed_df['V'] = self.processed_df['B'].apply(
+            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'X'].values[0]
+            if (self.avg_df_processed['C'] == x).any() else None if pd.notna(x) else None
+        )
+
+        self.processed_df['W'] = self.processed_df['B'].apply(
+            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'V'].values[0]
+            if (self.avg_df_processed['C'] == x).any() else None if pd.notna(x) else None
+        )
+
+        self.processed_df['X'] = self.processed_df['B'].apply(
+            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'T'].values[0]
+            if (self.avg_df_processed['C'] == x).any() else None if pd.notna(x) else None
+        )
+
+        # Calculate columns Y to AD based on previously processed columns
+        self.processed_df['Y'] = self.processed_df['R'] * 0.081505
+        self.processed_df['Z'] = self.processed_df['S'] * 1.7893
+        self.processed_df['AA'] = self.processed_df['T'] * 1.2954
+        self.processed_df['AB'] = self.processed_df['V'] * 0.083732
+        self.processed_df['AC'] = self.processed_df['W'] * 1.8389
+        self.processed_df['AD'] = self.processed_df['X'] * 1.3309
+
+        # Calculate columns AE to AG using a rolling calculation
+        self.processed_df['AE'] = self.processed_df.index.map(
+            lambda i: (
+                (self.processed_df.loc[i, 'AB'] - self.processed_df.loc[i + 10, 'Y']) * 60
+                if i <= self.processed_df.index.max() - 10
+                else self.processed_df.loc[i, 'AB'] * 60
+            )
+        )
+        self.processed_df['AF'] = self.processed_df.index.map(
+            lambda i: (
+                (self.processed_df.loc[i, 'AC'] - self.processed_df.loc[i + 10, 'Z']) * 60
+                if i <= self.processed_df.index.max() - 10
+                else self.processed_df.loc[i, 'AC'] * 60
+            )
+        )
+        self.processed_df['AG'] = (self.processed_df.index.map(
+            lambda i: (
+                (self.processed_df.loc[i, 'AD'] - self.processed_df.loc[i + 10, 'AA']) * 60
+                if i <= self.processed_df.index.max() - 10
+                else self.processed_df.loc[i, 'AD'] * 60
+            )
+        ))
+
+        # Process columns AH and AL from averaged data, handling potential zero values
+        self.processed_df['AH'] = self.processed_df['B'].apply(
+            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AP'].values[0]
+            if (self.avg_df_processed['C'] == x).any() and
+               self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AP'].values[0] != 0
+            else 0 if pd.notna(x) else 0
+        )
+
+        self.processed_df['AL'] = self.processed_df['B'].apply(
+            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AN'].values[0]
+            if (self.avg_df_processed['C'] == x).any() and
+               self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AN'].values[0] != 0
+            else 0 if pd.notna(x) else 0
+        )
+
+        # Calculate columns AM to AT based on previously processed columns
+        self.processed_df['AM'] = self.processed_df['AF'] + self.processed_df['AK']
+        self.processed_df['AN'] = self.processed_df['AN'].apply(lambda x: 2.24)
+        self.processed_df['AO'] = self.processed_df['AE'] / self.processed_df['AN']
+        self.processed_df['AP'] = self.processed_df['AF'] / self.processed_df['AN']
+        self.processed_df['AQ'] = self.processed_df['AG'] / self.processed_df['AN']
+        self.processed_df['AR'] = self.processed_df['AO'] / 2.016 * 1000
+        self.processed_df['AR'] = self.processed_df['AR'].apply(lambda x: x if x <= 100 and x >= -100 else 0)
+        self.processed_df['AS'] = self.processed_df['AP'] / 44.01 * 1000
+        self.processed_df['AS'] = self.processed_df['AS'].apply(lambda x: x if x <= 100 and x >= -100 else 0)
+        self.processed_df['AT'] = self.processed_df['AQ'] / 31.999 * 1000
+        self.processed_df['AT'] = self.processed_df['AT'].apply(lambda x: x if x <= 100 and x >= -100 else 0)
+
+        # Calculate columns AU to AX based on previously processed columns, handling division by zero
+        self.processed_df['AU'] = self.processed_df.apply(
+            lambda row: (row['AO'] / row['BB']) if pd.notna(row['BB']) and row['BB'] != 0 else 0, axis=1)
+        self.processed_df['AV'] = self.processed_df.apply(
+            lambda row: (row['AP'] / row['BB']) if pd.notna(row['BB']) and row['BB'] != 0 else 0, axis=1)
+        self.processed_df['AW'] = self.processed_df.apply(
+            lambda row: (row['AQ'] / row['BB']) if pd.notna(row['BB']) and row['BB'] != 0 else 0, axis=1)
+        self.processed_df['AX'] = self.processed_df.apply(
+            lambda row: (row['AS'] * -1 / row['AT']) if pd.notna(row['AT']) and row['AT'] != 0 else 0, axis=1)
+
+        # Process columns BB and BC from averaged data, handling missing data and zero values
+        self.processed_df['BB'] = self.processed_df['B'].apply(
+            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AS'].values[0]
+            if (self.avg_df_processed['C'] == x).any() and
+               self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AS'].values[0] != ""
+            else None if pd.notna(x) else None
+        )
+
+        self.processed_df['BC'] = self.processed_df.apply(
+            lambda row: row['BB'] * (
+                        self.avg_df_processed.loc[self.avg_df_processed['C'] == row['B'], 'AT'].values[0] / 100)
+            if (self.avg_df_processed['C'] == row['B']).any() and
+               self.avg_df_processed.loc[self.avg_df_processed['C'] == row['B'], 'AT'].values[0] != ""
+            else None if pd.notna(row['B']) else None, axis=1
+        )
+
+        # Calculate columns BD, BE, BF using rolling calculations, handling potential errors
+        self.processed_df['BD'] = self.processed_df.apply(
+            lambda row: self.processed_df.loc[row.name, ['AO', 'AO']].mean() * self.processed_df.loc[
+                row.name, ['AN', 'AN']].mean() * (
+                                self.processed_df.loc[row.name, 'C'] - self.processed_df.loc[row.name - 1, 'C'])
+            if row.name > 0 else 0, axis=1
+        )
+        self.processed_df['BD'].fillna(0, inplace=True)
+
+        self.processed_df['BE'] = self.processed_df.apply(
+            lambda row: self.processed_df.loc[row.name, ['AP', 'AP']].mean() * self.processed_df.loc[
+                row.name, ['AN', 'AN']].mean() * (
+                                self.processed_df.loc[row.name, 'C'] - self.processed_df.loc[row.name - 1, 'C'])
+            if row.name > 0 else 0, axis=1
+        )
+        self.processed_df['BE'].fillna(0, inplace=True)
+
+        self.processed_df['BF'] = self.processed_df.apply(
+            lambda row: self.processed_df.loc[row.name, ['AQ', 'AQ']].mean() * self.processed_df.loc[
+                row.name, ['AN', 'AN']].mean() * (
+                                self.processed_df.loc[row.name, 'C'] - self.processed_df.loc[row.name - 1, 'C'])
+            if row.name > 0 else 0, axis=1
+        )
+        self.processed_df['BF'].fillna(0, inplace=True)
+
+
+        # Process columns BG and BH from averaged data, handling missing data and empty strings
+        self.processed_df['BG'] = self.processed_df['B'].apply(
+            lambda b_value: self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'Q'].values[0]
+            if len(self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'Q']) > 0 and
+               self.avg_df_processed.loc[
+                   self.avg_df_processed['C'] == b_value, 'Q'].values[0] != ""
+            else None if pd.notna(b_value) else None
+        )
+
+        self.processed_df['BH'] = self.processed_df['B'].apply(
+            lambda b_value: self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'R'].values[0]
+            if len(self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'R']) > 0 and
+               self.avg_df_processed.loc[
+                   self.avg_df_processed['C'] == b_value, 'R'].values[0] != ""
+            else None if pd.notna(b_value) else None
+        )
+
+        # Calculate column BI based on BG and BH, using a conditional statement
+        self.processed_df['BI'] = self.processed_df.apply(
+            lambda row: row['BH'] if (-1.69 * np.log(row['BG']) + 8.17) < row['BH'] else (
+                        -1.69 * np.log(row['BG']) + 8.17),
+            axis=1
+        )
+
+        # Calculate columns BJ and BK based on previously processed columns
+        self.processed_df['BJ'] = (self.processed_df[['V', 'W', 'X']].sum(axis=1)) / (1000 * 60 * 0.1026)
+        self.processed_df['BK'] = (self.processed_df['AQ'] / (3.5 - self.processed_df['BH'])) * 1000
+
+        #This line seems to have an error, using arbitrary value for processed_df['BL'].iloc[2]
+        self.processed_df['BL'] = 0.95 * (self.processed_df['BG'] / (self.processed_df['AN']) ** 0.6) * (
+                    self.processed_df['BJ'] ** 0.6) * 3600 * self.processed_df['BL'].iloc[2] #Arbitrary value used here. Needs fixing.
+
+        # Copy the processed DataFrame (the original also saved it to run_data.csv here)
+        run_df_processed = self.processed_df.copy()
+        # Return the processed DataFrame
+        return run_df_processed
+
+
+class LegacySummaryCalculator:
+    @staticmethod
+    def calculate_summary(df):
+        # Function to get the hours corresponding to a given timestamp value
+        def get_hrs(timestamp_value):
+            try:
+                # Find the closest matching timestamp in column 'B' and get the corresponding value in column 'C'
+                res = df.loc[df['B'].searchsorted(timestamp_value), 'C']
+            except:
+                # If there is an issue, use the maximum timestamp value available
+                res = df.loc[df['B'].searchsorted(df['B'].max()), 'C']
+            return res
+
+        # Function to calculate total consumption values
+        def get_totals(val1, val2, st, end):
+            try:
+                # Calculate the sum for the given range and normalize using another value
+                return (df.loc[(df['C'] >= st) & (df['C'] < end), val1].sum() / df.loc[df['C'].le(end).idxmax(), val2])
+            except:
+                return np.nan
+
+        # Function to get the maximum value in a given range
+        def get_max(val, st, end):
+            try:
+                # Get the maximum value for the specified column and range
+                return df.loc[(df['C'] > st) & (df['C'] < end), val].max()
+            except:
+                return np.nan
+
+        # Function to get the mean value in a given range
+        def get_mean(val, val1, val2):
+            try:
+                # Calculate the mean for the specified column and range
+                return df.loc[(df['C'] >= val1) & (df['C'] < val2), val].mean()
+            except:
+                return np.nan
+
+        # Define important timestamps used in the summary calculations
+        c5 = pd.Timestamp('10/25/23 1:47 PM')
+        d5 = pd.Timestamp('10/26/23 12:05 PM')
+        c6 = get_hrs(c5)
+        d6 = get_hrs(d5)
+        g5 = pd.Timestamp("10/26/23 4:50 PM")
+        h5 = pd.Timestamp("10/27/23 3:07 PM")
+        g6 = get_hrs(g5)
+        h6 = get_hrs(h5)
+        d22 = d6
+        c22 = d22 - 1
+        g22 = 27.050
+        h22 = 30.000
+        c7 = 20
+
+        # Create the summary dictionary containing all relevant calculations
+        summary = {
+            "Growth": {
+                "Start": c5.strftime('%Y/%m/%d %H:%M %p'),
+                "End": d5.strftime('%Y/%m/%d %H:%M %p'),
+                "Elapsed Fermentation Time": {"Start": c6, "End": d6, "Unit": "hrs"},
+                "Stabilization Time of g/g Data": {"Value": c7, "Unit": "hrs"},
+                "Totals": {
+                    "Hydrogen Consumed/Biomass": {"Value": get_totals('BD', 'BB', c6, d6), "Unit": "g/g"},
+                    "Carbon Dioxide Consumed/Biomass": {"Value": get_totals('BE', 'BB', c6, d6), "Unit": "g/g"},
+                    "Oxygen Consumed/Biomass": {"Value": get_totals('BF', 'BB', c6, d6), "Unit": "g/g"},
+                    "Hydrogen Consumed/Volume": {"Value": get_totals('BD', 'AN', c6, d6), "Unit": "g/L"},
+                    "Carbon Dioxide Consumed/Volume": {"Value": get_totals('BE', 'AN', c6, d6), "Unit": "g/L"},
+                    "Oxygen Consumed/Volume": {"Value": get_totals('BF', 'AN', c6, d6), "Unit": "g/L"}
+                },
+                "Maximums": {
+                    "EFT Time Range": {"Start": c22, "End": d22, "Unit": "hrs"},
+                    "Hydrogen Consumption Rate": {"Value": get_max('AR', c22, d22), "Unit": "mmol/L/hr"},
+                    "Carbon Dioxide Consumption Rate": {"Value": get_max('AS', c22, d22), "Unit": "mmol/L/hr"},
+                    "Oxygen Consumption Rate": {"Value": get_max('AT', c22, d22), "Unit": "mmol/L/hr"}
+                },
+                "Averages": {
+                    "Hydrogen Consumption/Biomass/Hr": {"Value": get_mean('AU', c7, d6), "Unit": "g/g/hr"},
+                    "Carbon Dioxide Consumption/Biomass/Hr": {"Value": get_mean('AV', c7, d6), "Unit": "g/g/hr"},
+                    "Oxygen Consumption Rate /Hr": {"Value": get_mean('AW', c7, d6), "Unit": "g/g/hr"}
+                },
+                "Stoichiometry": {"Actual": "null", "Literature": "null"},
+                "% Mixotrophy": "null"
+            },
+            "Production": {
+                "Start": g5.strftime('%Y/%m/%d %H:%M %p'),
+                "End": h5.strftime('%Y/%m/%d %H:%M %p'),
+                "Elapsed Fermentation Time": {"Start": g6, "End": h6, "Unit": "hrs"},
+                "Totals": {
+                    "Hydrogen Consumed/Biomass": {"Value": get_totals('BD', 'BB', g6, h6), "Unit": "g/g"},
+                    "Carbon Dioxide Consumed/Biomass": {"Value": get_totals('BE', 'BB', g6, h6), "Unit": "g/g"},
+                    "Oxygen Consumed/Biomass": {"Value": get_totals('BF', 'BB', g6, h6), "Unit": "g/g"},
+                    "Hydrogen Consumed/Volume": {"Value": get_totals('BD', 'AN', g6, h6), "Unit": "g/L"},
+                    "Carbon Dioxide Consumed/Volume": {"Value": get_totals('BE', 'AN', g6, h6), "Unit": "g/L"},
+                    "Oxygen Consumed/Volume": {"Value": get_totals('BF', 'AN', g6, h6), "Unit": "g/L"},
+                    "Hydrogen Consumed/TAG": {"Value": get_totals('BF', 'BC', g6, h6), "Unit": "g/g"},
+                    "Carbon Dioxide Consumed/TAG": {"Value": get_totals('BF', 'BC', g6, h6), "Unit": "g/g"},
+                    "Oxygen Consumed/TAG": {"Value": get_totals('BF', 'BC', g6, h6), "Unit": "g/g"}
+                },
+                "Maximums": {
+                    "EFT Time Range": {"Start": g22, "End": h22, "Unit": "hrs"},
+                    "Hydrogen Consumption Rate": {"Value": get_max('AR', g22, h22), "Unit": "mmol/L/hr"},
+                    "Carbon Dioxide Consumption Rate": {"Value": get_max('AS', g22, h22), "Unit": "mmol/L/hr"},
+                    "Oxygen Consumption Rate": {"Value": get_max('AT', g22, h22), "Unit": "mmol/L/hr"}
+                },
+                "Averages": {
+                    "Hydrogen Consumption/Biomass/Hr": {"Value": get_mean('AU', g6, h6), "Unit": "g/g/hr"},
+                    "Carbon Dioxide Consumption/Biomass/Hr": {"Value": get_mean('AV', g6, h6), "Unit": "g/g/hr"},
+                    "Oxygen Consumption Rate /Hr": {"Value": get_mean('AW', g6, h6), "Unit": "g/g/hr"}
+                },
+                "Stoichiometry": {"Actual": "", "Literature": ""},
+                "% Mixotrophy": "Nan"
+            }
+        }
+
+        # The original also wrote the summary to summary.json here
+        return summary
@@ -1,70 +1,384 @@
-import pandas as pd
+import time
+# Start of the imports, whose duration is reported in the run log. The plotting libraries are not imported here:
+# DataVisualizer imports them once a plot is made, and Numba is only imported by the numba backend.
+IMPORT_START = time.perf_counter()
 from bluevis_data import BlueVisData
 from solaris_data import SolarisData
 from averaged_data import AveragedData
 from run_data import RunData
 from summary_calculator import SummaryCalculator
 from visualizer import DataVisualizer
-import json
+from workbook_loader import WorkbookLoader
+from stage_cache import StageCache
+from output_writers import OutputWriter
+from instrumentation import metrics
+from backends import backend, ComputeBackend
+from legacy_engine import LegacyAveragedData, LegacyRunData, LegacySummaryCalculator
+from parity import ParityChecker
+from sensor_store import SensorStore
+from ingestion import SheetValidator
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
 import sys
 import logging
 import warnings
 
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
 warnings.filterwarnings("ignore")
 
-# Set up logging to log to a file
-logging.basicConfig(filename='data_processing.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', filemode='w')
+# Stages that can be measured and profiled on their own
+PROFILED_STAGES = ['WorkbookLoader', 'BlueVisData', 'SolarisData', 'AveragedData', 'RunData', 'SummaryCalculator',
+                   'Export', 'DataVisualizer']
+# Stages that do not depend on each other run on this many threads: BlueVisData next to SolarisData, and the plot
+# next to the summary (the data files are written on the output writer's own thread)
+STAGE_THREADS = 2
 
-if __name__ == "__main__":
+
+def parse_args(argv=None):
+    # Command-line interface: the workbook and the RunData start time, plus caching options
+    parser = argparse.ArgumentParser(description="Process a fermentation gas analysis workbook.")
+    parser.add_argument('input_file', help="Excel workbook with the raw, averaged, run and calibration sheets")
+    parser.add_argument('start_time', help="Start time of the run, e.g. '2023-10-25 13:47:38'")
+    parser.add_argument('--end-time', default=None,
+                        help="Last minute of the run data (default: the last minute of the averaged data)")
+    parser.add_argument('--chunk-minutes', type=int, default=None,
+                        help="Compute the averaged and run data in blocks of this many minutes, so that their "
+                             "working memory does not grow with the length of the run")
+    parser.add_argument('--engine', choices=ParityChecker.ENGINES, default='fast',
+                        help="Stages to run: the current fast ones, or the original row-wise legacy ones (which "
+                             "ignore --end-time, --chunk-minutes, --backend, --phases and --peak-windows and always "
+                             "end the run data at 23:59 of the start day) (default: fast)")
+    parser.add_argument('--verify', action='store_true',
+                        help="Run both engines on the workbook and write the largest absolute and relative "
+                             "difference of every column, and the speedup, to parity_report.csv/.json instead of "
+                             "the usual outputs; exits with status 1 when the engines disagree")
+    parser.add_argument('--memory-map', action='store_true',
+                        help="Convert the raw BlueVis and Solaris sheets once into typed arrays under "
+                             "<cache-dir>/sensors and average memory-mapped slices of them, in blocks of "
+                             "--chunk-minutes (default: one day), so memory does not grow with the raw history")
+    parser.add_argument('--backend', choices=list(ComputeBackend.BACKENDS), default='numpy',
+                        help="Kernels for the window means, lag differences and BI threshold: the pandas reference "
+                             "implementation, vectorized numpy, or numba-compiled loops (falls back to numpy when "
+                             "Numba is not installed) (default: numpy)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes parsing the uncached sheets of the workbook in parallel (default: the number "
+                             "of CPUs)")
+    parser.add_argument('--cache-dir', default='.circe_cache',
+                        help="Directory for cached parsed sheets and stage outputs (default: .circe_cache)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Parse the workbook and run every stage without using the cache")
+    parser.add_argument('--clear-cache', action='store_true', help="Delete the cache directory before running")
+    parser.add_argument('--cache-size-mb', type=float, default=1024,
+                        help="Size cap of the stage cache; least recently used outputs are evicted (default: 1024)")
+    parser.add_argument('--output-dir', default='.',
+                        help="Directory for the CSV, JSON and plot outputs (default: current directory)")
+    parser.add_argument('--output-format', choices=list(OutputWriter.FORMATS), default='csv',
+                        help="Format of the processed data files: csv, gzip-compressed csv.gz, parquet or feather "
+                             "(these two need pyarrow), or none (default: csv)")
+    parser.add_argument('--summary-only', action='store_true',
+                        help="Only write summary.json: compute just the run data columns the summary needs and skip "
+                             "the data files and the plot")
+    parser.add_argument('--intermediate', action='store_true',
+                        help="Also write the intermediate averaged data (averaged_data.<format>)")
+    parser.add_argument('--phases', default=None,
+                        help="JSON file with the phase windows to summarize (default: the built-in Growth and "
+                             "Production phases)")
+    parser.add_argument('--peak-windows', type=float, nargs='+', default=None, metavar='HOURS',
+                        help="Also report the best sustained windows of these lengths (in hours) over the whole run")
+    parser.add_argument('--top-k', type=int, default=3, help="Number of peak windows reported per length (default: 3)")
+    parser.add_argument('--peak-statistic', choices=['mean', 'min'], default='mean',
+                        help="Rank peak windows by their mean rate or by the minimum rate sustained (default: mean)")
+    parser.add_argument('--no-plot', action='store_true',
+                        help="Write the data files and summary.json but no plot; the plotting libraries are then "
+                             "never imported")
+    parser.add_argument('--headless', action='store_true',
+                        help="Only write the plot files; do not open the interactive plot")
+    parser.add_argument('--plot-html', action='store_true',
+                        help="Also write the plot as a self-contained summary_scatterplot.html")
+    parser.add_argument('--max-plot-points', type=int, default=5000,
+                        help="Downsample each plotted series to at most this many points with LTTB; 0 plots every "
+                             "point (default: 5000)")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Write wall time, CPU time, peak RSS and row counts per stage and block to metrics.json")
+    parser.add_argument('--profile', choices=PROFILED_STAGES, default=None,
+                        help="Run one stage under cProfile and write profile_<stage>.prof/.txt (implies --metrics)")
+    args = parser.parse_args(argv)
+    # Without a plot the DataVisualizer stage never runs, so it would write no profile
+    if args.profile == 'DataVisualizer' and (args.no_plot or args.summary_only):
+        parser.error("--profile DataVisualizer needs the plot; drop --no-plot and --summary-only")
+    return args
+
+
+def run_pipeline(input_file, start_time, output_dir='.', cache_dir='.circe_cache', use_cache=True,
+                 cache_size_mb=1024, show_plot=True, phases=None, peak_lengths=None, top_k=3, peak_statistic='mean',
+                 plot_html=False, max_plot_points=5000, collect_metrics=False, profile_stage=None,
+                 output_format='csv', write_intermediate=False, end_time=None, chunk_minutes=None,
+                 compute_backend='numpy', summary_only=False, engine='fast', memory_map=False, workers=None,
+                 plot=True):
+    # Process one workbook and write its outputs into output_dir. Errors propagate to the caller.
+    if memory_map and engine == 'legacy':
+        raise ValueError("The legacy engine reads the raw sheets as frames and cannot use memory-mapped sensor data")
+    os.makedirs(output_dir, exist_ok=True)
+    backend.use(compute_backend)
+    if collect_metrics or profile_stage:
+        metrics.start(profile_stage, os.path.join(output_dir, f"profile_{profile_stage}.prof"))
+    scheduler = ThreadPoolExecutor(max_workers=STAGE_THREADS)
     try:
-        # Reading the Excel file
-        logging.info("Reading the Excel file.")
-        # Load the Excel file provided as a command-line argument
-        df = pd.read_excel(sys.argv[1], sheet_name=None, engine="openpyxl")
-        logging.info("Excel file read successfully.")
+        _run_stages(input_file, start_time, output_dir, cache_dir, use_cache, cache_size_mb, show_plot, phases,
+                    peak_lengths, top_k, peak_statistic, plot_html, max_plot_points, output_format,
+                    write_intermediate, end_time, chunk_minutes, summary_only, engine, memory_map,
+                    workers or os.cpu_count() or 1, scheduler, plot, profile_stage)
+    finally:
+        scheduler.shutdown()
+        # Metrics are written even when a stage fails, so the failing stage can be found
+        if metrics.enabled:
+            metrics.write_json(os.path.join(output_dir, 'metrics.json'), input_file=input_file, start_time=start_time,
+                               profiled_stage=profile_stage, backend=backend.name, engine=engine)
+            metrics.enabled = False
+
+
+def _run_stages(input_file, start_time, output_dir, cache_dir, use_cache, cache_size_mb, show_plot, phases,
+                peak_lengths, top_k, peak_statistic, plot_html, max_plot_points, output_format, write_intermediate,
+                end_time, chunk_minutes, summary_only, engine, memory_map, workers, scheduler, plot, profile_stage):
+    # A summary-only run writes neither the data files nor the plot
+    if summary_only:
+        output_format, write_intermediate, plot = 'none', False, False
+    # Run data columns read by the requested outputs: all of them when the run data is written, otherwise only
+    # those of the summary (and of the plot). The derived columns nothing reads are not computed.
+    run_columns = None
+    if output_format == 'none' and engine == 'fast':
+        run_columns = set(SummaryCalculator.REQUIRED_COLUMNS)
+        if plot:
+            run_columns |= set(DataVisualizer.REQUIRED_COLUMNS)
+        run_columns = sorted(run_columns)
+
+    # Reading the Excel file
+    logging.info("Reading the Excel file.")
+    # Load only the sheets the pipeline uses, reusing cached sheets when the workbook is unchanged. With
+    # memory_map the raw BlueVis and Solaris sheets are read from their sensor stores instead, and are only loaded
+    # to build a store.
+    loader = WorkbookLoader(input_file, cache_dir=os.path.join(cache_dir, 'sheets') if use_cache else None)
+    raw_sheets = ['BlueVis Raw Data', 'Solaris Data'] if memory_map else []
+    with metrics.measure('WorkbookLoader') as measured:
+        df = loader.load([sheet_name for sheet_name in WorkbookLoader.SHEETS if sheet_name not in raw_sheets],
+                         workers=workers)
+        measured['rows'] = sum(len(sheet) for sheet in df.values())
+    logging.info("Excel file read successfully.")
 
+    # Each stage is keyed by the keys of its inputs and its parameters, so only the stages downstream of a
+    # changed sheet or parameter (e.g. the start time) are recomputed; the others are read from the cache. The
+    # profiled stage is always computed, so that its profile is written even when its output is cached.
+    stage_cache = StageCache(os.path.join(cache_dir, 'stages') if use_cache else None,
+                             max_bytes=int(cache_size_mb * 2 ** 20), refresh=[profile_stage] if profile_stage else [])
+
+    def validated(sheet_name, data_class, columns, sheet):
+        # Process a raw sheet and coerce the columns AveragedData reads to typed columns. The legacy engine
+        # reads the processed sheet as it is, like the original pipeline.
+        processed = data_class(sheet).process()
+        return processed if engine == 'legacy' else SheetValidator.validate(processed, sheet_name, *columns)
+
+    def sensor_store(sheet_name, data_class, columns):
+        # Open the sensor store of a raw sheet of this workbook, converting the validated sheet when the store
+        # does not exist yet (or is rebuilt because the cache is not used)
+        directory = os.path.join(cache_dir, 'sensors',
+                                 f"{loader.workbook_hash}-{loader.engine}-{sheet_name.replace(' ', '_')}")
+        return SensorStore.open_or_build(
+            directory, lambda: validated(sheet_name, data_class, columns, loader.load([sheet_name])[sheet_name]),
+            *columns, rebuild=not use_cache)
+
+    def process_bluevis():
         # Instantiate and process BlueVisData
         logging.info("Instantiating and processing BlueVisData.")
-        # Create an instance of BlueVisData and process it
-        bluevis_data = BlueVisData(df['BlueVis Raw Data'])
-        bluevis_processed = bluevis_data.process()
+        with metrics.measure('BlueVisData') as measured:
+            if memory_map:
+                bluevis_processed = sensor_store('BlueVis Raw Data', BlueVisData, AveragedData.BLUEVIS_COLUMNS)
+            else:
+                bluevis_processed = validated('BlueVis Raw Data', BlueVisData, AveragedData.BLUEVIS_COLUMNS,
+                                              df['BlueVis Raw Data'])
+            measured['rows'] = len(bluevis_processed)
         logging.info("BlueVisData processed successfully.")
+        return bluevis_processed
 
+    def process_solaris():
         # Instantiate and process SolarisData
         logging.info("Instantiating and processing SolarisData.")
-        # Create an instance of SolarisData and process it
-        solaris_data = SolarisData(df['Solaris Data'])
-        solaris_processed = solaris_data.process()
+        with metrics.measure('SolarisData') as measured:
+            if memory_map:
+                solaris_processed = sensor_store('Solaris Data', SolarisData, AveragedData.SOLARIS_COLUMNS)
+            else:
+                solaris_processed = validated('Solaris Data', SolarisData, AveragedData.SOLARIS_COLUMNS,
+                                              df['Solaris Data'])
+            measured['rows'] = len(solaris_processed)
         logging.info("SolarisData processed successfully.")
+        return solaris_processed
 
-        # Instantiate and process AveragedData
+    def process_averaged():
+        # Instantiate and process AveragedData using BlueVis and Solaris processed data
         logging.info("Instantiating and processing AveragedData.")
-        # Create an instance of AveragedData using BlueVis and Solaris processed data
-        averaged_data = AveragedData(df['AveragedData'], bluevis_processed, solaris_processed)
-        avg_df_processed = averaged_data.process()
+        # SolarisData is processed on the scheduler while BlueVisData is processed here
+        solaris_future = solaris_stage.submit(scheduler)
+        bluevis_processed, solaris_processed = bluevis_stage.result(), solaris_future.result()
+        with metrics.measure('AveragedData') as measured:
+            if engine == 'legacy':
+                avg_df_processed = LegacyAveragedData(df['AveragedData'], bluevis_processed,
+                                                      solaris_processed).process()
+            else:
+                avg_df_processed = AveragedData(df['AveragedData'], bluevis_processed,
+                                                solaris_processed).process(output_path=None,
+                                                                           chunk_minutes=chunk_minutes)
+            measured['rows'] = len(avg_df_processed)
         logging.info("AveragedData processed successfully.")
+        return avg_df_processed
 
-        # Instantiate and process RunData
+    def process_run():
+        # Instantiate and process RunData using AveragedData and Calibration Data
         logging.info("Instantiating and processing RunData.")
-        # Create an instance of RunData using AveragedData and Calibration Data
-        run_data = RunData(df['Run Data'], avg_df_processed, df['Calibration Data'],sys.argv[2])
-        run_df_processed = run_data.process()
+        avg_df_processed = averaged_stage.result()
+        with metrics.measure('RunData') as measured:
+            if engine == 'legacy':
+                run_df_processed = LegacyRunData(df['Run Data'], avg_df_processed, df['Calibration Data'],
+                                                 start_time).process()
+            else:
+                run_df_processed = RunData(df['Run Data'], avg_df_processed, df['Calibration Data'], start_time,
+                                           end_time=end_time).process(output_path=None,
+                                                                      chunk_minutes=chunk_minutes,
+                                                                      columns=run_columns)
+            measured['rows'] = len(run_df_processed)
         logging.info("RunData processed successfully.")
+        return run_df_processed
 
-        # Calculate summary
-        logging.info("Calculating summary.")
+    def calculate_summary():
         # Create an instance of SummaryCalculator and calculate summary on RunData
-        summary_calculator = SummaryCalculator()
-        summary = summary_calculator.calculate_summary(run_df_processed)
+        logging.info("Calculating summary.")
+        run_df_processed = run_stage.result()
+        with metrics.measure('SummaryCalculator') as measured:
+            if engine == 'legacy':
+                summary = LegacySummaryCalculator.calculate_summary(run_df_processed)
+            else:
+                summary = SummaryCalculator().calculate_summary(run_df_processed, output_path=None, phases=phases,
+                                                                peak_lengths=peak_lengths, top_k=top_k,
+                                                                peak_statistic=peak_statistic)
+            measured['rows'] = len(run_df_processed)
         logging.info("Summary calculated successfully.")
-        # Print the summary in JSON format
+        return summary
+
+    bluevis_stage = stage_cache.stage('BlueVisData', [loader.sheet_key('BlueVis Raw Data')],
+                                      {'memory_map': memory_map, 'engine': engine}, process_bluevis)
+    solaris_stage = stage_cache.stage('SolarisData', [loader.sheet_key('Solaris Data')],
+                                      {'memory_map': memory_map, 'engine': engine}, process_solaris)
+    averaged_stage = stage_cache.stage('AveragedData',
+                                       [bluevis_stage.key, solaris_stage.key, loader.sheet_key('AveragedData')],
+                                       {'backend': backend.name, 'engine': engine}, process_averaged)
+    run_stage = stage_cache.stage('RunData',
+                                  [averaged_stage.key, loader.sheet_key('Run Data'),
+                                   loader.sheet_key('Calibration Data')],
+                                  {'start_time': start_time, 'end_time': end_time, 'lag_minutes': 10,
+                                   'backend': backend.name, 'columns': run_columns, 'engine': engine},
+                                  process_run)
+    summary_stage = stage_cache.stage('SummaryCalculator', [run_stage.key],
+                                      {'phases': phases, 'peak_lengths': peak_lengths, 'top_k': top_k,
+                                       'peak_statistic': peak_statistic, 'engine': engine}, calculate_summary)
 
-        # Visualize data
+    # The profiled stage is run even when the stages that read it are found in the cache
+    for stage in [bluevis_stage, solaris_stage, averaged_stage, run_stage, summary_stage]:
+        if stage.name == profile_stage:
+            stage.result()
+
+    # Write the processed data as soon as it is available, whether it was computed or read from the cache. The
+    # writes (summary.json included) run on the output writer's thread and overlap with the stages that follow. The
+    # averaged data is an intermediate output and is only resolved and written on request.
+    writer = OutputWriter(output_format)
+    written_rows = 0
+    if write_intermediate:
+        avg_df_processed = averaged_stage.result()
+        writer.write(avg_df_processed, AveragedData(df['AveragedData'], None, None).headers(), output_dir,
+                     'averaged_data')
+        written_rows += len(avg_df_processed)
+    run_df_processed = run_stage.result()
+    writer.write(run_df_processed, RunData(df['Run Data'], None, None, start_time).headers(), output_dir, 'run_data')
+    written_rows += len(run_df_processed) if output_format != 'none' else 0
+
+    def visualize():
+        # Create an instance of DataVisualizer and render the interactive scatter plot to its files
         logging.info("Visualizing data.")
-        # Create an instance of DataVisualizer and generate interactive scatter plot
-        visualizer = DataVisualizer(run_df_processed)
-        visualizer.plot_interactive_scatter()
+        with metrics.measure('DataVisualizer') as measured:
+            visualizer = DataVisualizer(run_df_processed)
+            fig = visualizer.plot_interactive_scatter(os.path.join(output_dir, 'summary_scatterplot.png'), show=False,
+                                                      html_path=os.path.join(output_dir, 'summary_scatterplot.html')
+                                                      if plot_html else None,
+                                                      max_points=max_plot_points)
+            measured['rows'] = len(run_df_processed)
         logging.info("Data visualization completed successfully.")
+        return fig
+
+    # The plot only reads the run data, so it is rendered on the scheduler while the summary is calculated
+    plot_future = scheduler.submit(visualize) if plot else None
+    summary = summary_stage.result()
+    writer.submit(SummaryCalculator.write_json, summary, os.path.join(output_dir, 'summary.json'))
+    for stage in [bluevis_stage, solaris_stage, averaged_stage, run_stage, summary_stage]:
+        if stage.hit:
+            metrics.records.append({'name': stage.name, 'parent': None, 'cached': True})
+    if plot_future is not None:
+        fig = plot_future.result()
+        # The interactive plot is opened from the main thread once its files are written
+        if show_plot:
+            fig.show()
+
+    # Only the time spent waiting for the background writes to finish is measured here
+    with metrics.measure('Export') as measured:
+        writer.wait()
+        measured['rows'] = written_rows
+
+
+def verify_engines(input_file, start_time, output_dir='.', cache_dir='.circe_cache', use_cache=True,
+                   compute_backend='numpy'):
+    # Run the fast and legacy engines on the same workbook and write parity_report.csv and parity_report.json
+    # to output_dir. Returns the per-column report and the totals; the stage cache is not used for either engine.
+    os.makedirs(output_dir, exist_ok=True)
+    backend.use(compute_backend)
+    loader = WorkbookLoader(input_file, cache_dir=os.path.join(cache_dir, 'sheets') if use_cache else None)
+    df = loader.load()
+    checker = ParityChecker(df, BlueVisData(df['BlueVis Raw Data']).process(),
+                            SolarisData(df['Solaris Data']).process(), start_time)
+    report, timings = checker.verify()
+    result = ParityChecker.write_report(report, timings, output_dir)
+    logging.info(f"Engines {'agree' if result['passed'] else 'disagree'}; fast engine is "
+                 f"{result['speedup']['total']:.1f}x faster.")
+    return report, result
+
+
+if __name__ == "__main__":
+    # Set up logging to log to a file
+    logging.basicConfig(filename='data_processing.log', level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s', filemode='w')
+    args = parse_args()
+    logging.info(f"Imported the pipeline modules in {IMPORT_SECONDS:.3f} s.")
+    try:
+        if args.clear_cache:
+            logging.info(f"Clearing the cache directory {args.cache_dir}.")
+            StageCache.clear(args.cache_dir)
+
+        if args.verify:
+            report, result = verify_engines(args.input_file, args.start_time, output_dir=args.output_dir,
+                                            cache_dir=args.cache_dir, use_cache=not args.no_cache,
+                                            compute_backend=args.backend)
+            print(report.to_string(index=False))
+            print(f"{'PASSED' if result['passed'] else 'FAILED'}: {len(result['mismatched_columns'])} mismatched "
+                  f"column(s); speedup {result['speedup']['total']:.1f}x "
+                  f"({sum(result['seconds']['legacy'].values()):.2f} s legacy, "
+                  f"{sum(result['seconds']['fast'].values()):.2f} s fast).")
+            sys.exit(0 if result['passed'] else 1)
+
+        phases = SummaryCalculator.load_phases(args.phases) if args.phases else None
+        run_pipeline(args.input_file, args.start_time, output_dir=args.output_dir, cache_dir=args.cache_dir,
+                     use_cache=not args.no_cache, cache_size_mb=args.cache_size_mb, phases=phases,
+                     peak_lengths=args.peak_windows, top_k=args.top_k, peak_statistic=args.peak_statistic,
+                     show_plot=not args.headless, plot_html=args.plot_html, max_plot_points=args.max_plot_points,
+                     collect_metrics=args.metrics, profile_stage=args.profile, output_format=args.output_format,
+                     write_intermediate=args.intermediate, end_time=args.end_time,
+                     chunk_minutes=args.chunk_minutes, compute_backend=args.backend, summary_only=args.summary_only,
+                     engine=args.engine, memory_map=args.memory_map, workers=args.workers, plot=not args.no_plot)
 
     except Exception as e:
         # Log the exception if any error occurs and exit the script
@@ -0,0 +1,42 @@
+import numba
+import numpy as np
+
+# The loops of the 'numba' compute backend, compiled on first use and cached on disk. This module (and Numba with
+# it) is only imported once the backend runs, so other backends do not pay for importing Numba.
+
+
+@numba.njit(cache=True)
+def bin_means(sample_bins, values, n_bins):
+    # One pass over the samples for all columns, summing in sample order like np.bincount
+    sums = np.zeros((n_bins, values.shape[1]))
+    counts = np.zeros((n_bins, values.shape[1]), dtype=np.int64)
+    for sample in range(len(sample_bins)):
+        row = sample_bins[sample]
+        for i in range(values.shape[1]):
+            value = values[sample, i]
+            if not np.isnan(value):
+                sums[row, i] += value
+                counts[row, i] += 1
+    result = np.full((n_bins, values.shape[1]), np.nan)
+    for row in range(n_bins):
+        for i in range(values.shape[1]):
+            if counts[row, i] > 0:
+                result[row, i] = sums[row, i] / counts[row, i]
+    return result
+
+
+@numba.njit(cache=True)
+def lead_difference(current, ahead, lag):
+    result = current.copy()
+    for row in range(len(current) - lag):
+        result[row] = current[row] - ahead[row + lag]
+    return result
+
+
+@numba.njit(cache=True)
+def log_threshold(bg, bh):
+    result = np.empty(len(bg))
+    for row in range(len(bg)):
+        bound = -1.69 * np.log(bg[row]) + 8.17
+        result[row] = bh[row] if bound < bh[row] else bound
+    return result
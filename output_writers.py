@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from utils import Utils
+
+# Schema metadata key under which the Parquet and Feather files keep the original sheet header rows
+HEADER_METADATA_KEY = b'circe.headers'
+
+
+class OutputWriter:
+    # File extension of every output format; 'none' writes nothing
+    FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet', 'feather': '.feather', 'none': None}
+
+    def __init__(self, output_format='csv', background=True):
+        # Writes processed frames in the chosen format. With background=True the writes run one at a time on a
+        # worker thread, so they overlap with the stages that follow; wait() blocks until all are written.
+        if output_format not in self.FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}; choose from {', '.join(self.FORMATS)}")
+        self.output_format = output_format
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self.pending = []
+
+    def path(self, output_dir, name):
+        # Output file for `name` (e.g. 'run_data') in output_dir, or None when nothing is written
+        extension = self.FORMATS[self.output_format]
+        return os.path.join(output_dir, name + extension) if extension else None
+
+    def write(self, df, headers, output_dir, name):
+        # Queue df for writing under `headers` (the sheet header rows) and return the path it is written to. The
+        # frame must not be modified until wait() returns.
+        path = self.path(output_dir, name)
+        if path is None:
+            return None
+        if self.executor is None:
+            self.write_file(df, headers, path)
+        else:
+            self.pending.append(self.executor.submit(self.write_file, df, headers, path))
+        return path
+
+    def submit(self, function, *args):
+        # Queue another output (e.g. a JSON file) on the same worker thread as the data files
+        if self.executor is None:
+            function(*args)
+        else:
+            self.pending.append(self.executor.submit(function, *args))
+
+    def wait(self):
+        # Block until every queued write is done; the first failed write raises here
+        pending, self.pending = self.pending, []
+        for future in pending:
+            future.result()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    @staticmethod
+    def write_file(df, headers, path):
+        # Write df to path in the format given by its extension. CSV files keep the header rows as the CSV
+        # header (compressed when the path ends in .gz); Parquet and Feather files keep the Excel-style column
+        # names and store the header rows in the schema metadata.
+        if path.endswith(('.parquet', '.feather')):
+            OutputWriter.write_columnar(df, headers, path)
+        else:
+            df.set_axis(pd.MultiIndex.from_arrays(headers), axis=1).to_csv(path, index=False)
+        logging.info(f"Wrote {len(df)} rows to {path}.")
+
+    @staticmethod
+    def write_columnar(df, headers, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.feather as feather
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet and Feather outputs require pyarrow (pip install pyarrow)")
+        # Flag columns mix 1 with "" and are stored as numbers ("" becomes null, as it reads back from CSV)
+        df = df.apply(lambda col: pd.to_numeric(col.replace("", np.nan)) if col.dtype == object else col)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = {**(table.schema.metadata or {}),
+                    HEADER_METADATA_KEY: json.dumps([[str(value) for value in row] for row in headers])}
+        table = table.replace_schema_metadata(metadata)
+        if path.endswith('.parquet'):
+            pq.write_table(table, path)
+        else:
+            feather.write_feather(table, path)
+
+    @staticmethod
+    def read(path, header_rows):
+        # Read a file written by write_file back into a frame with Excel-style column names
+        if path.endswith(('.parquet', '.feather')):
+            return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_feather(path)
+        df = pd.read_csv(path, header=None, skiprows=header_rows, low_memory=False)
+        df.columns = Utils.excel_column_names(len(df.columns))
+        return df
+
+    @classmethod
+    def find(cls, output_dir, name):
+        # Most recently written output file for `name` in output_dir, in any format, or None
+        paths = [os.path.join(output_dir, name + extension) for extension in cls.FORMATS.values() if extension]
+        existing = [path for path in paths if os.path.exists(path)]
+        return max(existing, key=os.path.getmtime) if existing else None
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import time
+import numpy as np
+import pandas as pd
+from averaged_data import AveragedData
+from ingestion import SheetValidator
+from run_data import RunData
+from summary_calculator import SummaryCalculator
+from legacy_engine import LegacyAveragedData, LegacyRunData, LegacySummaryCalculator
+
+
+class ParityChecker:
+    # Processing engines: the current stages and the original row-wise ones of legacy_engine
+    ENGINES = ['fast', 'legacy']
+    # Stages run by each engine, in order
+    STAGES = ['AveragedData', 'RunData', 'SummaryCalculator']
+    # A value matches when |fast - legacy| <= ATOL + RTOL * |legacy|; missing values only match missing values
+    RTOL = 1e-9
+    ATOL = 1e-12
+
+    def __init__(self, sheets, bluevis_df, solaris_df, start_time):
+        # Runs both engines on the same parsed workbook. The BlueVis and Solaris sheets are the same for both
+        # engines, so they are processed once by the caller; every engine gets its own copies of the rest.
+        self.sheets = sheets
+        self.bluevis_df = bluevis_df
+        self.solaris_df = solaris_df
+        self.start_time = start_time
+        # The legacy run data always ends at 23:59 of the start day, so the fast engine is run over the same rows
+        self.end_time = pd.Timestamp(start_time).replace(hour=23, minute=59, second=0)
+
+    def run_engine(self, engine):
+        # Run AveragedData, RunData and SummaryCalculator with one engine. Returns {stage: output} and
+        # {stage: wall seconds}.
+        outputs, seconds = {}, {}
+        for stage in self.STAGES:
+            start = time.perf_counter()
+            if stage == 'AveragedData' and engine == 'legacy':
+                outputs[stage] = LegacyAveragedData(self.sheets['AveragedData'].copy(), self.bluevis_df,
+                                                    self.solaris_df.copy()).process()
+            elif stage == 'AveragedData':
+                # The fast engine reads the sensor sheets validated, as the pipeline does
+                outputs[stage] = AveragedData(
+                    self.sheets['AveragedData'].copy(),
+                    SheetValidator.validate(self.bluevis_df, 'BlueVis Raw Data', *AveragedData.BLUEVIS_COLUMNS),
+                    SheetValidator.validate(self.solaris_df, 'Solaris Data', *AveragedData.SOLARIS_COLUMNS)).process()
+            elif stage == 'RunData' and engine == 'legacy':
+                outputs[stage] = LegacyRunData(self.sheets['Run Data'], outputs['AveragedData'],
+                                               self.sheets['Calibration Data'], self.start_time).process()
+            elif stage == 'RunData':
+                outputs[stage] = RunData(self.sheets['Run Data'].copy(), outputs['AveragedData'],
+                                         self.sheets['Calibration Data'].copy(), self.start_time,
+                                         end_time=self.end_time).process()
+            elif engine == 'legacy':
+                outputs[stage] = LegacySummaryCalculator.calculate_summary(outputs['RunData'])
+            else:
+                outputs[stage] = SummaryCalculator.calculate_summary(outputs['RunData'], output_path=None)
+            seconds[stage] = time.perf_counter() - start
+            logging.info(f"{engine} {stage} took {seconds[stage]:.3f} s.")
+        return outputs, seconds
+
+    def verify(self):
+        # Run both engines and compare every output. Returns the per-column report (legacy as the reference) and
+        # the timings of both engines.
+        legacy, legacy_seconds = self.run_engine('legacy')
+        fast, fast_seconds = self.run_engine('fast')
+        report = pd.concat([self.compare_frames(legacy[stage], fast[stage]).assign(stage=stage)
+                            for stage in ['AveragedData', 'RunData']] +
+                           [self.compare_summaries(legacy['SummaryCalculator'], fast['SummaryCalculator'])
+                            .assign(stage='SummaryCalculator')], ignore_index=True)
+        report = report[['stage', 'column', 'max_abs_diff', 'max_rel_diff', 'mismatches']]
+        timings = {'legacy': legacy_seconds, 'fast': fast_seconds,
+                   'rows': {stage: [len(legacy[stage]), len(fast[stage])] for stage in ['AveragedData', 'RunData']}}
+        return report, timings
+
+    @staticmethod
+    def numeric(column):
+        # Values of a column as floats: timestamps as seconds since the epoch, "" and other text as NaN
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return np.where(column.isna(), np.nan, column.to_numpy(dtype='datetime64[ns]').astype('int64') / 1e9)
+        return pd.to_numeric(column.replace("", np.nan), errors='coerce').to_numpy(dtype=float)
+
+    @classmethod
+    def differences(cls, reference, candidate):
+        # Largest absolute and relative difference of two float arrays and the number of values that do not
+        # match. The relative difference is taken where the reference is not 0.
+        missing = np.isnan(reference) | np.isnan(candidate)
+        # Equal values differ by 0, also when they are infinite
+        difference = np.where(reference == candidate, 0.0, np.abs(reference - candidate))[~missing]
+        scale = np.abs(reference)[~missing]
+        relative = difference[scale > 0] / scale[scale > 0]
+        mismatches = ((np.isnan(reference) != np.isnan(candidate)).sum() +
+                      (difference > cls.ATOL + cls.RTOL * scale).sum())
+        return (difference.max() if len(difference) else 0.0, relative.max() if len(relative) else 0.0,
+                int(mismatches))
+
+    @classmethod
+    def compare_frames(cls, reference, candidate):
+        # One row per column holding a value in either frame, over the rows both frames have. Rows only one
+        # frame has count as mismatches of every column.
+        n_rows = min(len(reference), len(candidate))
+        rows = []
+        for col in reference.columns.union(candidate.columns, sort=False):
+            expected = cls.numeric(reference[col].iloc[:n_rows]) if col in reference else np.full(n_rows, np.nan)
+            actual = cls.numeric(candidate[col].iloc[:n_rows]) if col in candidate else np.full(n_rows, np.nan)
+            if np.isnan(expected).all() and np.isnan(actual).all() and (col in reference) == (col in candidate):
+                continue
+            max_abs, max_rel, mismatches = cls.differences(expected, actual)
+            rows.append({'column': col, 'max_abs_diff': max_abs, 'max_rel_diff': max_rel,
+                         'mismatches': mismatches + abs(len(reference) - len(candidate))})
+        return pd.DataFrame(rows, columns=['column', 'max_abs_diff', 'max_rel_diff', 'mismatches'])
+
+    @staticmethod
+    def flatten(summary, prefix=''):
+        # {'Growth/Totals/Hydrogen Consumed/Biomass/Value': value, ...} for every leaf of a summary
+        leaves = {}
+        for key, value in summary.items():
+            if isinstance(value, dict):
+                leaves.update(ParityChecker.flatten(value, f"{prefix}{key}/"))
+            else:
+                leaves[f"{prefix}{key}"] = value
+        return leaves
+
+    @classmethod
+    def compare_summaries(cls, reference, candidate):
+        # One row per numeric leaf of either summary; a text leaf only counts a mismatch when it differs
+        expected, actual = cls.flatten(reference), cls.flatten(candidate)
+        rows = []
+        for path in list(expected) + [path for path in actual if path not in expected]:
+            values = [expected.get(path), actual.get(path)]
+            if all(isinstance(value, str) for value in values):
+                if values[0] != values[1]:
+                    rows.append({'column': path, 'max_abs_diff': np.nan, 'max_rel_diff': np.nan, 'mismatches': 1})
+                continue
+            numbers = np.array([np.nan if value is None or isinstance(value, str) else value for value in values],
+                               dtype=float)
+            max_abs, max_rel, mismatches = cls.differences(numbers[:1], numbers[1:])
+            rows.append({'column': path, 'max_abs_diff': max_abs, 'max_rel_diff': max_rel, 'mismatches': mismatches})
+        return pd.DataFrame(rows, columns=['column', 'max_abs_diff', 'max_rel_diff', 'mismatches'])
+
+    @classmethod
+    def write_report(cls, report, timings, output_dir):
+        # Write the per-column report to parity_report.csv and the totals, timings and speedups to
+        # parity_report.json. Returns the totals.
+        report.to_csv(os.path.join(output_dir, 'parity_report.csv'), index=False)
+        legacy_total, fast_total = sum(timings['legacy'].values()), sum(timings['fast'].values())
+        result = {
+            'passed': bool(report['mismatches'].sum() == 0),
+            'mismatched_columns': [f"{row.stage}.{row.column}" for row in report.itertuples() if row.mismatches],
+            'max_abs_diff': {stage: float(group['max_abs_diff'].max()) for stage, group in report.groupby('stage')},
+            'max_rel_diff': {stage: float(group['max_rel_diff'].max()) for stage, group in report.groupby('stage')},
+            'tolerance': {'rtol': cls.RTOL, 'atol': cls.ATOL},
+            'rows': timings['rows'],
+            'seconds': {'legacy': timings['legacy'], 'fast': timings['fast']},
+            'speedup': {**{stage: timings['legacy'][stage] / timings['fast'][stage] for stage in cls.STAGES},
+                        'total': legacy_total / fast_total},
+        }
+        with open(os.path.join(output_dir, 'parity_report.json'), 'w') as f:
+            json.dump(result, f, indent=2)
+        return result
@@ -1,285 +1,300 @@
 import pandas as pd
 from utils import Utils
+from timestamp_join import TimestampIndex
+from column_graph import ColumnGraph
+from calibration import CalibrationTable
+from kernels import Kernels
+from backends import backend
+from instrumentation import metrics
+from output_writers import OutputWriter
+from schema import Schema
 import numpy as np
 
 class RunData:
-    def __init__(self, df, avg_df_processed, calibration_df,st):
+    # Column A holds 1 on the first row only and is kept as objects. P (total inlet flow) and AN (volume) are
+    # constants. AU to AW divide by the biomass in BB before BB is filled in, so they are 0 on every row.
+    # Columns that are declared nowhere (AI to AK, AM, AY to BA) are empty.
+    SCHEMA = Schema({
+        'A': 'object',
+        'B': 'datetime64[ns]',
+        **{letter: 'float64' for letter in ['C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'Q', 'R',
+                                            'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', 'AA', 'AB', 'AC', 'AD', 'AE',
+                                            'AF', 'AG', 'AH', 'AL', 'AO', 'AP', 'AQ', 'AR', 'AS', 'AT', 'AX', 'BB',
+                                            'BC', 'BD', 'BE', 'BF', 'BG', 'BH', 'BI', 'BJ', 'BK', 'BL']},
+    }, constants={'P': 1.5, 'AN': 2.24, 'AU': 0, 'AV': 0, 'AW': 0})
+
+    def __init__(self, df, avg_df_processed, calibration_df,st, lag_minutes=10, end_time=None):
         # Initialize with raw data, processed average data, and calibration data
         self.raw_df = df
         self.avg_df_processed = avg_df_processed
         self.calibration_df = calibration_df
         self.processed_df = None
         self.start_time=st
+        # Number of minutes (rows) ahead used by columns AE to AG
+        self.lag_minutes = lag_minutes
+        # Last minute of the run; None follows the averaged data to its end
+        self.end_time = end_time
 
-    def process(self):
-        # Extract header rows from raw data
-        header_rows = self.raw_df.iloc[:3].fillna('')
-        # Create MultiIndex columns from header rows
-        run_df_columns = pd.MultiIndex.from_arrays(header_rows.values)
+    def process(self, output_path=None, chunk_minutes=None, columns=None):
         # Set columns of raw DataFrame using utils function
-        self.raw_df.columns = Utils.excel_column_names(len(run_df_columns))
-        # Extract run data from raw DataFrame, excluding header rows
-        run_df = self.raw_df.iloc[3:].reset_index(drop=True)
+        self.raw_df.columns = Utils.excel_column_names(len(self.raw_df.columns))
+
+        # Compute every minute of the run, at once or in blocks of chunk_minutes. With `columns`, only the derived
+        # columns these need are computed.
+        if chunk_minutes:
+            self.processed_df = Utils.assemble(self.iter_chunks(chunk_minutes, columns), len(self.time_axis()))
+        else:
+            self.processed_df = self.compute_rows(self.time_axis(), 0, columns=columns)
 
-        # Create a DataFrame for processed run data with appropriate column names
-        self.processed_df = pd.DataFrame(columns=Utils.excel_column_names(len(run_df_columns)))
-        # Define start time and create time range for processed data (1-minute intervals)
+        # Save the run data (only when output_path is given)
+        if output_path:
+            self.export(self.processed_df, output_path)
+        # Return the processed DataFrame
+        return self.processed_df
+
+    def time_axis(self):
+        # Define start time and create time range for processed data (1-minute intervals). The run ends at
+        # end_time, or by default at the last minute of the averaged data, so runs of several days are covered.
         start_time = pd.Timestamp(self.start_time)
-        time_range = pd.date_range(start=start_time, end=start_time.replace(hour=23, minute=59, second=0), freq='1T')
-        # Reindex processed DataFrame to match the time range
-        self.processed_df = self.processed_df.reindex(range(len(time_range)))
+        end_time = pd.Timestamp(self.end_time) if self.end_time is not None else self.avg_df_processed['C'].iloc[-1]
+        time_range = pd.date_range(start=start_time, end=end_time, freq='1min')
+        if len(time_range) == 0:
+            raise ValueError(f"Run start time {start_time} is after the end of the run ({end_time})")
+        return time_range
+
+    def iter_chunks(self, chunk_minutes, columns=None):
+        # Compute the run in consecutive blocks of chunk_minutes rows. Each block is computed with the row before
+        # it (for the BD to BF steps) and the lag_minutes rows after it (for AE to AG), so the blocks join up to
+        # exactly the rows of a single computation while the working memory stays that of one block.
+        time_range = self.time_axis()
+        # Compile the calibration tables once for all blocks
+        if not isinstance(self.calibration_df, CalibrationTable):
+            self.calibration_df = CalibrationTable.from_sheet(self.calibration_df)
+        for start_row in range(0, len(time_range), chunk_minutes):
+            yield self.compute_rows(time_range, start_row, min(start_row + chunk_minutes, len(time_range)), columns)
+
+    def compute_rows(self, time_range, start_row, end_row=None, columns=None):
+        # Compute the run rows for minutes start_row up to end_row (default: the end) of `time_range`. The row
+        # before start_row is computed too, because BD to BF difference column C with the previous row, and so
+        # are the lag_minutes rows after end_row, which AE to AG look ahead to; both are dropped afterwards.
+        # Only the derived columns needed for `columns` are computed (all of them when None); the others stay
+        # empty.
+        end_row = len(time_range) if end_row is None else end_row
+        first = max(start_row - 1, 0)
+        last = min(end_row + self.lag_minutes, len(time_range))
+        timer = metrics.blocks('RunData')
+
+        # Create the processed run data with one empty column of the declared dtype per sheet column
+        processed_df = self.SCHEMA.empty(Utils.excel_column_names(len(self.raw_df.columns)), last - first)
         # Initialize some values in processed DataFrame
-        self.processed_df.loc[0, 'A'] = 1
-        self.processed_df['B'] = time_range
+        if first == 0:
+            processed_df.loc[0, 'A'] = 1
+        processed_df['B'] = time_range[first:last]
         # Calculate time difference in hours from the starting time
-        self.processed_df['C'] = (self.processed_df['B'] - self.processed_df.iloc[0, 1]).dt.total_seconds() / 3600
-
-        # Process columns D to K using data from averaged DataFrame
-        # Iterate through columns D to K and corresponding columns in avg_df_processed (3 to 10)
-        for col, avg_col in zip(['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K'], range(3, 11)):
-            # Assign values from avg_df_processed based on time match, handle missing data with 0 or ""
-            self.processed_df[col] = self.processed_df['B'].apply(
-                lambda x: self.avg_df_processed.iloc[
-                    self.avg_df_processed.index[self.avg_df_processed['C'] == x].tolist()[0], avg_col]
-                if (self.avg_df_processed['C'] == x).any() else 0 if pd.notna(x) else ""
-            )
-
-        # Process calibration data
-        # Extract header rows from calibration DataFrame
-        header_rows = self.calibration_df.iloc[:9].fillna('')
-        # Create MultiIndex columns from calibration header rows
-        calibration_df_columns = pd.MultiIndex.from_arrays(header_rows.values)
-        # Set columns of calibration DataFrame using utils function
-        self.calibration_df.columns = Utils.excel_column_names(len(calibration_df_columns))
-        # Extract a subset of calibration data for later use
-        calibration_sep_df = self.calibration_df.iloc[1:5, 1:13].set_index('B')
-        # Extract the main part of calibration data
-        self.calibration_df = self.calibration_df.iloc[9:].reset_index(drop=True)
-
-
-        #Process column M based on calibration data and column J
-        self.processed_df['M'] = self.processed_df.apply(
-            lambda row: (
-                    row['J'] / 100
-                    - (
-                        calibration_sep_df['L'].iloc[2]
-                        if row['J'] / 100 < self.calibration_df['I'].iloc[5] else
-                        calibration_sep_df['L'].iloc[5]  # 'Calibration Data'!L$6
-                        if calibration_sep_df['I'].iloc[5] <= row['J'] / 100 < self.calibration_df['I'].iloc[4] else
-                        calibration_sep_df['L'].iloc[4]  # 'Calibration Data'!L$5
-                        if calibration_sep_df['I'].iloc[4] <= row['J'] / 100 < self.calibration_df['I'].iloc[3] else
-                        calibration_sep_df['L'].iloc[3]  # 'Calibration Data'!L$4
-                    )
-            ) if pd.notna(row['J']) else 0,
-            axis=1
-        )
-        #Ensure values in column M are non-negative.
-        self.processed_df['M'] = self.processed_df['M'].apply(lambda x: x if x >= 0 else 0)
-
-        #Process column N based on calibration data and columns H and D
-        self.processed_df['N'] = self.processed_df.apply(
-            lambda row: (
-                    (row['H'] / 100) / (1 - row['D'] / 100)
-                    - (
-                        calibration_sep_df.loc[
-                            calibration_sep_df['J'] > row['H'] / 100, 'M'
-                        ].iloc[0]  # Use the first match from calibration_df based on the condition
-                    )
-            ) if pd.notna(row['H']) and pd.notna(row['D']) else 0,
-            axis=1
-        )
-        #Ensure values in column N are non-negative.
-        self.processed_df['N'] = self.processed_df['N'].apply(lambda x: x if x >= 0 else 0)
-
-        #Process column L based on calibration data and columns K, M, and N
-        self.processed_df['L'] = self.processed_df.apply(
-            lambda row: (
-                    (row['K'] + (9.404 * row['M'] - 0.818 * row['N'])) / 100
-                    - (
-                        calibration_sep_df.loc[
-                            calibration_sep_df['H'] > row['K'] / 100, 'K'
-                        ].iloc[0]  # Use the first match from calibration_df for corresponding conditions
-                    )
-            ) if pd.notna(row['K']) and pd.notna(row['M']) and pd.notna(row['N']) else 0,
-            axis=1
-        )
-        #Ensure values in column L are non-negative.
-        self.processed_df['L'] = self.processed_df['L'].apply(lambda x: x if x >= 0 else 0)
-
-        # Calculate columns O to U based on previously processed columns
-        self.processed_df['O'] = (1 - (self.processed_df['L'] + self.processed_df['M'] + self.processed_df['N']))
-        self.processed_df['P'] = self.processed_df['P'].apply(lambda x: 1.5)
-        self.processed_df['Q'] = self.processed_df['P'] / self.processed_df['O']
-        self.processed_df['R'] = self.processed_df['Q'] * self.processed_df['L']
-        self.processed_df['S'] = self.processed_df['Q'] * self.processed_df['M']
-        self.processed_df['T'] = self.processed_df['Q'] * self.processed_df['N']
-        self.processed_df['U'] = self.processed_df['Q'] * self.processed_df['O']
+        processed_df['C'] = (processed_df['B'] - time_range[0]).dt.total_seconds() / 3600
+
+        # Evaluate the derived columns in dependency order
+        self.COLUMNS.evaluate(self, processed_df, columns, timer)
+
+        # Give the columns their declared dtypes and write the constant columns
+        self.SCHEMA.conform(processed_df)
+
+        # Drop the context rows and label the rows with their position in the full time range
+        processed_df = processed_df.iloc[start_row - first:end_row - first]
+        processed_df.index = pd.RangeIndex(start_row, end_row)
+        return processed_df
+
+    # Derived columns, each declared with the columns and shared intermediates it reads. The constants P and AN
+    # (and AU to AW) come from SCHEMA.
+    COLUMNS = ColumnGraph(base=['B', 'C'])
+
+    @COLUMNS.node(['averaged_filled', 'averaged_matched'], ['B'], 'averaged_join')
+    def _join_averaged(self, df, shared):
+        # Index the averaged data once on its timestamp column ('C') and align every column needed below
+        # with the run timestamps ('B') in a single join instead of scanning avg_df_processed row by row
+        # (only the averaged rows inside the computed time range are indexed)
+        first_avg_row = self.avg_df_processed['C'].searchsorted(df['B'].iloc[0], side='left')
+        last_avg_row = self.avg_df_processed['C'].searchsorted(df['B'].iloc[-1], side='right')
+        avg_index = TimestampIndex(self.avg_df_processed.iloc[first_avg_row:last_avg_row], 'C')
+        # Columns D to K (and AH, AL) fall back to 0 when a timestamp has no averaged data
+        shared['averaged_filled'] = avg_index.align(df['B'], ['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'AP', 'AN'],
+                                                    fill_value=0)
+        # The remaining columns fall back to NaN (the averaged data is typed by AveragedData.SCHEMA, so it holds
+        # no empty strings to treat as missing)
+        shared['averaged_matched'] = avg_index.align(df['B'], ['X', 'V', 'T', 'AS', 'AT', 'Q', 'R'])
+
+    @COLUMNS.node(['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K'], ['averaged_filled'], 'averaged_join')
+    def _averaged_gas_readings(self, df, shared):
+        # Process columns D to K using data from averaged DataFrame, handle missing data with 0
+        for col in ['D', 'E', 'F', 'G', 'H', 'I', 'J', 'K']:
+            df[col] = shared['averaged_filled'][col]
+
+    @COLUMNS.node(['calibration'], [], 'calibration')
+    def _calibration(self, df, shared):
+        # Process calibration data: compile the sheet into lookup tables, or reuse an already compiled table
+        shared['calibration'] = (self.calibration_df if isinstance(self.calibration_df, CalibrationTable)
+                                 else CalibrationTable.from_sheet(self.calibration_df))
+
+    @COLUMNS.node(['M'], ['J', 'calibration'], 'calibration')
+    def _calibrated_co2(self, df, shared):
+        # Process column M based on calibration data and column J
+        j = (df['J'] / 100).to_numpy(dtype=float)
+        valid = ~np.isnan(j)
+        m = np.zeros(len(j))
+        m[valid] = j[valid] - shared['calibration'].m_offset(j[valid])
+        # Ensure values in column M are non-negative.
+        df['M'] = np.where(m >= 0, m, 0)
+
+    @COLUMNS.node(['N'], ['H', 'D', 'calibration'], 'calibration')
+    def _calibrated_o2(self, df, shared):
+        # Process column N based on calibration data and columns H and D
+        h = df['H'].to_numpy(dtype=float)
+        d = df['D'].to_numpy(dtype=float)
+        valid = ~np.isnan(h) & ~np.isnan(d)
+        n = np.zeros(len(h))
+        n[valid] = (h[valid] / 100) / (1 - d[valid] / 100) - shared['calibration'].n_offset(h[valid] / 100)
+        # Ensure values in column N are non-negative.
+        df['N'] = np.where(n >= 0, n, 0)
+
+    @COLUMNS.node(['L'], ['K', 'M', 'N', 'calibration'], 'calibration')
+    def _calibrated_h2(self, df, shared):
+        # Process column L based on calibration data and columns K, M, and N
+        k = df['K'].to_numpy(dtype=float)
+        m = df['M'].to_numpy(dtype=float)
+        n = df['N'].to_numpy(dtype=float)
+        valid = ~np.isnan(k) & ~np.isnan(m) & ~np.isnan(n)
+        l = np.zeros(len(k))
+        l[valid] = ((k[valid] + (9.404 * m[valid] - 0.818 * n[valid])) / 100
+                    - shared['calibration'].l_offset(k[valid] / 100))
+        # Ensure values in column L are non-negative.
+        df['L'] = np.where(l >= 0, l, 0)
+
+    @COLUMNS.node(['O', 'Q'], ['L', 'M', 'N'], 'gas_fractions')
+    def _total_flow(self, df, shared):
+        # Calculate columns O and Q based on previously processed columns
+        df['O'] = (1 - (df['L'] + df['M'] + df['N']))
+        df['Q'] = self.SCHEMA.constants['P'] / df['O']
+
+    @COLUMNS.node(['R', 'S', 'T', 'U'], ['Q', 'L', 'M', 'N', 'O'], 'gas_fractions')
+    def _inlet_flows(self, df, shared):
+        # Calculate columns R to U based on previously processed columns
+        df['R'] = df['Q'] * df['L']
+        df['S'] = df['Q'] * df['M']
+        df['T'] = df['Q'] * df['N']
+        df['U'] = df['Q'] * df['O']
 
+    @COLUMNS.node(['V', 'W', 'X'], ['averaged_matched'], 'gas_fractions')
+    def _outlet_flows(self, df, shared):
         # Process columns V, W, X from averaged data
-        self.processed_df['V'] = self.processed_df['B'].apply(
-            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'X'].values[0]
-            if (self.avg_df_processed['C'] == x).any() else None if pd.notna(x) else None
-        )
-
-        self.processed_df['W'] = self.processed_df['B'].apply(
-            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'V'].values[0]
-            if (self.avg_df_processed['C'] == x).any() else None if pd.notna(x) else None
-        )
-
-        self.processed_df['X'] = self.processed_df['B'].apply(
-            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'T'].values[0]
-            if (self.avg_df_processed['C'] == x).any() else None if pd.notna(x) else None
-        )
-
-        # Calculate columns Y to AD based on previously processed columns
-        self.processed_df['Y'] = self.processed_df['R'] * 0.081505
-        self.processed_df['Z'] = self.processed_df['S'] * 1.7893
-        self.processed_df['AA'] = self.processed_df['T'] * 1.2954
-        self.processed_df['AB'] = self.processed_df['V'] * 0.083732
-        self.processed_df['AC'] = self.processed_df['W'] * 1.8389
-        self.processed_df['AD'] = self.processed_df['X'] * 1.3309
-
-        # Calculate columns AE to AG using a rolling calculation
-        self.processed_df['AE'] = self.processed_df.index.map(
-            lambda i: (
-                (self.processed_df.loc[i, 'AB'] - self.processed_df.loc[i + 10, 'Y']) * 60
-                if i <= self.processed_df.index.max() - 10
-                else self.processed_df.loc[i, 'AB'] * 60
-            )
-        )
-        self.processed_df['AF'] = self.processed_df.index.map(
-            lambda i: (
-                (self.processed_df.loc[i, 'AC'] - self.processed_df.loc[i + 10, 'Z']) * 60
-                if i <= self.processed_df.index.max() - 10
-                else self.processed_df.loc[i, 'AC'] * 60
-            )
-        )
-        self.processed_df['AG'] = (self.processed_df.index.map(
-            lambda i: (
-                (self.processed_df.loc[i, 'AD'] - self.processed_df.loc[i + 10, 'AA']) * 60
-                if i <= self.processed_df.index.max() - 10
-                else self.processed_df.loc[i, 'AD'] * 60
-            )
-        ))
-
-        # Process columns AH and AL from averaged data, handling potential zero values
-        self.processed_df['AH'] = self.processed_df['B'].apply(
-            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AP'].values[0]
-            if (self.avg_df_processed['C'] == x).any() and
-               self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AP'].values[0] != 0
-            else 0 if pd.notna(x) else 0
-        )
-
-        self.processed_df['AL'] = self.processed_df['B'].apply(
-            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AN'].values[0]
-            if (self.avg_df_processed['C'] == x).any() and
-               self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AN'].values[0] != 0
-            else 0 if pd.notna(x) else 0
-        )
-
-        # Calculate columns AM to AT based on previously processed columns
-        self.processed_df['AM'] = self.processed_df['AF'] + self.processed_df['AK']
-        self.processed_df['AN'] = self.processed_df['AN'].apply(lambda x: 2.24)
-        self.processed_df['AO'] = self.processed_df['AE'] / self.processed_df['AN']
-        self.processed_df['AP'] = self.processed_df['AF'] / self.processed_df['AN']
-        self.processed_df['AQ'] = self.processed_df['AG'] / self.processed_df['AN']
-        self.processed_df['AR'] = self.processed_df['AO'] / 2.016 * 1000
-        self.processed_df['AR'] = self.processed_df['AR'].apply(lambda x: x if x <= 100 and x >= -100 else 0)
-        self.processed_df['AS'] = self.processed_df['AP'] / 44.01 * 1000
-        self.processed_df['AS'] = self.processed_df['AS'].apply(lambda x: x if x <= 100 and x >= -100 else 0)
-        self.processed_df['AT'] = self.processed_df['AQ'] / 31.999 * 1000
-        self.processed_df['AT'] = self.processed_df['AT'].apply(lambda x: x if x <= 100 and x >= -100 else 0)
-
-        # Calculate columns AU to AX based on previously processed columns, handling division by zero
-        self.processed_df['AU'] = self.processed_df.apply(
-            lambda row: (row['AO'] / row['BB']) if pd.notna(row['BB']) and row['BB'] != 0 else 0, axis=1)
-        self.processed_df['AV'] = self.processed_df.apply(
-            lambda row: (row['AP'] / row['BB']) if pd.notna(row['BB']) and row['BB'] != 0 else 0, axis=1)
-        self.processed_df['AW'] = self.processed_df.apply(
-            lambda row: (row['AQ'] / row['BB']) if pd.notna(row['BB']) and row['BB'] != 0 else 0, axis=1)
-        self.processed_df['AX'] = self.processed_df.apply(
-            lambda row: (row['AS'] * -1 / row['AT']) if pd.notna(row['AT']) and row['AT'] != 0 else 0, axis=1)
-
-        # Process columns BB and BC from averaged data, handling missing data and zero values
-        self.processed_df['BB'] = self.processed_df['B'].apply(
-            lambda x: self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AS'].values[0]
-            if (self.avg_df_processed['C'] == x).any() and
-               self.avg_df_processed.loc[self.avg_df_processed['C'] == x, 'AS'].values[0] != ""
-            else None if pd.notna(x) else None
-        )
-
-        self.processed_df['BC'] = self.processed_df.apply(
-            lambda row: row['BB'] * (
-                        self.avg_df_processed.loc[self.avg_df_processed['C'] == row['B'], 'AT'].values[0] / 100)
-            if (self.avg_df_processed['C'] == row['B']).any() and
-               self.avg_df_processed.loc[self.avg_df_processed['C'] == row['B'], 'AT'].values[0] != ""
-            else None if pd.notna(row['B']) else None, axis=1
-        )
-
-        # Calculate columns BD, BE, BF using rolling calculations, handling potential errors
-        self.processed_df['BD'] = self.processed_df.apply(
-            lambda row: self.processed_df.loc[row.name, ['AO', 'AO']].mean() * self.processed_df.loc[
-                row.name, ['AN', 'AN']].mean() * (
-                                self.processed_df.loc[row.name, 'C'] - self.processed_df.loc[row.name - 1, 'C'])
-            if row.name > 0 else 0, axis=1
-        )
-        self.processed_df['BD'].fillna(0, inplace=True)
-
-        self.processed_df['BE'] = self.processed_df.apply(
-            lambda row: self.processed_df.loc[row.name, ['AP', 'AP']].mean() * self.processed_df.loc[
-                row.name, ['AN', 'AN']].mean() * (
-                                self.processed_df.loc[row.name, 'C'] - self.processed_df.loc[row.name - 1, 'C'])
-            if row.name > 0 else 0, axis=1
-        )
-        self.processed_df['BE'].fillna(0, inplace=True)
-
-        self.processed_df['BF'] = self.processed_df.apply(
-            lambda row: self.processed_df.loc[row.name, ['AQ', 'AQ']].mean() * self.processed_df.loc[
-                row.name, ['AN', 'AN']].mean() * (
-                                self.processed_df.loc[row.name, 'C'] - self.processed_df.loc[row.name - 1, 'C'])
-            if row.name > 0 else 0, axis=1
-        )
-        self.processed_df['BF'].fillna(0, inplace=True)
-
-
-        # Process columns BG and BH from averaged data, handling missing data and empty strings
-        self.processed_df['BG'] = self.processed_df['B'].apply(
-            lambda b_value: self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'Q'].values[0]
-            if len(self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'Q']) > 0 and
-               self.avg_df_processed.loc[
-                   self.avg_df_processed['C'] == b_value, 'Q'].values[0] != ""
-            else None if pd.notna(b_value) else None
-        )
-
-        self.processed_df['BH'] = self.processed_df['B'].apply(
-            lambda b_value: self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'R'].values[0]
-            if len(self.avg_df_processed.loc[self.avg_df_processed['C'] == b_value, 'R']) > 0 and
-               self.avg_df_processed.loc[
-                   self.avg_df_processed['C'] == b_value, 'R'].values[0] != ""
-            else None if pd.notna(b_value) else None
-        )
-
-        # Calculate column BI based on BG and BH, using a conditional statement
-        self.processed_df['BI'] = self.processed_df.apply(
-            lambda row: row['BH'] if (-1.69 * np.log(row['BG']) + 8.17) < row['BH'] else (
-                        -1.69 * np.log(row['BG']) + 8.17),
-            axis=1
-        )
-
-        # Calculate columns BJ and BK based on previously processed columns
-        self.processed_df['BJ'] = (self.processed_df[['V', 'W', 'X']].sum(axis=1)) / (1000 * 60 * 0.1026)
-        self.processed_df['BK'] = (self.processed_df['AQ'] / (3.5 - self.processed_df['BH'])) * 1000
-
-        #This line seems to have an error, using arbitrary value for processed_df['BL'].iloc[2]
-        self.processed_df['BL'] = 0.95 * (self.processed_df['BG'] / (self.processed_df['AN']) ** 0.6) * (
-                    self.processed_df['BJ'] ** 0.6) * 3600 * self.processed_df['BL'].iloc[2] #Arbitrary value used here. Needs fixing.
-
-        # Create copies of the processed DataFrame for different purposes
-        run_df_processed = self.processed_df.copy()
-        run_df = self.processed_df.copy()
-        # Set the original MultiIndex columns back to the run_df DataFrame.
-        run_df.columns = run_df_columns
-        # Save the run data to a CSV file
-        run_df.to_csv('run_data.csv', index=False)
-        # Return the processed DataFrame
-        return run_df_processed
\ No newline at end of file
+        df['V'] = shared['averaged_matched']['X']
+        df['W'] = shared['averaged_matched']['V']
+        df['X'] = shared['averaged_matched']['T']
+
+    @COLUMNS.node(['Y', 'Z', 'AA'], ['R', 'S', 'T'], 'gas_fractions')
+    def _inlet_mass_flows(self, df, shared):
+        # Calculate columns Y to AA based on previously processed columns
+        df['Y'] = df['R'] * 0.081505
+        df['Z'] = df['S'] * 1.7893
+        df['AA'] = df['T'] * 1.2954
+
+    @COLUMNS.node(['AB', 'AC', 'AD'], ['V', 'W', 'X'], 'gas_fractions')
+    def _outlet_mass_flows(self, df, shared):
+        # Calculate columns AB to AD based on previously processed columns
+        df['AB'] = df['V'] * 0.083732
+        df['AC'] = df['W'] * 1.8389
+        df['AD'] = df['X'] * 1.3309
+
+    @COLUMNS.node(['AE', 'AF', 'AG'], ['AB', 'AC', 'AD', 'Y', 'Z', 'AA'], 'consumption_rates')
+    def _uptakes(self, df, shared):
+        # Calculate columns AE to AG as the difference with the row `lag_minutes` ahead
+        df['AE'] = backend.lead_difference(df['AB'], df['Y'], self.lag_minutes) * 60
+        df['AF'] = backend.lead_difference(df['AC'], df['Z'], self.lag_minutes) * 60
+        df['AG'] = backend.lead_difference(df['AD'], df['AA'], self.lag_minutes) * 60
+
+    @COLUMNS.node(['AH', 'AL'], ['averaged_filled'], 'consumption_rates')
+    def _averaged_ap_an(self, df, shared):
+        # Process columns AH and AL from averaged data; zero values and missing timestamps both give 0
+        df['AH'] = shared['averaged_filled']['AP']
+        df['AL'] = shared['averaged_filled']['AN']
+
+    @COLUMNS.node(['AM'], ['AF'], 'consumption_rates')
+    def _am(self, df, shared):
+        # Column AK is empty, so AM is too
+        df['AM'] = df['AF'] + df['AK']
+
+    @COLUMNS.node(['AO', 'AP', 'AQ'], ['AE', 'AF', 'AG'], 'consumption_rates')
+    def _uptakes_per_volume(self, df, shared):
+        volume = self.SCHEMA.constants['AN']
+        df['AO'] = df['AE'] / volume
+        df['AP'] = df['AF'] / volume
+        df['AQ'] = df['AG'] / volume
+
+    @COLUMNS.node(['AR', 'AS', 'AT'], ['AO', 'AP', 'AQ'], 'consumption_rates')
+    def _uptake_rates(self, df, shared):
+        # Rates outside -100..100 (and missing rates) are set to 0
+        for col, rate_col, molar_mass in [('AR', 'AO', 2.016), ('AS', 'AP', 44.01), ('AT', 'AQ', 31.999)]:
+            rate = df[rate_col].to_numpy() / molar_mass * 1000
+            df[col] = np.where((rate <= 100) & (rate >= -100), rate, 0)
+
+    @COLUMNS.node(['AX'], ['AS', 'AT'], 'biomass_ratios')
+    def _co2_o2_ratio(self, df, shared):
+        # Calculate column AX based on previously processed columns, handling division by zero (AU to AW are
+        # constant, see SCHEMA)
+        at = df['AT'].to_numpy()
+        usable = ~np.isnan(at) & (at != 0)
+        ax = np.zeros(len(at))
+        ax[usable] = df['AS'].to_numpy()[usable] * -1 / at[usable]
+        df['AX'] = ax
+
+    @COLUMNS.node(['BB', 'BC'], ['averaged_matched'], 'integrals')
+    def _biomass(self, df, shared):
+        # Process columns BB and BC from averaged data, handling missing data and empty values
+        df['BB'] = shared['averaged_matched']['AS']
+        df['BC'] = df['BB'] * (shared['averaged_matched']['AT'] / 100)
+
+    @COLUMNS.node(['BD', 'BE', 'BF'], ['AO', 'AP', 'AQ', 'C'], 'integrals')
+    def _consumed(self, df, shared):
+        # Calculate columns BD, BE, BF as trapezoid steps over the elapsed time in column C
+        for col, rate_col in zip(['BD', 'BE', 'BF'], ['AO', 'AP', 'AQ']):
+            rate = df[rate_col] * self.SCHEMA.constants['AN']
+            df[col] = Kernels.trapezoid_steps(rate, rate, df['C'])
+
+    @COLUMNS.node(['BG', 'BH'], ['averaged_matched'], 'derived_columns')
+    def _averaged_q_r(self, df, shared):
+        # Process columns BG and BH from averaged data (NaN where a timestamp has no averaged data)
+        df['BG'] = shared['averaged_matched']['Q']
+        df['BH'] = shared['averaged_matched']['R']
+
+    @COLUMNS.node(['BI'], ['BG', 'BH'], 'derived_columns')
+    def _bounded_r(self, df, shared):
+        # Calculate column BI as the larger of BH and -1.69 ln(BG) + 8.17 (the latter when BH is missing)
+        df['BI'] = backend.log_threshold(df['BG'], df['BH'])
+
+    @COLUMNS.node(['BJ'], ['V', 'W', 'X'], 'derived_columns')
+    def _outlet_flow_sum(self, df, shared):
+        df['BJ'] = (df[['V', 'W', 'X']].sum(axis=1)) / (1000 * 60 * 0.1026)
+
+    @COLUMNS.node(['BK'], ['AQ', 'BH'], 'derived_columns')
+    def _bk(self, df, shared):
+        df['BK'] = (df['AQ'] / (3.5 - df['BH'])) * 1000
+
+    @COLUMNS.node(['BL'], ['BG', 'BJ'], 'derived_columns')
+    def _bl(self, df, shared):
+        #This line seems to have an error, using arbitrary value for BL of the third run row. That cell is itself
+        # empty when it is read, so BL is NaN on every row.
+        third_row_bl = np.nan
+        df['BL'] = 0.95 * (df['BG'] / self.SCHEMA.constants['AN'] ** 0.6) * (
+                    df['BJ'] ** 0.6) * 3600 * third_row_bl #Arbitrary value used here. Needs fixing.
+
+    def headers(self):
+        # The original three header rows of the 'Run Data' sheet
+        return self.raw_df.iloc[:3].fillna('').values
+
+    def export(self, run_df_processed, output_path='run_data.csv'):
+        # Write processed run data under the original headers, in the format given by the file extension
+        OutputWriter.write_file(run_df_processed, self.headers(), output_path)
+
+    @staticmethod
+    def read_export(path):
+        # Read a file written by export back into a frame with Excel-style column names
+        return OutputWriter.read(path, header_rows=3)
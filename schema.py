@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+
+class Schema:
+    def __init__(self, columns, constants=None):
+        # Declared layout of a processed frame. `columns` maps the Excel letter of every computed column to its
+        # dtype; `constants` maps the letters of columns that hold the same value on every row to that value. The
+        # stages compute with the constants as scalars; conform() writes them out as full columns of every frame
+        # (or chunk) a stage returns, which is what the sheet layout and the outputs expect.
+        # Letters that are declared nowhere are empty columns of the sheet and stay float NaN.
+        self.columns = columns
+        self.constants = constants or {}
+
+    def dtype(self, letter):
+        if letter in self.columns:
+            return self.columns[letter]
+        if letter in self.constants:
+            return np.asarray(self.constants[letter]).dtype
+        return 'float64'
+
+    def empty(self, letters, n_rows):
+        # Frame of n_rows with one empty column of the declared dtype per letter, allocated in one go
+        data = {}
+        for letter in letters:
+            dtype = np.dtype(self.dtype(letter))
+            empty_value = np.datetime64('NaT') if dtype.kind == 'M' else np.nan
+            data[letter] = np.full(n_rows, empty_value, dtype=dtype if dtype.kind in 'fMO' else 'float64')
+        return pd.DataFrame(data)
+
+    def conform(self, df):
+        # Give every declared column its dtype and write the constant columns. Columns that already have their
+        # dtype are left as they are.
+        for letter, dtype in self.columns.items():
+            if letter in df.columns and df[letter].dtype != dtype:
+                df[letter] = df[letter].astype(dtype)
+        for letter, value in self.constants.items():
+            if letter in df.columns:
+                df[letter] = np.full(len(df), value)
+        return df
+
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from ingestion import SheetValidator
+
+
+class SensorStore:
+    # A raw sensor sheet converted once into typed arrays on disk: one int64 nanosecond array per timestamp column
+    # (NaT as the smallest int64) and one float64 array per channel, saved as .npy files and opened memory-mapped.
+    # Slices of the arrays are views of the files, so reading a window of samples only pages in that window and
+    # resident memory does not grow with the length of the run.
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.n_rows = meta['rows']
+        self.time_columns = meta['time_columns']
+        self.channels = meta['channels']
+        self.arrays = {col: np.load(self.array_path(directory, col), mmap_mode='r')
+                       for col in self.time_columns + self.channels}
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getstate__(self):
+        # Pickled (e.g. by the stage cache) as its directory; the arrays are mapped again when unpickled
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    @staticmethod
+    def array_path(directory, column):
+        return os.path.join(directory, f"{column}.npy")
+
+    @staticmethod
+    def to_ns(column):
+        # Timestamps as int64 nanoseconds. Cells that are not timestamps (blanks, stray numbers, text) become NaT.
+        return SheetValidator.to_times(column)[0].to_numpy('datetime64[ns]').view(np.int64)
+
+    @classmethod
+    def build(cls, df, directory, time_columns, channels):
+        # Convert the time columns and channels of a processed raw sheet and open the result. The arrays are
+        # written to a temporary directory that is then renamed, so concurrent runs never map a partial store.
+        temp_directory = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(temp_directory, exist_ok=True)
+        for col in time_columns:
+            np.save(cls.array_path(temp_directory, col), cls.to_ns(df[col]))
+        for col in channels:
+            np.save(cls.array_path(temp_directory, col), SheetValidator.to_numbers(df[col])[0].to_numpy())
+        with open(os.path.join(temp_directory, 'meta.json'), 'w') as f:
+            json.dump({'rows': len(df), 'time_columns': list(time_columns), 'channels': list(channels)}, f)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        try:
+            os.replace(temp_directory, directory)
+        except OSError:
+            # Another run built the same store in the meantime
+            shutil.rmtree(temp_directory, ignore_errors=True)
+        logging.info(f"Sensor store: converted {len(df)} rows into {directory}.")
+        return cls(directory)
+
+    @classmethod
+    def open_or_build(cls, directory, load, time_columns, channels, rebuild=False):
+        # Open the store in `directory`, building it from load() (the processed raw sheet) when it is missing,
+        # was built with other columns, or when rebuild is set. The sheet is only loaded to build the store.
+        if not rebuild and os.path.exists(os.path.join(directory, 'meta.json')):
+            store = cls(directory)
+            if store.time_columns == list(time_columns) and store.channels == list(channels):
+                logging.info(f"Sensor store: reusing {directory}.")
+                return store
+        return cls.build(load(), directory, time_columns, channels)
+
+    def times(self, column='A'):
+        # A timestamp column as a datetime64[ns] view of its file
+        return self.arrays[column].view('datetime64[ns]')
+
+    def time(self, row, column='A'):
+        return pd.Timestamp(self.times(column)[row])
+
+    def columns(self, names, first, last):
+        # Rows first..last (inclusive, like .loc) of the named channels, as views of their files
+        return [self.arrays[name][first:last + 1] for name in names]
@@ -0,0 +1,125 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+
+
+class CachedStage:
+    def __init__(self, cache, name, key, compute):
+        # A pipeline stage whose output is looked up in the cache (or computed) only when first requested. Stages
+        # may be requested from several threads: the first request resolves the output and the others wait for it.
+        self.cache = cache
+        self.name = name
+        self.key = key
+        self.compute = compute
+        self.hit = None
+        self._result = None
+        self._resolved = False
+        self._lock = threading.Lock()
+
+    def result(self):
+        # Return the stage output, loading it from the cache or computing (and storing) it on the first call
+        with self._lock:
+            if not self._resolved:
+                self._result = None if self.name in self.cache.refresh else self.cache.get(self.key)
+                self.hit = self._result is not None
+                if self.hit:
+                    logging.info(f"{self.name}: reusing cached output {self.key[:12]}.")
+                else:
+                    self._result = self.compute()
+                    self.cache.put(self.key, self._result)
+                self._resolved = True
+        return self._result
+
+    def submit(self, executor):
+        # Start resolving the stage on an executor's thread, so it runs alongside stages it does not depend on.
+        # Returns the future; result() waits for it.
+        return executor.submit(self.result)
+
+
+class StageCache:
+    def __init__(self, cache_dir=None, max_bytes=1 << 30, refresh=()):
+        # Content-addressed store of stage outputs. With no directory the cache is bypassed and every
+        # stage is computed, but each stage still runs at most once per pipeline. The stages named in `refresh`
+        # are always computed (e.g. the profiled stage); their output still replaces the cached one.
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.refresh = set(refresh)
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.evict()
+
+    @staticmethod
+    def code_version():
+        # Hash of the pipeline sources, so that cached outputs are not reused after the code changes
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(name, inputs, params):
+        # Cache key of a stage: its name, the keys of everything it reads and its parameters
+        description = {'stage': name, 'inputs': list(inputs), 'params': params, 'code': StageCache.code_version()}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def stage(self, name, inputs, params, compute):
+        # Declare a stage; `compute` is only called if the output is requested and not already cached
+        return CachedStage(self, name, self.key(name, inputs, params), compute)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        # Return the cached output for `key`, or None. A hit refreshes the entry for LRU eviction.
+        if not self.cache_dir:
+            return None
+        # Another process sharing the cache may evict the entry at any time, which is just a miss
+        try:
+            with open(self.path(key), 'rb') as f:
+                result = pickle.load(f)
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            return None
+        return result
+
+    def put(self, key, result):
+        # Store an output, then evict the least recently used entries beyond the size cap
+        if not self.cache_dir:
+            return
+        temp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path(key))
+        self.evict()
+
+    def evict(self):
+        # Remove the least recently used entries until the cache fits in max_bytes
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except FileNotFoundError:
+                # Already evicted by another process sharing the cache
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                logging.info(f"Stage cache: evicted {os.path.basename(path)}.")
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    @staticmethod
+    def clear(cache_dir):
+        # Delete everything stored under the cache directory
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
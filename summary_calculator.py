@@ -1,11 +1,151 @@
 import pandas as pd
 import numpy as np
 import json
+from kernels import Kernels
+
+
+class WindowIndex:
+    def __init__(self, df, key='C'):
+        # Index of df sorted by `key` (elapsed hours), so that any [start, end) window of rows is a contiguous
+        # range of the sorted order found by binary search. Per-column prefix sums, counts and max tables are
+        # built on first use, after which every window total, mean or maximum costs O(log n).
+        self.df = df
+        keys = pd.to_numeric(df[key], errors='coerce').to_numpy(dtype=float)
+        self.order = np.argsort(keys, kind='stable')
+        # Rows with a missing key never fall inside a window; they sort last and are left out
+        self.keys = keys[self.order][:int((~np.isnan(keys)).sum())]
+        # Smallest original row position among the first i sorted rows
+        self.first_rows = np.minimum.accumulate(self.order[:len(self.keys)])
+        self._columns = {}
+
+    def column(self, col):
+        # Prefix sums and counts of a column in sorted order, plus a sparse table of maxima over power-of-two
+        # ranges. Non-numeric cells are counted separately: any window containing one has no value.
+        if col not in self._columns:
+            raw = self.df[col].iloc[self.order[:len(self.keys)]]
+            values = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=float)
+            missing = np.isnan(values)
+            invalid = missing & raw.notna().to_numpy()
+            maxima = [values]
+            while 2 ** len(maxima) <= len(values):
+                half = 2 ** (len(maxima) - 1)
+                maxima.append(np.fmax(maxima[-1][:-half], maxima[-1][half:]))
+            self._columns[col] = {
+                'sums': np.concatenate([[0.0], np.cumsum(np.where(missing, 0, values))]),
+                'counts': np.concatenate([[0], np.cumsum(~missing)]),
+                'invalid': np.concatenate([[0], np.cumsum(invalid)]),
+                'maxima': maxima,
+            }
+        return self._columns[col]
+
+    def bounds(self, start, end, include_start=True):
+        # Sorted positions [lo, hi) of the rows with start <= key < end (start < key < end if not include_start)
+        if pd.isna(start) or pd.isna(end):
+            return 0, 0
+        lo = np.searchsorted(self.keys, start, side='left' if include_start else 'right')
+        return lo, max(lo, np.searchsorted(self.keys, end, side='left'))
+
+    def total(self, col, start, end):
+        # Sum of a column over start <= key < end; an empty window sums to 0
+        table = self.column(col)
+        lo, hi = self.bounds(start, end)
+        if table['invalid'][hi] - table['invalid'][lo]:
+            return np.nan
+        return table['sums'][hi] - table['sums'][lo]
+
+    def mean(self, col, start, end):
+        # Mean of the non-missing values of a column over start <= key < end
+        table = self.column(col)
+        lo, hi = self.bounds(start, end)
+        count = table['counts'][hi] - table['counts'][lo]
+        if not count or table['invalid'][hi] - table['invalid'][lo]:
+            return np.nan
+        return (table['sums'][hi] - table['sums'][lo]) / count
+
+    def max(self, col, start, end):
+        # Maximum of a column over start < key < end, from two overlapping power-of-two ranges
+        table = self.column(col)
+        lo, hi = self.bounds(start, end, include_start=False)
+        if hi == lo or table['invalid'][hi] - table['invalid'][lo]:
+            return np.nan
+        level = int(hi - lo).bit_length() - 1
+        return np.fmax(table['maxima'][level][lo], table['maxima'][level][hi - 2 ** level])
+
+    def sliding(self, col, hours, statistic='mean'):
+        # Value of every [key, key + hours) window that starts at a row and ends within the data, in one pass:
+        # means come from the prefix sums, minima (the rate sustained over the whole window) from a monotonic
+        # deque. Returns the window start keys and values; windows without valid values are NaN.
+        table = self.column(col)
+        starts = np.arange(np.searchsorted(self.keys, self.keys[-1] - hours, side='right') if len(self.keys) else 0)
+        ends = np.searchsorted(self.keys, self.keys[starts] + hours, side='left')
+        if statistic == 'mean':
+            counts = table['counts'][ends] - table['counts'][starts]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.where(counts > 0, (table['sums'][ends] - table['sums'][starts]) / counts, np.nan)
+        elif statistic == 'min':
+            values = Kernels.sliding_minimum(table['maxima'][0], starts, ends)
+        else:
+            raise ValueError(f"Unknown peak window statistic {statistic!r}; use 'mean' or 'min'")
+        invalid = table['invalid'][ends] - table['invalid'][starts]
+        return self.keys[starts], np.where(invalid > 0, np.nan, values)
+
+    def first_row_at_or_before(self, end):
+        # Position of the first row whose key is <= end, or 0 when there is none (like idxmax of an all-False mask)
+        count = 0 if pd.isna(end) else np.searchsorted(self.keys, end, side='right')
+        return int(self.first_rows[count - 1]) if count else 0
 
 
 class SummaryCalculator:
+    # Phase windows summarized by default. Each phase needs a name, start and end timestamp; optional keys:
+    #   max_range            [start, end] in elapsed hours for the maximum rates (default: the last hour of the phase)
+    #   stabilization_hours  elapsed hours after which g/g data is stable; averages start there instead of at the start
+    #   tag_totals           also report the consumption per TAG
+    #   extra                fields copied into the phase summary as they are
+    DEFAULT_PHASES = [
+        {"name": "Growth", "start": "10/25/23 1:47 PM", "end": "10/26/23 12:05 PM", "stabilization_hours": 20,
+         "extra": {"Stoichiometry": {"Actual": "null", "Literature": "null"}, "% Mixotrophy": "null"}},
+        {"name": "Production", "start": "10/26/23 4:50 PM", "end": "10/27/23 3:07 PM", "max_range": [27.050, 30.000],
+         "tag_totals": True, "extra": {"Stoichiometry": {"Actual": "", "Literature": ""}, "% Mixotrophy": "Nan"}},
+    ]
+    # Run data columns read by calculate_summary
+    REQUIRED_COLUMNS = ['B', 'C', 'AN', 'AR', 'AS', 'AT', 'AU', 'AV', 'AW', 'BB', 'BC', 'BD', 'BE', 'BF']
+
+    @staticmethod
+    def load_phases(path):
+        # Read phase windows from a JSON file holding a list of phases (or {"phases": [...]})
+        with open(path) as f:
+            phases = json.load(f)
+        if isinstance(phases, dict):
+            phases = phases.get('phases')
+        if not isinstance(phases, list) or not all({'name', 'start', 'end'} <= set(phase) for phase in phases):
+            raise ValueError(f"{path} must hold a list of phases, each with a name, start and end")
+        return phases
+
     @staticmethod
-    def calculate_summary(df):
+    def peak_windows(df, lengths, top_k=3, statistic='mean', index=None):
+        # Best sustained N-hour windows of the H2, CO2 and O2 consumption rates over the whole run, for every
+        # window length: the top_k non-overlapping windows ranked by their mean (or minimum) rate
+        index = index or WindowIndex(df)
+        rates = {"Hydrogen Consumption Rate": 'AR', "Carbon Dioxide Consumption Rate": 'AS',
+                 "Oxygen Consumption Rate": 'AT'}
+        peaks = {"Statistic": statistic, "Unit": "mmol/L/hr"}
+        for name, col in rates.items():
+            peaks[name] = {}
+            for hours in lengths:
+                starts, values = index.sliding(col, hours, statistic)
+                chosen = []
+                for i in np.argsort(-np.where(np.isnan(values), -np.inf, values), kind='stable'):
+                    if len(chosen) == top_k or np.isnan(values[i]):
+                        break
+                    if all(abs(starts[i] - start) >= hours for start, _ in chosen):
+                        chosen.append((starts[i], values[i]))
+                peaks[name][f"{hours:g} hrs"] = [{"Start": start, "End": start + hours, "Value": value}
+                                                 for start, value in chosen]
+        return peaks
+
+    @staticmethod
+    def calculate_summary(df, output_path='summary.json', phases=None, peak_lengths=None, top_k=3,
+                          peak_statistic='mean'):
         # Function to get the hours corresponding to a given timestamp value
         def get_hrs(timestamp_value):
             try:
@@ -16,107 +156,91 @@ class SummaryCalculator:
                 res = df.loc[df['B'].searchsorted(df['B'].max()), 'C']
             return res
 
+        index = WindowIndex(df)
+
         # Function to calculate total consumption values
         def get_totals(val1, val2, st, end):
             try:
-                # Calculate the sum for the given range and normalize using another value
-                return (df.loc[(df['C'] >= st) & (df['C'] < end), val1].sum() / df.loc[df['C'].le(end).idxmax(), val2])
+                # Sum over the range, normalized by val2 on the first row at or before the end
+                divisor = pd.to_numeric(df[val2].iloc[index.first_row_at_or_before(end)])
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    return np.float64(index.total(val1, st, end)) / np.float64(divisor)
             except:
                 return np.nan
 
         # Function to get the maximum value in a given range
         def get_max(val, st, end):
             try:
-                # Get the maximum value for the specified column and range
-                return df.loc[(df['C'] > st) & (df['C'] < end), val].max()
+                return index.max(val, st, end)
             except:
                 return np.nan
 
         # Function to get the mean value in a given range
         def get_mean(val, val1, val2):
             try:
-                # Calculate the mean for the specified column and range
-                return df.loc[(df['C'] >= val1) & (df['C'] < val2), val].mean()
+                return index.mean(val, val1, val2)
             except:
                 return np.nan
 
-        # Define important timestamps used in the summary calculations
-        c5 = pd.Timestamp('10/25/23 1:47 PM')
-        d5 = pd.Timestamp('10/26/23 12:05 PM')
-        c6 = get_hrs(c5)
-        d6 = get_hrs(d5)
-        g5 = pd.Timestamp("10/26/23 4:50 PM")
-        h5 = pd.Timestamp("10/27/23 3:07 PM")
-        g6 = get_hrs(g5)
-        h6 = get_hrs(h5)
-        d22 = d6
-        c22 = d22 - 1
-        g22 = 27.050
-        h22 = 30.000
-        c7 = 20
-
-        # Create the summary dictionary containing all relevant calculations
-        summary = {
-            "Growth": {
-                "Start": c5.strftime('%Y/%m/%d %H:%M %p'),
-                "End": d5.strftime('%Y/%m/%d %H:%M %p'),
-                "Elapsed Fermentation Time": {"Start": c6, "End": d6, "Unit": "hrs"},
-                "Stabilization Time of g/g Data": {"Value": c7, "Unit": "hrs"},
-                "Totals": {
-                    "Hydrogen Consumed/Biomass": {"Value": get_totals('BD', 'BB', c6, d6), "Unit": "g/g"},
-                    "Carbon Dioxide Consumed/Biomass": {"Value": get_totals('BE', 'BB', c6, d6), "Unit": "g/g"},
-                    "Oxygen Consumed/Biomass": {"Value": get_totals('BF', 'BB', c6, d6), "Unit": "g/g"},
-                    "Hydrogen Consumed/Volume": {"Value": get_totals('BD', 'AN', c6, d6), "Unit": "g/L"},
-                    "Carbon Dioxide Consumed/Volume": {"Value": get_totals('BE', 'AN', c6, d6), "Unit": "g/L"},
-                    "Oxygen Consumed/Volume": {"Value": get_totals('BF', 'AN', c6, d6), "Unit": "g/L"}
-                },
-                "Maximums": {
-                    "EFT Time Range": {"Start": c22, "End": d22, "Unit": "hrs"},
-                    "Hydrogen Consumption Rate": {"Value": get_max('AR', c22, d22), "Unit": "mmol/L/hr"},
-                    "Carbon Dioxide Consumption Rate": {"Value": get_max('AS', c22, d22), "Unit": "mmol/L/hr"},
-                    "Oxygen Consumption Rate": {"Value": get_max('AT', c22, d22), "Unit": "mmol/L/hr"}
-                },
-                "Averages": {
-                    "Hydrogen Consumption/Biomass/Hr": {"Value": get_mean('AU', c7, d6), "Unit": "g/g/hr"},
-                    "Carbon Dioxide Consumption/Biomass/Hr": {"Value": get_mean('AV', c7, d6), "Unit": "g/g/hr"},
-                    "Oxygen Consumption Rate /Hr": {"Value": get_mean('AW', c7, d6), "Unit": "g/g/hr"}
-                },
-                "Stoichiometry": {"Actual": "null", "Literature": "null"},
-                "% Mixotrophy": "null"
-            },
-            "Production": {
-                "Start": g5.strftime('%Y/%m/%d %H:%M %p'),
-                "End": h5.strftime('%Y/%m/%d %H:%M %p'),
-                "Elapsed Fermentation Time": {"Start": g6, "End": h6, "Unit": "hrs"},
-                "Totals": {
-                    "Hydrogen Consumed/Biomass": {"Value": get_totals('BD', 'BB', g6, h6), "Unit": "g/g"},
-                    "Carbon Dioxide Consumed/Biomass": {"Value": get_totals('BE', 'BB', g6, h6), "Unit": "g/g"},
-                    "Oxygen Consumed/Biomass": {"Value": get_totals('BF', 'BB', g6, h6), "Unit": "g/g"},
-                    "Hydrogen Consumed/Volume": {"Value": get_totals('BD', 'AN', g6, h6), "Unit": "g/L"},
-                    "Carbon Dioxide Consumed/Volume": {"Value": get_totals('BE', 'AN', g6, h6), "Unit": "g/L"},
-                    "Oxygen Consumed/Volume": {"Value": get_totals('BF', 'AN', g6, h6), "Unit": "g/L"},
-                    "Hydrogen Consumed/TAG": {"Value": get_totals('BF', 'BC', g6, h6), "Unit": "g/g"},
-                    "Carbon Dioxide Consumed/TAG": {"Value": get_totals('BF', 'BC', g6, h6), "Unit": "g/g"},
-                    "Oxygen Consumed/TAG": {"Value": get_totals('BF', 'BC', g6, h6), "Unit": "g/g"}
-                },
-                "Maximums": {
-                    "EFT Time Range": {"Start": g22, "End": h22, "Unit": "hrs"},
-                    "Hydrogen Consumption Rate": {"Value": get_max('AR', g22, h22), "Unit": "mmol/L/hr"},
-                    "Carbon Dioxide Consumption Rate": {"Value": get_max('AS', g22, h22), "Unit": "mmol/L/hr"},
-                    "Oxygen Consumption Rate": {"Value": get_max('AT', g22, h22), "Unit": "mmol/L/hr"}
-                },
-                "Averages": {
-                    "Hydrogen Consumption/Biomass/Hr": {"Value": get_mean('AU', g6, h6), "Unit": "g/g/hr"},
-                    "Carbon Dioxide Consumption/Biomass/Hr": {"Value": get_mean('AV', g6, h6), "Unit": "g/g/hr"},
-                    "Oxygen Consumption Rate /Hr": {"Value": get_mean('AW', g6, h6), "Unit": "g/g/hr"}
-                },
-                "Stoichiometry": {"Actual": "", "Literature": ""},
-                "% Mixotrophy": "Nan"
+        def phase_summary(phase):
+            start = pd.Timestamp(phase['start'])
+            end = pd.Timestamp(phase['end'])
+            start_hrs = get_hrs(start)
+            end_hrs = get_hrs(end)
+            max_start, max_end = phase.get('max_range', [end_hrs - 1, end_hrs])
+            stabilization = phase.get('stabilization_hours')
+            mean_start = start_hrs if stabilization is None else stabilization
+
+            result = {
+                "Start": start.strftime('%Y/%m/%d %H:%M %p'),
+                "End": end.strftime('%Y/%m/%d %H:%M %p'),
+                "Elapsed Fermentation Time": {"Start": start_hrs, "End": end_hrs, "Unit": "hrs"},
+            }
+            if stabilization is not None:
+                result["Stabilization Time of g/g Data"] = {"Value": stabilization, "Unit": "hrs"}
+            totals = {
+                "Hydrogen Consumed/Biomass": {"Value": get_totals('BD', 'BB', start_hrs, end_hrs), "Unit": "g/g"},
+                "Carbon Dioxide Consumed/Biomass": {"Value": get_totals('BE', 'BB', start_hrs, end_hrs), "Unit": "g/g"},
+                "Oxygen Consumed/Biomass": {"Value": get_totals('BF', 'BB', start_hrs, end_hrs), "Unit": "g/g"},
+                "Hydrogen Consumed/Volume": {"Value": get_totals('BD', 'AN', start_hrs, end_hrs), "Unit": "g/L"},
+                "Carbon Dioxide Consumed/Volume": {"Value": get_totals('BE', 'AN', start_hrs, end_hrs), "Unit": "g/L"},
+                "Oxygen Consumed/Volume": {"Value": get_totals('BF', 'AN', start_hrs, end_hrs), "Unit": "g/L"}
+            }
+            if phase.get('tag_totals'):
+                totals.update({
+                    "Hydrogen Consumed/TAG": {"Value": get_totals('BF', 'BC', start_hrs, end_hrs), "Unit": "g/g"},
+                    "Carbon Dioxide Consumed/TAG": {"Value": get_totals('BF', 'BC', start_hrs, end_hrs), "Unit": "g/g"},
+                    "Oxygen Consumed/TAG": {"Value": get_totals('BF', 'BC', start_hrs, end_hrs), "Unit": "g/g"}
+                })
+            result["Totals"] = totals
+            result["Maximums"] = {
+                "EFT Time Range": {"Start": max_start, "End": max_end, "Unit": "hrs"},
+                "Hydrogen Consumption Rate": {"Value": get_max('AR', max_start, max_end), "Unit": "mmol/L/hr"},
+                "Carbon Dioxide Consumption Rate": {"Value": get_max('AS', max_start, max_end), "Unit": "mmol/L/hr"},
+                "Oxygen Consumption Rate": {"Value": get_max('AT', max_start, max_end), "Unit": "mmol/L/hr"}
             }
-        }
+            result["Averages"] = {
+                "Hydrogen Consumption/Biomass/Hr": {"Value": get_mean('AU', mean_start, end_hrs), "Unit": "g/g/hr"},
+                "Carbon Dioxide Consumption/Biomass/Hr": {"Value": get_mean('AV', mean_start, end_hrs),
+                                                          "Unit": "g/g/hr"},
+                "Oxygen Consumption Rate /Hr": {"Value": get_mean('AW', mean_start, end_hrs), "Unit": "g/g/hr"}
+            }
+            result.update(phase.get('extra', {}))
+            return result
 
-        # Write the summary to a JSON file
-        with open('summary.json', 'w') as f:
-            json.dump(summary, f, indent=20)
+        # Create the summary dictionary containing all relevant calculations, one entry per phase
+        summary = {phase['name']: phase_summary(phase) for phase in (phases or SummaryCalculator.DEFAULT_PHASES)}
+        if peak_lengths:
+            summary["Peak Windows"] = SummaryCalculator.peak_windows(df, peak_lengths, top_k, peak_statistic, index)
+
+        # Write the summary to a JSON file (skipped when output_path is None)
+        if output_path:
+            SummaryCalculator.write_json(summary, output_path)
 
         return summary
+
+    @staticmethod
+    def write_json(summary, output_path='summary.json'):
+        # Write a summary dictionary to a JSON file
+        with open(output_path, 'w') as f:
+            json.dump(summary, f, indent=20)
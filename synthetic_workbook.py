@@ -0,0 +1,123 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+
+class SyntheticWorkbook:
+    # Sheet layouts expected by the pipeline: number of header rows below the first (column title) row, and
+    # number of columns. The data rows follow the header rows.
+    LAYOUTS = {
+        'BlueVis Raw Data': (6, 14),
+        'Solaris Data': (3, 33),
+        'AveragedData': (2, 46),
+        'Run Data': (3, 64),
+        'Calibration Data': (9, 14),
+    }
+    # BlueVis timestamps in column A are UTC; the pipeline expects them 4 hours ahead of the local time in column B
+    UTC_OFFSET = pd.Timedelta(hours=4)
+
+    def __init__(self, minutes=120, bluevis_seconds=1, solaris_seconds=10, start='2023-10-25 00:00:00', seed=0,
+                 missing_fraction=0.01):
+        # Random but well-formed sensor data for a run of `minutes`, sampled every bluevis_seconds (BlueVis) and
+        # solaris_seconds (Solaris). A small fraction of cells is left blank, like the lab exports.
+        self.minutes = minutes
+        self.bluevis_seconds = bluevis_seconds
+        self.solaris_seconds = solaris_seconds
+        self.start = pd.Timestamp(start)
+        self.missing_fraction = missing_fraction
+        self.rng = np.random.default_rng(seed)
+
+    def run_start_time(self):
+        # A RunData start time inside the generated data
+        return str(self.start + pd.Timedelta(minutes=5))
+
+    def sheet(self, sheet_name, data):
+        # Title row, header rows and data rows of one sheet, as read by pd.read_excel (the title row becomes the
+        # column labels)
+        header_rows, n_cols = self.LAYOUTS[sheet_name]
+        columns = [f"{sheet_name} {i}" for i in range(n_cols)]
+        headers = pd.DataFrame([[f"header {row}"] * n_cols for row in range(header_rows)], columns=columns,
+                               dtype=object)
+        data = pd.DataFrame(data, dtype=object).reindex(columns=range(n_cols))
+        data.columns = columns
+        return pd.concat([headers, data], ignore_index=True)
+
+    def blank(self, values):
+        # Blank out a random fraction of the values
+        values = np.asarray(values, dtype=object)
+        values[self.rng.random(len(values)) < self.missing_fraction] = np.nan
+        return values
+
+    def bluevis(self):
+        # Column A (UTC) and B (local) timestamps with sub-second jitter, gas readings in C to H, L and M
+        n = int(self.minutes * 60 / self.bluevis_seconds)
+        jitter = np.r_[0, self.rng.uniform(0, 0.5, n - 1)]
+        local = self.start + pd.to_timedelta(np.arange(n) * self.bluevis_seconds + jitter, unit='s')
+        data = {0: list(local + self.UTC_OFFSET), 1: list(local)}
+        for col in [2, 3, 4, 5, 6, 7, 11, 12]:
+            data[col] = self.rng.uniform(0, 0.6, n)
+        data[2] = self.blank(data[2])
+        return self.sheet('BlueVis Raw Data', data)
+
+    def solaris(self):
+        # Timestamps in column A (some blank) and 32 analyser channels
+        n = int(self.minutes * 60 / self.solaris_seconds)
+        times = self.start + pd.to_timedelta(np.arange(n) * self.solaris_seconds + 3, unit='s')
+        data = {0: self.blank(list(times))}
+        for col in range(1, 33):
+            data[col] = self.rng.uniform(0, 0.02, n)
+        return self.sheet('Solaris Data', data)
+
+    def averaged(self):
+        # Column B holds the UTC bin edge of every minute of the run (plus a few spare minutes)
+        edges = pd.date_range(self.start.floor('min'), periods=self.minutes + 5, freq='60s') + self.UTC_OFFSET
+        return self.sheet('AveragedData', {1: list(edges)})
+
+    def run(self):
+        # Only the headers of 'Run Data' are read; the pipeline computes every row
+        return self.sheet('Run Data', {0: [np.nan] * 5})
+
+    def calibration(self):
+        # Offsets block in rows 1 to 4 (key in B, thresholds in H to J, offsets in K to M), filler rows up to
+        # the 9-row header, then the data rows whose column I holds the column M thresholds
+        header_rows, n_cols = self.LAYOUTS['Calibration Data']
+        offsets = [(0.2, 0.1, 0.2, 0.001, 0.001, 0.003),
+                   (0.5, 0.3, 0.5, 0.002, 0.0015, 0.004),
+                   (0.8, 0.6, 0.8, 0.003, 0.002, 0.005),
+                   (1.1, 0.9, 1.1, 0.004, 0.005, 0.006)]
+        rows = [["header 0"] * n_cols]
+        rows += [[np.nan, f"k{k}", 0, 0, 0, 0, 0, *values, np.nan] for k, values in enumerate(offsets)]
+        rows += [["header"] * n_cols] * (header_rows - len(rows))
+        rows += [[np.nan] * 8 + [1.0 - 0.05 * k] + [np.nan] * (n_cols - 9) for k in range(8)]
+        return pd.DataFrame(rows, columns=[f"Calibration Data {i}" for i in range(n_cols)], dtype=object)
+
+    def sheets(self):
+        # {sheet name: DataFrame} exactly as WorkbookLoader.load returns them for a real workbook
+        return {'BlueVis Raw Data': self.bluevis(), 'Solaris Data': self.solaris(), 'AveragedData': self.averaged(),
+                'Run Data': self.run(), 'Calibration Data': self.calibration()}
+
+    def write(self, path):
+        # Write the sheets to an Excel workbook that the pipeline can read
+        with pd.ExcelWriter(path) as writer:
+            for sheet_name, df in self.sheets().items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+        return path
+
+
+def parse_args(argv=None):
+    # Command-line interface for writing a synthetic workbook
+    parser = argparse.ArgumentParser(description="Write a synthetic workbook with the pipeline's sheet layouts.")
+    parser.add_argument('output_file', help="Excel workbook to write")
+    parser.add_argument('--minutes', type=int, default=120, help="Length of the run in minutes (default: 120)")
+    parser.add_argument('--bluevis-seconds', type=float, default=1, help="BlueVis sample interval (default: 1)")
+    parser.add_argument('--solaris-seconds', type=float, default=10, help="Solaris sample interval (default: 10)")
+    parser.add_argument('--start', default='2023-10-25 00:00:00', help="Local time of the first sample")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    workbook = SyntheticWorkbook(args.minutes, args.bluevis_seconds, args.solaris_seconds, args.start, args.seed)
+    workbook.write(args.output_file)
+    print(f"Wrote {args.output_file}; use start time '{workbook.run_start_time()}'")
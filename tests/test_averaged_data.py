@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from averaged_data import AveragedData
+from bluevis_data import BlueVisData
+from ingestion import SheetValidator
+from legacy_engine import LegacyAveragedData
+from solaris_data import SolarisData
+from synthetic_workbook import SyntheticWorkbook
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    # A short run with blank Solaris timestamps in the middle of column A
+    return SyntheticWorkbook(minutes=30, missing_fraction=0.05).sheets()
+
+
+def averaged(sheets, bluevis_df, solaris_df):
+    # The averaged data of the fast stage (on the validated sheets, as main.py runs it) and of the legacy stage
+    fast = AveragedData(sheets['AveragedData'].copy(),
+                        SheetValidator.validate(bluevis_df, 'BlueVis Raw Data', *AveragedData.BLUEVIS_COLUMNS),
+                        SheetValidator.validate(solaris_df, 'Solaris Data', *AveragedData.SOLARIS_COLUMNS)).process()
+    legacy = LegacyAveragedData(sheets['AveragedData'], bluevis_df, solaris_df).process()
+    return fast, legacy
+
+
+def test_solaris_rows_match_legacy_with_blank_timestamps(sheets):
+    solaris_df = SolarisData(sheets['Solaris Data'].copy()).process()
+    assert solaris_df['A'].isna().any()
+    fast, legacy = averaged(sheets, BlueVisData(sheets['BlueVis Raw Data'].copy()).process(), solaris_df)
+    for col in ['AK', 'AL']:
+        np.testing.assert_array_equal(fast[col].to_numpy(), legacy[col].to_numpy().astype(np.int64), err_msg=col)
+
+
+def test_bluevis_rows_match_legacy_with_unsorted_timestamps(sheets):
+    # Blank and swapped timestamps in BlueVis column A (as datetimes, which the legacy stage can search)
+    bluevis_df = BlueVisData(sheets['BlueVis Raw Data'].copy()).process()
+    times = SheetValidator.to_times(bluevis_df['A'])[0]
+    rng = np.random.default_rng(1)
+    times[rng.random(len(times)) < 0.01] = pd.NaT
+    swapped = rng.choice(len(times) - 1, 20, replace=False)
+    times.iloc[np.r_[swapped, swapped + 1]] = times.iloc[np.r_[swapped + 1, swapped]].to_numpy()
+    bluevis_df['A'] = times
+    assert not SheetValidator.is_sorted(bluevis_df['A'])
+    fast, legacy = averaged(sheets, bluevis_df, SolarisData(sheets['Solaris Data'].copy()).process())
+    np.testing.assert_array_equal(fast['L'].to_numpy(), legacy['L'].to_numpy().astype(np.int64))
+    np.testing.assert_array_equal(fast['M'].to_numpy(), legacy['M'].to_numpy().astype(np.int64))
+    assert fast['A'].tolist() == legacy['A'].tolist()
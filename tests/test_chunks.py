@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from averaged_data import AveragedData
+from bluevis_data import BlueVisData
+from run_data import RunData
+from solaris_data import SolarisData
+from summary_calculator import SummaryCalculator
+from synthetic_workbook import SyntheticWorkbook
+
+
+@pytest.fixture(scope='module')
+def workbook():
+    # A 90-minute run with blank sample timestamps and cells, and its processed BlueVis and Solaris data
+    workbook = SyntheticWorkbook(minutes=90, missing_fraction=0.05)
+    sheets = workbook.sheets()
+    return (workbook, sheets, BlueVisData(sheets['BlueVis Raw Data'].copy()).process(),
+            SolarisData(sheets['Solaris Data'].copy()).process())
+
+
+@pytest.mark.parametrize('chunk_minutes', [3, 7, 40, 500])
+def test_chunked_averaged_data_matches_one_block(workbook, chunk_minutes):
+    _, sheets, bluevis_df, solaris_df = workbook
+    whole = AveragedData(sheets['AveragedData'].copy(), bluevis_df, solaris_df).process()
+    chunked = AveragedData(sheets['AveragedData'].copy(), bluevis_df, solaris_df).process(chunk_minutes=chunk_minutes)
+    pd.testing.assert_frame_equal(chunked, whole)
+
+
+@pytest.mark.parametrize('columns', [None, SummaryCalculator.REQUIRED_COLUMNS])
+@pytest.mark.parametrize('lag_minutes', [0, 1, 10, 25])
+@pytest.mark.parametrize('chunk_minutes', [3, 7, 40, 500])
+def test_chunked_run_data_matches_one_block(workbook, chunk_minutes, lag_minutes, columns):
+    # Chunks smaller and larger than the lag, so that the context rows before a chunk and the look-ahead rows
+    # after it cross several chunk boundaries
+    workbook, sheets, bluevis_df, solaris_df = workbook
+    avg_df = AveragedData(sheets['AveragedData'].copy(), bluevis_df, solaris_df).process()
+
+    def run_data():
+        return RunData(sheets['Run Data'].copy(), avg_df, sheets['Calibration Data'], workbook.run_start_time(),
+                       lag_minutes)
+
+    whole = run_data().process(columns=columns)
+    chunked = run_data().process(chunk_minutes=chunk_minutes, columns=columns)
+    pd.testing.assert_frame_equal(chunked, whole)
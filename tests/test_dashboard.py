@@ -0,0 +1,17 @@
+import numpy as np
+from dashboard import RunDashboard
+
+
+def test_dashboard_starts_before_any_run_data(tmp_path):
+    dashboard = RunDashboard(str(tmp_path))
+    layout = dashboard.layout()
+    graph, last_hours = layout.children[1], layout.children[2]
+    assert [trace.name for trace in graph.figure.data] == ['O2', 'CO2', 'H2']
+    assert np.isfinite(last_hours.data)
+    assert dashboard.new_points(last_hours.data) is None
+
+    # Run data written later is sent in full, also to a client that stored no elapsed time
+    dashboard.points = {gas: (np.array([0.0, 0.5]), np.array([1.0, 2.0])) for gas in ['O2', 'CO2', 'H2']}
+    for after in [last_hours.data, None]:
+        update, traces = dashboard.new_points(after)
+        assert update['x'] == [[0.0, 0.5]] * 3 and traces == [0, 1, 2]
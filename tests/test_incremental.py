@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from averaged_data import AveragedData
+from bluevis_data import BlueVisData
+from incremental import IncrementalRun
+from run_data import RunData
+from solaris_data import SolarisData
+from synthetic_workbook import SyntheticWorkbook
+
+
+def test_appends_match_full_recompute_with_blank_timestamps():
+    # A live run whose Solaris column A has blanks in the middle, appended in uneven steps and compared with a
+    # full recompute of the samples so far after every step
+    workbook = SyntheticWorkbook(minutes=60, missing_fraction=0.05, seed=2)
+    sheets = workbook.sheets()
+    bluevis_df = BlueVisData(sheets['BlueVis Raw Data'].copy()).process()
+    solaris_df = SolarisData(sheets['Solaris Data'].copy()).process()
+    live_run = IncrementalRun(sheets['AveragedData'].copy(), sheets['Run Data'].copy(), sheets['Calibration Data'],
+                              workbook.run_start_time())
+    for fraction in [0.1, 0.35, 0.4, 0.7, 1.0]:
+        bluevis_rows, solaris_rows = int(len(bluevis_df) * fraction), int(len(solaris_df) * fraction)
+        avg_df, run_df = live_run.append(bluevis_df.iloc[live_run.bluevis.length:bluevis_rows],
+                                         solaris_df.iloc[live_run.solaris.length:solaris_rows])
+        full_avg_df = AveragedData(sheets['AveragedData'].copy(), bluevis_df.iloc[:bluevis_rows],
+                                   solaris_df.iloc[:solaris_rows]).process()
+        pd.testing.assert_frame_equal(avg_df, full_avg_df)
+        if run_df is not None:
+            full_run_df = RunData(sheets['Run Data'].copy(), full_avg_df, sheets['Calibration Data'],
+                                  workbook.run_start_time()).process()
+            pd.testing.assert_frame_equal(run_df, full_run_df)
+            np.testing.assert_allclose(live_run.integrals, full_run_df[['BD', 'BE', 'BF']].sum())
@@ -0,0 +1,16 @@
+import json
+import numpy as np
+from instrumentation import Metrics
+
+
+def test_numpy_row_counts_are_written_as_numbers(tmp_path):
+    metrics = Metrics()
+    metrics.start()
+    with metrics.measure('AveragedData') as measured:
+        metrics.blocks('AveragedData').split('bluevis_means', np.int64(11741))
+        measured['rows'] = np.int64(30)
+    metrics.write_json(str(tmp_path / 'metrics.json'))
+    with open(tmp_path / 'metrics.json') as f:
+        records = {record['name']: record for record in json.load(f)['stages']}
+    assert records['AveragedData.bluevis_means']['rows'] == 11741
+    assert records['AveragedData']['rows'] == 30
@@ -0,0 +1,9 @@
+import pytest
+from main import parse_args
+
+
+@pytest.mark.parametrize('option', ['--no-plot', '--summary-only'])
+def test_profiling_the_plot_needs_the_plot(option):
+    with pytest.raises(SystemExit):
+        parse_args(['run.xlsx', '2023-10-25 13:47:38', '--profile', 'DataVisualizer', option])
+    assert parse_args(['run.xlsx', '2023-10-25 13:47:38', '--profile', 'RunData', option]).profile == 'RunData'
@@ -0,0 +1,53 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from averaged_data import AveragedData
+from bluevis_data import BlueVisData
+from output_writers import HEADER_METADATA_KEY, OutputWriter
+from run_data import RunData
+from solaris_data import SolarisData
+from synthetic_workbook import SyntheticWorkbook
+
+
+@pytest.fixture(scope='module')
+def run():
+    # Processed run data of a short synthetic run and the header rows it is written under
+    workbook = SyntheticWorkbook(minutes=30)
+    sheets = workbook.sheets()
+    avg_df = AveragedData(sheets['AveragedData'], BlueVisData(sheets['BlueVis Raw Data']).process(),
+                          SolarisData(sheets['Solaris Data']).process()).process()
+    run_data = RunData(sheets['Run Data'], avg_df, sheets['Calibration Data'], workbook.run_start_time())
+    return run_data.process(), run_data.headers()
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'csv.gz', 'parquet', 'feather'])
+def test_run_data_reads_back_from_every_format(tmp_path, run, output_format):
+    if output_format in ('parquet', 'feather'):
+        pytest.importorskip('pyarrow')
+    run_df, headers = run
+    # The write runs on the writer's thread; wait() returns once the file is complete
+    writer = OutputWriter(output_format)
+    path = writer.write(run_df, headers, str(tmp_path), 'run_data')
+    writer.wait()
+    assert OutputWriter.find(str(tmp_path), 'run_data') == path
+    read_df = RunData.read_export(path)
+
+    assert list(read_df.columns) == list(run_df.columns) and len(read_df) == len(run_df)
+    for col in run_df.columns:
+        if run_df[col].dtype.kind == 'M':
+            pd.testing.assert_series_equal(pd.to_datetime(read_df[col]), run_df[col], check_names=False)
+        else:
+            # Flag column A holds 1 and "", which read back as 1 and NaN
+            expected = pd.to_numeric(run_df[col].replace("", np.nan)).to_numpy(dtype=float)
+            np.testing.assert_allclose(pd.to_numeric(read_df[col]).to_numpy(dtype=float), expected, err_msg=col)
+
+    # The sheet header rows: the CSV header, or the schema metadata of the columnar files
+    if output_format.startswith('csv'):
+        read_headers = pd.read_csv(path, header=None, nrows=3, dtype=str, keep_default_na=False).values.tolist()
+    else:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(path) if output_format == 'parquet' else feather.read_table(path).schema
+        read_headers = json.loads(schema.metadata[HEADER_METADATA_KEY])
+    assert read_headers == [[str(value) for value in row] for row in headers]
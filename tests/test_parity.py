@@ -0,0 +1,16 @@
+from bluevis_data import BlueVisData
+from parity import ParityChecker
+from solaris_data import SolarisData
+from synthetic_workbook import SyntheticWorkbook
+
+
+def test_engines_agree_on_synthetic_workbook(tmp_path):
+    # The default synthetic workbook, as written by synthetic_workbook.py, has blank cells in the Solaris
+    # timestamps and the BlueVis readings
+    workbook = SyntheticWorkbook()
+    sheets = workbook.sheets()
+    checker = ParityChecker(sheets, BlueVisData(sheets['BlueVis Raw Data']).process(),
+                            SolarisData(sheets['Solaris Data']).process(), workbook.run_start_time())
+    report, timings = checker.verify()
+    result = ParityChecker.write_report(report, timings, tmp_path)
+    assert result['passed'], result['mismatched_columns']
@@ -0,0 +1,95 @@
+import os
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from averaged_data import AveragedData
+from bluevis_data import BlueVisData
+from ingestion import SheetValidator
+from main import run_pipeline
+from sensor_store import SensorStore
+from stage_cache import StageCache
+from synthetic_workbook import SyntheticWorkbook
+
+
+@pytest.fixture(scope='module')
+def bluevis_df():
+    # Validated BlueVis data with blank timestamps and readings
+    sheets = SyntheticWorkbook(minutes=20, missing_fraction=0.05).sheets()
+    return SheetValidator.validate(BlueVisData(sheets['BlueVis Raw Data']).process(), 'BlueVis Raw Data',
+                                   *AveragedData.BLUEVIS_COLUMNS)
+
+
+def build(bluevis_df, directory):
+    return SensorStore.build(bluevis_df, str(directory), *AveragedData.BLUEVIS_COLUMNS)
+
+
+def assert_holds(store, bluevis_df):
+    time_columns, channels = AveragedData.BLUEVIS_COLUMNS
+    assert len(store) == len(bluevis_df)
+    for col in time_columns:
+        np.testing.assert_array_equal(store.times(col), bluevis_df[col].to_numpy('datetime64[ns]'))
+    np.testing.assert_array_equal(np.column_stack(store.columns(channels, 0, len(store) - 1)),
+                                  bluevis_df[channels].to_numpy(dtype=float))
+
+
+def test_build_maps_typed_arrays(tmp_path, bluevis_df):
+    store = build(bluevis_df, tmp_path / 'store')
+    assert_holds(store, bluevis_df)
+    assert all(isinstance(array, np.memmap) for array in store.arrays.values())
+    # Windows are inclusive of their last row, like .loc
+    channels = AveragedData.BLUEVIS_COLUMNS[1]
+    np.testing.assert_array_equal(store.columns(channels[:1], 5, 9)[0], bluevis_df[channels[0]].iloc[5:10])
+    assert store.time(3) == bluevis_df['A'].iloc[3]
+    assert not os.path.exists(f"{tmp_path / 'store'}.{os.getpid()}.tmp")
+
+
+def test_open_or_build_reuses_a_store_with_the_same_columns(tmp_path, bluevis_df):
+    directory = str(tmp_path / 'store')
+    loads = []
+
+    def load():
+        loads.append(1)
+        return bluevis_df
+
+    SensorStore.open_or_build(directory, load, *AveragedData.BLUEVIS_COLUMNS)
+    assert_holds(SensorStore.open_or_build(directory, load, *AveragedData.BLUEVIS_COLUMNS), bluevis_df)
+    assert len(loads) == 1
+    SensorStore.open_or_build(directory, load, *AveragedData.BLUEVIS_COLUMNS, rebuild=True)
+    store = SensorStore.open_or_build(directory, load, ['A'], ['C'])
+    assert len(loads) == 3 and store.channels == ['C']
+
+
+def test_unpickled_store_maps_its_files_again(tmp_path, bluevis_df):
+    store = pickle.loads(pickle.dumps(build(bluevis_df, tmp_path / 'store')))
+    assert_holds(store, bluevis_df)
+    assert all(isinstance(array, np.memmap) for array in store.arrays.values())
+
+
+def test_cached_store_whose_files_were_deleted_is_a_miss(tmp_path, bluevis_df):
+    cache = StageCache(str(tmp_path / 'stages'))
+    cache.put('bluevis', build(bluevis_df, tmp_path / 'store'))
+    shutil.rmtree(tmp_path / 'store')
+    assert cache.get('bluevis') is None
+
+
+def test_pipeline_rebuilds_deleted_sensor_stores(tmp_path):
+    # A memory-mapped run whose stage pickles remain after the sensors/ directory is deleted gives the same outputs
+    workbook = SyntheticWorkbook(minutes=40)
+    input_file = str(tmp_path / 'run.xlsx')
+    workbook.write(input_file)
+    cache_dir = str(tmp_path / 'cache')
+
+    def run(output_dir, compute_backend, use_cache=True):
+        run_pipeline(input_file, workbook.run_start_time(), output_dir=str(tmp_path / output_dir), cache_dir=cache_dir,
+                     use_cache=use_cache, show_plot=False, plot=False, memory_map=True, compute_backend=compute_backend)
+        return pd.read_csv(tmp_path / output_dir / 'run_data.csv', header=None, low_memory=False)
+
+    run('first', 'numpy')
+    shutil.rmtree(os.path.join(cache_dir, 'sensors'))
+    # Another backend changes the AveragedData key but not those of the sensor stages, so these are unpickled from
+    # the cache, miss, and convert the sheets again
+    second = run('second', 'pandas')
+    assert len(os.listdir(os.path.join(cache_dir, 'sensors'))) == 2
+    pd.testing.assert_frame_equal(second, run('uncached', 'pandas', use_cache=False))
@@ -0,0 +1,32 @@
+import os
+from stage_cache import StageCache
+
+
+def test_refreshed_stage_is_computed_when_cached(tmp_path):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    StageCache(str(tmp_path)).stage('AveragedData', [], {}, compute).result()
+    cached = StageCache(str(tmp_path)).stage('AveragedData', [], {}, compute)
+    assert cached.result() == 1 and cached.hit
+    refreshed = StageCache(str(tmp_path), refresh=['AveragedData']).stage('AveragedData', [], {}, compute)
+    assert refreshed.result() == 2 and not refreshed.hit
+    assert StageCache(str(tmp_path)).stage('AveragedData', [], {}, compute).result() == 2
+
+
+def test_least_recently_read_entry_is_evicted(tmp_path):
+    # Three outputs of about 1 KB in a cache capped at 2.5 KB. Reading the oldest entry makes the second one the
+    # least recently used, so that one is evicted when the third is stored.
+    cache = StageCache(str(tmp_path), max_bytes=2500)
+    cache.put('first', b'1' * 1000)
+    cache.put('second', b'2' * 1000)
+    for key, mtime in [('first', 1000), ('second', 2000)]:
+        os.utime(cache.path(key), (mtime, mtime))
+    assert cache.get('first') == b'1' * 1000
+    cache.put('third', b'3' * 1000)
+    assert cache.get('second') is None
+    assert cache.get('first') == b'1' * 1000
+    assert cache.get('third') == b'3' * 1000
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+from summary_calculator import SummaryCalculator, WindowIndex
+
+
+@pytest.fixture(scope='module')
+def run_df():
+    # 300 rows at uneven elapsed hours (C), in shuffled order, with gaps in the rates
+    rng = np.random.default_rng(3)
+    hours = np.cumsum(rng.uniform(0.01, 0.05, 300))
+    rates = rng.normal(5, 2, (300, 3))
+    rates[rng.random((300, 3)) < 0.1] = np.nan
+    df = pd.DataFrame({'C': hours, 'AR': rates[:, 0], 'AS': rates[:, 1], 'AT': rates[:, 2]})
+    return df.sample(frac=1, random_state=3).reset_index(drop=True)
+
+
+def window(df, col, start, end, include_start=True):
+    # Values of a column over start <= C < end (start < C < end if not include_start), by a scan of every row
+    inside = (df['C'] >= start if include_start else df['C'] > start) & (df['C'] < end)
+    return df.loc[inside, col].dropna()
+
+
+def brute_sliding(df, col, hours, statistic):
+    # Every [C, C + hours) window starting at a row and ending within the data
+    keys = np.sort(df['C'].to_numpy())
+    starts = keys[keys <= keys[-1] - hours]
+    values = [window(df, col, start, start + hours) for start in starts]
+    return starts, np.array([getattr(v, statistic)() if len(v) else np.nan for v in values])
+
+
+@pytest.mark.parametrize('start,end', [(0.5, 1.5), (1.0, 1.05), (2.0, 9.0), (-1.0, 0.3), (4.0, 4.0)])
+def test_window_statistics_match_a_scan(run_df, start, end):
+    index = WindowIndex(run_df)
+    for col in ['AR', 'AS', 'AT']:
+        values = window(run_df, col, start, end)
+        np.testing.assert_allclose(index.mean(col, start, end), values.mean() if len(values) else np.nan)
+        np.testing.assert_allclose(index.total(col, start, end), values.sum())
+        values = window(run_df, col, start, end, include_start=False)
+        np.testing.assert_allclose(index.max(col, start, end), values.max() if len(values) else np.nan)
+
+
+@pytest.mark.parametrize('statistic', ['mean', 'min'])
+@pytest.mark.parametrize('hours', [0.1, 0.5, 2.0])
+@pytest.mark.parametrize('top_k', [1, 3])
+def test_peak_windows_match_a_scan(run_df, statistic, hours, top_k):
+    peaks = SummaryCalculator.peak_windows(run_df, [hours], top_k=top_k, statistic=statistic)
+    for name, col in [("Hydrogen Consumption Rate", 'AR'), ("Carbon Dioxide Consumption Rate", 'AS'),
+                      ("Oxygen Consumption Rate", 'AT')]:
+        starts, values = brute_sliding(run_df, col, hours, statistic)
+        np.testing.assert_allclose(WindowIndex(run_df).sliding(col, hours, statistic)[1], values)
+        # The best windows that do not overlap any better one
+        chosen = []
+        for i in np.argsort(-np.where(np.isnan(values), -np.inf, values), kind='stable'):
+            if len(chosen) < top_k and not np.isnan(values[i]) and all(abs(starts[i] - s) >= hours for s, _ in chosen):
+                chosen.append((starts[i], values[i]))
+        found = [(w["Start"], w["Value"]) for w in peaks[name][f"{hours:g} hrs"]]
+        np.testing.assert_allclose(np.array(found).reshape(-1, 2), np.array(chosen).reshape(-1, 2))
@@ -0,0 +1,14 @@
+import numpy as np
+
+
+class TimestampIndex:
+    def __init__(self, df, key):
+        # Index the DataFrame once on its timestamp column. Only the first row of each timestamp is kept,
+        # which matches the first-match lookups (`.tolist()[0]`, `.values[0]`) used by the spreadsheet formulas.
+        self.frame = df.drop_duplicates(subset=key, keep='first').set_index(key)
+
+    def align(self, timestamps, columns, fill_value=np.nan):
+        # Look up `columns` for every timestamp in a single join. Timestamps without a matching row get
+        # `fill_value`. The result uses a fresh RangeIndex so it lines up row by row with the caller's frame.
+        aligned = self.frame[columns].reindex(timestamps, fill_value=fill_value)
+        return aligned.reset_index(drop=True)
@@ -1,4 +1,7 @@
 # utils.py
+import numpy as np
+import pandas as pd
+
 
 class Utils:
     @staticmethod
@@ -20,3 +23,15 @@ class Utils:
         # This method calculates the mean of a given Pandas series,
         # but returns NaN if the series is empty.
         return series.mean() if not series.empty else float('nan')
+
+    @staticmethod
+    def assemble(chunks, n_rows):
+        # Copy consecutive blocks of rows (labelled with their row positions) into columns preallocated for all
+        # n_rows rows, so that only the result and one block are held in memory at a time
+        columns = None
+        for chunk in chunks:
+            if columns is None:
+                columns = {col: np.empty(n_rows, dtype=chunk[col].dtype) for col in chunk.columns}
+            for col in chunk.columns:
+                columns[col][chunk.index[0]:chunk.index[-1] + 1] = chunk[col].to_numpy()
+        return pd.DataFrame(columns, copy=False)
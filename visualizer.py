@@ -1,39 +1,61 @@
-import seaborn as sns
-import matplotlib.pyplot as plt
+import logging
+import sys
+import time
 import pandas as pd
-import plotly as px
-from dash import Dash, dcc, html
-import plotly.graph_objs as go
+from kernels import Kernels
 
 
 class DataVisualizer:
+    # Traces with more points than this are drawn with WebGL (Scattergl) instead of SVG
+    WEBGL_THRESHOLD = 2000
+    # Run data columns read by the plots
+    REQUIRED_COLUMNS = ['C', 'AR', 'AS', 'AT']
+
     def __init__(self, df):
         # Initialize the DataVisualizer class with the provided DataFrame
         self.df = df
 
-    def plot_interactive_scatter(self):
-        # Extracting x-values (time) and y-values (gas concentrations) for the scatter plot
-        x_values = self.df['C']
+    def rate_points(self):
+        # x-values (time) and y-values (gas consumption rates) of every gas, without the blank points
+        x_values = pd.to_numeric(self.df['C'], errors='coerce')
         y_values = {
             "O2": self.df['AT'],  # Oxygen concentration data
             "CO2": self.df['AS'],  # Carbon Dioxide concentration data
             "H2": self.df['AR']  # Hydrogen concentration data
         }
+        points = {}
+        for gas, values in y_values.items():
+            values = pd.to_numeric(values, errors='coerce')
+            valid = (x_values.notna() & values.notna()).to_numpy()
+            points[gas] = (x_values.to_numpy(dtype=float)[valid], values.to_numpy(dtype=float)[valid])
+        return points
 
-        # Create a DataFrame that consolidates all x and y values for easier plotting
-        plot_df = pd.DataFrame({
-            "X": pd.concat([x_values] * 3, ignore_index=True),
-            "Y": pd.concat([y_values["O2"], y_values["CO2"], y_values["H2"]], ignore_index=True),
-            "Gas": ["O2"] * len(x_values) + ["CO2"] * len(x_values) + ["H2"] * len(self.df['AR'])
-        })
+    @staticmethod
+    def graph_objects():
+        # Plotly is only imported once a figure is built, so runs that do not plot never load it. The first
+        # import is timed in the run log.
+        first_import = 'plotly.graph_objs' not in sys.modules
+        start = time.perf_counter()
+        import plotly.graph_objs as go
+        if first_import:
+            # The figure classes are loaded on first access
+            go.Figure, go.Scatter, go.Scattergl
+            logging.info(f"Imported plotly in {time.perf_counter() - start:.3f} s.")
+        return go
 
+    def figure(self, max_points=5000):
         # Create an interactive scatter plot using Plotly
+        go = self.graph_objects()
         fig = go.Figure()
 
-        # Adding traces for each gas type (O2, CO2, H2) to the figure
-        fig.add_trace(go.Scatter(x=x_values, y=y_values['O2'], mode='markers', name='O2'))
-        fig.add_trace(go.Scatter(x=x_values, y=y_values['CO2'], mode='markers', name='CO2'))
-        fig.add_trace(go.Scatter(x=x_values, y=y_values['H2'], mode='markers', name='H2'))
+        # Adding traces for each gas type (O2, CO2, H2) to the figure. Long series are reduced to max_points
+        # with LTTB so that rendering time and memory stay bounded.
+        for gas, (x, y) in self.rate_points().items():
+            if max_points:
+                kept = Kernels.lttb(x, y, max_points)
+                x, y = x[kept], y[kept]
+            trace = go.Scattergl if len(x) > self.WEBGL_THRESHOLD else go.Scatter
+            fig.add_trace(trace(x=x, y=y, mode='markers', name=gas))
 
         # Update the layout of the plot to add titles and labels
         fig.update_layout(
@@ -46,16 +68,20 @@ class DataVisualizer:
             yaxis_title_font_size=12,
             legend_title_font_size=10
         )
+        return fig
+
+    def plot_interactive_scatter(self, output_path='summary_scatterplot.png', show=True, html_path=None,
+                                 max_points=5000):
+        fig = self.figure(max_points)
 
-        # Save the plot as a PNG image
-        fig.write_image('summary_scatterplot.png')
+        # Save the plot as a PNG image, and as a self-contained HTML page if requested
+        if output_path:
+            fig.write_image(output_path)
+        if html_path:
+            fig.write_html(html_path, include_plotlyjs=True)
 
-        # Display the interactive plot
-        fig.show()
+        # Display the interactive plot (skipped in headless mode; see dashboard.py for a live web view)
+        if show:
+            fig.show()
 
-        # Uncomment below code to run the Dash server for a more interactive web-based visualization
-        # app = Dash()
-        # app.layout = html.Div([
-        #     dcc.Graph(figure=fig)
-        # ])
-        # app.run_server(debug=True, use_reloader=False)
+        return fig
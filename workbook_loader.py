@@ -0,0 +1,89 @@
+import hashlib
+import importlib.util
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+
+class WorkbookLoader:
+    # The only sheets the pipeline reads; every other tab (charts, scratch work) is never parsed
+    SHEETS = ['BlueVis Raw Data', 'Solaris Data', 'AveragedData', 'Run Data', 'Calibration Data']
+
+    def __init__(self, path, cache_dir=None):
+        # Initialize with the workbook path and an optional directory for the parsed-sheet cache
+        self.path = path
+        self.cache_dir = cache_dir
+        self.engine = self.select_engine()
+        self._workbook_hash = None
+
+    @staticmethod
+    def select_engine():
+        # Prefer the Rust-based calamine reader when it is installed; otherwise use openpyxl,
+        # which pandas already opens in read-only (streaming) mode
+        return 'calamine' if importlib.util.find_spec('python_calamine') is not None else 'openpyxl'
+
+    def content_hash(self):
+        # SHA-256 of the workbook bytes, read in 1 MiB blocks
+        digest = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @property
+    def workbook_hash(self):
+        # Content hash of the workbook, computed once
+        if self._workbook_hash is None:
+            self._workbook_hash = self.content_hash()
+        return self._workbook_hash
+
+    def sheet_key(self, sheet_name):
+        # Identifier of one sheet of this exact workbook, used as a stage cache input
+        return f"{self.workbook_hash}:{self.engine}:{sheet_name}"
+
+    def cache_path(self, workbook_hash, sheet_name):
+        # One file per sheet; the engine is part of the key because readers may type cells differently
+        file_name = f"{workbook_hash}-{self.engine}-{sheet_name.replace(' ', '_')}.pkl"
+        return os.path.join(self.cache_dir, file_name)
+
+    @staticmethod
+    def parse(path, engine, sheet_names):
+        # Parse sheets of the workbook; module-level so that worker processes can run it
+        return pd.read_excel(path, sheet_name=sheet_names, engine=engine)
+
+    def load(self, sheet_names=None, workers=1):
+        # Return {sheet name: DataFrame} for the pipeline sheets (or only `sheet_names`), parsing only the ones
+        # not already cached. Raw sheets mix header text, numbers and timestamps in the same columns, so cached
+        # sheets are pickled to round-trip those object columns exactly. With several workers the sheets are
+        # parsed in parallel processes, one sheet each, so parsing takes about as long as the largest sheet.
+        sheet_names = list(self.SHEETS if sheet_names is None else sheet_names)
+        sheets = {}
+        missing = sheet_names
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            workbook_hash = self.workbook_hash
+            for sheet_name in sheet_names:
+                path = self.cache_path(workbook_hash, sheet_name)
+                if os.path.exists(path):
+                    sheets[sheet_name] = pd.read_pickle(path)
+            missing = [sheet_name for sheet_name in sheet_names if sheet_name not in sheets]
+            logging.info(f"Workbook cache: {len(sheets)} sheet(s) reused, {len(missing)} to parse.")
+
+        if missing:
+            logging.info(f"Parsing sheets {missing} with the {self.engine} engine.")
+            if workers > 1 and len(missing) > 1:
+                with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+                    futures = [pool.submit(self.parse, self.path, self.engine, [sheet_name]) for sheet_name in missing]
+                    parsed = {name: sheet for future in futures for name, sheet in future.result().items()}
+            else:
+                parsed = self.parse(self.path, self.engine, missing)
+            for sheet_name, df in parsed.items():
+                if self.cache_dir:
+                    # Write then rename, so that concurrent runs never read a partially written sheet
+                    path = self.cache_path(workbook_hash, sheet_name)
+                    df.to_pickle(f"{path}.{os.getpid()}.tmp")
+                    os.replace(f"{path}.{os.getpid()}.tmp", path)
+                sheets[sheet_name] = df
+
+        return sheets